@@ -1,51 +1,356 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, flash
+from flask import Flask, Response, request, jsonify, render_template, stream_template, stream_with_context, redirect, url_for, flash, g
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
+from flask_login.utils import login_url
 from services.vcf_parser import parse_vcf
-from services.phenotype_engine import determine_phenotype
-from services.risk_engine import PRIMARY_GENE_MAP, evaluate_risk
-from services.gemini_service import generate_explanation
-from services.json_builder import build_response, build_multi_drug_response
+from services.risk_engine import PRIMARY_GENE_MAP, RULES_VERSION
+from services.gemini_service import get_llm_metrics
+from services.analysis import build_gene_calls, rederive_phenotypes, run_analysis, stream_analysis
+from services.rsid_catalog import load_catalog
+from services.scan_export import export_chunks
+from services.json_builder import parse_fields, report_to_document, report_to_json
+from services.domain import gene_calls_to_document, gene_calls_from_document
 from utils.validators import validate_file_extension, validate_file_size
-from models import init_db, get_db, User, Scan
+from utils.assets import asset_url, send_asset
+from utils.cache import get_cache_metrics
+from utils.rate_limit import RateLimiter, AdmissionController, get_rate_limit_backend
+from models import init_db, get_storage_metrics, User, Scan, PatientProfile, Job, IdempotencyRecord, ApiToken
 from config import Config
-from bson import ObjectId
-from datetime import datetime
+from commands import register_commands
+from datetime import datetime, timedelta
+from functools import wraps
+import gzip
+import hashlib
+import json
 import math
+import time
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
 init_db(app)
+load_catalog(app.config.get('RSID_CATALOG_PATH'))
+register_commands(app)
 
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
 app.json.sort_keys = False
+app.jinja_env.globals['asset_url'] = asset_url
 app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024
 
+rate_limiter = RateLimiter(app.config['RATE_LIMIT_PER_MINUTE'], app.config['RATE_LIMIT_BURST'],
+                           get_rate_limit_backend(app.config['RATE_LIMIT_BACKEND']))
+admission = AdmissionController(app.config['ANALYSIS_MAX_IN_FLIGHT'],
+                                app.config['ANALYSIS_INTERACTIVE_RESERVED'],
+                                app.config['ANALYSIS_QUEUE_TIMEOUT_MS'] / 1000)
+
 SUPPORTED_DRUGS = [d.upper() for d in PRIMARY_GENE_MAP.keys()]
+COMPRESSIBLE_MIMETYPES = {'text/html', 'application/json', 'text/plain'}
 ALLOWED_EXTENSIONS = {'vcf'}
 MAX_FILE_SIZE = 5 * 1024 * 1024
 
+# Endpoints reachable with a bearer token, and the scope each one requires.
+# Everything else (pages, token management) still needs a session login.
+API_TOKEN_SCOPES = {
+    'analyze': 'analyze',
+    'analyze_patient_profile': 'analyze',
+    'export_scans': 'read',
+    'suggest_patients': 'read',
+    'metrics': 'read',
+    'rescore_progress': 'read'
+}
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.get_by_id(user_id)
 
-def save_scan(user_id, data):
-    try:
-        patient_id = data.get('patient_id', '')
-        drug = data.get('drug', '')
+def bearer_token():
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer':
+        return None
+    return token.strip() or None
+
+@login_manager.request_loader
+def load_user_from_token(req):
+    token = bearer_token()
+    if not token:
+        return None
+    scope = API_TOKEN_SCOPES.get(req.endpoint)
+    if scope is None:
+        g.api_token_error = (401, "API tokens are not accepted on this endpoint", "TOKEN_NOT_ALLOWED")
+        return None
+    
+    authenticated = ApiToken.authenticate(token, app.config['API_TOKEN_PEPPER'] or app.config['SECRET_KEY'])
+    if authenticated is None:
+        g.api_token_error = (401, "Invalid, expired or revoked API token", "INVALID_TOKEN")
+        return None
+    user, token_id, scopes = authenticated
+    if scope not in scopes:
+        g.api_token_error = (403, f"API token lacks the '{scope}' scope", "INSUFFICIENT_SCOPE")
+        return None
+    g.api_token_id = token_id
+    return user
+
+@login_manager.unauthorized_handler
+def unauthorized():
+    if bearer_token():
+        status, message, error_code = g.get('api_token_error') or (401, "Authentication required", "INVALID_TOKEN")
+        response = jsonify({"error": message, "error_code": error_code})
+        response.status_code = status
+        response.headers['WWW-Authenticate'] = 'Bearer'
+        return response
+    flash(login_manager.login_message, login_manager.login_message_category)
+    return redirect(login_url(login_manager.login_view, request.url))
+
+def rejected_response(interactive, status, message, error_code, retry_after):
+    if interactive:
+        response = Response(render_template("analyze.html", error=message), status=status)
+    else:
+        response = jsonify({"error": message, "error_code": error_code})
+        response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def admission_controlled(interactive=False):
+    """Rate-limit an analysis view per user and per API client, then hold a
+    slot of the global analysis cap until the response (streamed or not) is
+    finished. Requests with a bearer token or an X-Client-Id are bulk traffic;
+    other session requests count as interactive, with a budget of their own."""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if request.method != "POST":
+                return view(*args, **kwargs)
+            
+            token_id = g.get('api_token_id')
+            client_id = request.headers.get('X-Client-Id')
+            is_interactive = interactive or not (token_id or client_id)
+            # A bearer token always draws from its own bucket; X-Client-Id
+            # only adds one, so rotating it cannot escape the token's limit.
+            keys = [f"user:{current_user.id}:{'interactive' if is_interactive else 'bulk'}"]
+            if token_id:
+                keys.append(f"client:{token_id}")
+            if client_id and client_id != token_id:
+                keys.append(f"client:{client_id}")
+            allowed, retry_after = rate_limiter.hit(*keys)
+            if not allowed:
+                return rejected_response(interactive, 429, "Too many analysis requests. Please retry shortly.",
+                                         "RATE_LIMITED", retry_after)
+            
+            if not admission.acquire(is_interactive):
+                return rejected_response(interactive, 503, "The analysis service is busy. Please retry shortly.",
+                                         "SERVER_BUSY", 5)
+            try:
+                response = app.make_response(view(*args, **kwargs))
+            except BaseException:
+                admission.release()
+                raise
+            if response.is_streamed:
+                response.call_on_close(admission.release)
+            else:
+                admission.release()
+            return response
+        return wrapped
+    return decorator
+
+def request_fingerprint(user_id):
+    # What makes two submissions "the same": user, patient, drug list, the
+    # exact bytes of the uploaded file and the response sections asked for.
+    digest = hashlib.sha256()
+    vcf_file = request.files.get("vcf_file")
+    if vcf_file:
+        for chunk in iter(lambda: vcf_file.stream.read(65536), b""):
+            digest.update(chunk)
+        vcf_file.stream.seek(0)
+    parts = [user_id, request.form.get("patient_id", ""), request.form.get("drug_input", ""), digest.hexdigest(),
+             request.args.get("fields", ""), request.args.get("compact", "")]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+def idempotent(view):
+    """Deduplicate retried analysis submissions. The key is the
+    Idempotency-Key header (scoped to the user) or, without one, the request
+    fingerprint. A retry of a completed request replays the stored response; a
+    retry of one still running waits for it. Only non-streamed 2xx responses
+    are stored; anything else releases the key so the next retry recomputes."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if request.method != "POST" or get_stream_format():
+            return view(*args, **kwargs)
         
-        if isinstance(drug, list):
-            drug = ', '.join(drug)
+        user_id = current_user.id
+        fingerprint = request_fingerprint(user_id)
+        header_key = request.headers.get("Idempotency-Key", "").strip()
+        if header_key:
+            key = hashlib.sha256(f"{user_id}\x1f{header_key}".encode("utf-8")).hexdigest()
+        else:
+            key = fingerprint
         
-        scan_id = Scan.create(user_id, patient_id, drug, data)
+        deadline = time.monotonic() + app.config['IDEMPOTENCY_WAIT_S']
+        delay = 0.05
+        while True:
+            try:
+                state, record = IdempotencyRecord.claim(key, user_id, fingerprint, app.config['IDEMPOTENCY_LEASE_S'])
+            except Exception as e:
+                print(f"Idempotency check failed: {e}")
+                return view(*args, **kwargs)
+            
+            if state == "claimed":
+                break
+            if state == "mismatch":
+                return jsonify({
+                    "error": "Idempotency-Key was already used for a different request.",
+                    "error_code": "IDEMPOTENCY_KEY_REUSED"
+                }), 422
+            if state == "completed":
+                stored = record["response"]
+                response = Response(stored["body"], status=stored["status"], mimetype=stored["mimetype"])
+                response.headers["Idempotent-Replayed"] = "true"
+                return response
+            if time.monotonic() >= deadline:
+                response = jsonify({
+                    "error": "An identical request is still being processed. Retry shortly.",
+                    "error_code": "IDEMPOTENCY_IN_PROGRESS"
+                })
+                response.status_code = 409
+                response.headers["Retry-After"] = "2"
+                return response
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+        
+        try:
+            response = app.make_response(view(*args, **kwargs))
+        except BaseException:
+            IdempotencyRecord.release(key)
+            raise
+        
+        try:
+            if 200 <= response.status_code < 300 and not response.is_streamed:
+                IdempotencyRecord.complete(key, response.status_code, response.get_data(as_text=True), response.mimetype)
+            else:
+                IdempotencyRecord.release(key)
+        except Exception as e:
+            print(f"Error storing idempotent response: {e}")
+        return response
+    return wrapped
+
+def save_scan(user_id, report, gene_calls=None):
+    try:
+        if gene_calls is not None:
+            gene_calls = gene_calls_to_document(gene_calls)
+        scan_id = Scan.create(user_id, report.patient_id, report.drugs,
+                              report_to_document(report), gene_calls, RULES_VERSION)
         return scan_id
     except Exception as e:
         print(f"Error saving scan: {e}")
         return None
 
+def save_profile(user_id, patient_id, gene_calls):
+    try:
+        PatientProfile.save(user_id, patient_id, gene_calls_to_document(gene_calls), RULES_VERSION)
+    except Exception as e:
+        print(f"Error saving patient profile: {e}")
+
+def load_profile(user_id, patient_id):
+    profile = PatientProfile.get(user_id, patient_id)
+    if not profile:
+        return None
+    
+    gene_calls = gene_calls_from_document(profile.get('genes'))
+    if profile.get('rules_version') != RULES_VERSION:
+        gene_calls = rederive_phenotypes(gene_calls)
+        save_profile(user_id, patient_id, gene_calls)
+    return gene_calls
+
+def get_stream_format():
+    stream = request.args.get('stream', '').lower()
+    accept = request.headers.get('Accept', '')
+    if stream == 'sse' or 'text/event-stream' in accept:
+        return 'sse'
+    if stream in ('1', 'true', 'ndjson') or 'application/x-ndjson' in accept:
+        return 'ndjson'
+    return None
+
+def format_stream_event(event, data, stream_format):
+    # data is the event payload, already encoded as JSON text.
+    if stream_format == 'sse':
+        return f"event: {event}\ndata: {data}\n\n"
+    return '{"event":' + json.dumps(event) + ',"data":' + data + '}\n'
+
+def get_response_fields():
+    """Sections selected with ?fields=a,b and/or ?compact=1 (None = full
+    response). Raises ValueError on an unknown section."""
+    compact = request.args.get('compact', '').lower() in ('1', 'true', 'yes')
+    return parse_fields(request.args.get('fields'), compact)
+
+def invalid_fields_response(error):
+    return jsonify({
+        "error": str(error),
+        "error_code": "INVALID_FIELDS"
+    }), 400
+
+def wants_explanation(fields):
+    return fields is None or "llm_generated_explanation" in fields
+
+def json_response(data, status=200):
+    return Response(data, status=status, mimetype='application/json')
+
+def save_remaining_events(events, user_id, gene_calls):
+    # The client went away mid-stream: finish the analysis and store it, as a
+    # non-streamed request would have.
+    for event, payload in events:
+        if event == "complete":
+            save_scan(user_id, payload, gene_calls)
+
+def stream_analysis_response(user_id, patient_id, drug_list, gene_calls, parsing_success, stream_format,
+                             fields=None):
+    def generate():
+        events = stream_analysis(patient_id, drug_list, gene_calls, parsing_success, wants_explanation(fields))
+        saved = False
+        try:
+            for event, payload in events:
+                if event == "complete":
+                    scan_id = save_scan(user_id, payload, gene_calls)
+                    saved = True
+                    data = '{"scan_id":' + json.dumps(scan_id) + ',"report":' + report_to_json(payload, fields) + '}'
+                elif event == "report":
+                    data = report_to_json(payload, fields)
+                else:
+                    data = json.dumps(payload, separators=(',', ':'))
+                yield format_stream_event(event, data, stream_format)
+        finally:
+            if not saved:
+                save_remaining_events(events, user_id, gene_calls)
+    
+    mimetype = 'text/event-stream' if stream_format == 'sse' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.after_request
+def compress_response(response):
+    # Streamed responses (analysis events, exports) and files are left alone:
+    # buffering them here would defeat incremental delivery.
+    if (response.is_streamed or response.direct_passthrough
+            or response.status_code < 200 or response.status_code == 204
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or 'Content-Encoding' in response.headers):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    if 'gzip' not in request.headers.get('Accept-Encoding', '').lower():
+        return response
+    
+    data = response.get_data()
+    if len(data) < app.config['COMPRESS_MIN_SIZE']:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=app.config['COMPRESS_LEVEL']))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+@app.route("/assets/<path:filename>")
+def serve_asset(filename):
+    return send_asset(filename)
+
 @app.route("/")
 def landing():
     if current_user.is_authenticated:
@@ -91,6 +396,7 @@ def analyze_page():
 
 @app.route("/do-analysis", methods=["POST"])
 @login_required
+@admission_controlled(interactive=True)
 def do_analysis():
     """Handle web form submission and render results"""
     if "vcf_file" not in request.files:
@@ -136,79 +442,31 @@ def do_analysis():
     except Exception:
         return render_template("analyze.html", error="Failed to parse VCF file. Please ensure the file is a valid VCF format.")
     
-    drug_original_case = {d.upper(): d for d in PRIMARY_GENE_MAP.keys()}
+    gene_calls = build_gene_calls(variants)
+    save_profile(current_user.id, patient_id, gene_calls)
     
-    if len(drug_list) == 1:
-        drug_original = drug_original_case.get(drug_list[0], drug_list[0])
-        primary_gene = PRIMARY_GENE_MAP[drug_original]
-        relevant = [v for v in variants if v.get("gene") == primary_gene]
-        
-        genotype = None
-        phenotype = "Unknown"
-        rsids = []
-        
-        if relevant:
-            genotype = relevant[0].get("genotype")
-            phenotype = determine_phenotype(genotype)
-            rsids = [v.get("rsid") for v in relevant if v.get("rsid")]
-        
-        risk_label, severity, confidence = evaluate_risk(drug_original, phenotype)
-        
-        if not relevant:
-            explanation = "No actionable pharmacogenomic variants detected."
-        else:
-            try:
-                explanation = generate_explanation(primary_gene, phenotype, drug_original)
-            except Exception:
-                explanation = f"Analysis completed. Phenotype {phenotype} detected for {primary_gene} gene. Clinical interpretation should be confirmed with laboratory testing."
-        
-        response = build_response(
-            patient_id, drug_original, primary_gene, phenotype,
-            risk_label, severity, confidence,
-            rsids, explanation, parsing_success
-        )
-    else:
-        drug_results = []
-        for drug_item in drug_list:
-            drug_original = drug_original_case.get(drug_item, drug_item)
-            primary_gene = PRIMARY_GENE_MAP[drug_original]
-            relevant = [v for v in variants if v.get("gene") == primary_gene]
-            
-            genotype = None
-            phenotype = "Unknown"
-            rsids = []
-            
-            if relevant:
-                genotype = relevant[0].get("genotype")
-                phenotype = determine_phenotype(genotype)
-                rsids = [v.get("rsid") for v in relevant if v.get("rsid")]
-            
-            risk_label, severity, confidence = evaluate_risk(drug_original, phenotype)
-            
-            if not relevant:
-                explanation = "No actionable pharmacogenomic variants detected."
-            else:
-                try:
-                    explanation = generate_explanation(primary_gene, phenotype, drug_original)
-                except Exception:
-                    explanation = f"Analysis completed. Phenotype {phenotype} detected for {primary_gene} gene. Clinical interpretation should be confirmed with laboratory testing."
-            
-            drug_results.append({
-                "drug": drug_original,
-                "gene": primary_gene,
-                "phenotype": phenotype,
-                "risk_label": risk_label,
-                "severity": severity,
-                "confidence": confidence,
-                "rsids": rsids,
-                "explanation": explanation,
-                "has_relevant_variant": bool(relevant)
-            })
-        
-        response = build_multi_drug_response(patient_id, drug_results, parsing_success)
+    # Render the deterministic report straight away; each explanation is
+    # appended to the page as a script chunk when its LLM call completes.
+    user_id = current_user.id
+    events = stream_analysis(patient_id, drug_list, gene_calls, parsing_success)
+    _, report = next(events)
+    
+    def explanation_events():
+        saved = False
+        try:
+            for event, payload in events:
+                if event == "complete":
+                    saved = True
+                    yield {"event": event, "scan_id": save_scan(user_id, payload, gene_calls)}
+                else:
+                    yield dict(payload, event=event)
+        finally:
+            if not saved:
+                save_remaining_events(events, user_id, gene_calls)
     
-    save_scan(current_user.id, response)
-    return render_template("results.html", saved_report=response)
+    return Response(stream_template("results.html", saved_report=report_to_document(report),
+                                    stream_events=explanation_events()),
+                    headers={'X-Accel-Buffering': 'no'})
 
 @app.route("/login", methods=["GET", "POST"])
 def login():
@@ -319,6 +577,8 @@ def view_scan(scan_id):
 
 @app.route("/analyze", methods=["POST", "GET"])
 @login_required
+@idempotent
+@admission_controlled()
 def analyze():
     if request.method == "GET":
         return jsonify({
@@ -340,6 +600,11 @@ def analyze():
                 "error_code": "FILE_REQUIRED"
             }), 400
         
+        try:
+            fields = get_response_fields()
+        except ValueError as e:
+            return invalid_fields_response(e)
+        
         file_ext_error = validate_file_extension(vcf_file.filename, ALLOWED_EXTENSIONS)
         if file_ext_error:
             return jsonify({
@@ -403,79 +668,225 @@ def analyze():
                 "error_code": "VCF_PARSE_ERROR"
             }), 400
 
-        drug_original_case = {d.upper(): d for d in PRIMARY_GENE_MAP.keys()}
-        
-        if len(drug_list) == 1:
-            drug_original = drug_original_case.get(drug_list[0], drug_list[0])
-            primary_gene = PRIMARY_GENE_MAP[drug_original]
-            relevant = [v for v in variants if v.get("gene") == primary_gene]
-
-            genotype = None
-            phenotype = "Unknown"
-            rsids = []
-            
-            if relevant:
-                genotype = relevant[0].get("genotype")
-                phenotype = determine_phenotype(genotype)
-                rsids = [v.get("rsid") for v in relevant if v.get("rsid")]
+        gene_calls = build_gene_calls(variants)
+        save_profile(current_user.id, patient_id, gene_calls)
 
-            risk_label, severity, confidence = evaluate_risk(drug_original, phenotype)
+        stream_format = get_stream_format()
+        if stream_format:
+            return stream_analysis_response(current_user.id, patient_id, drug_list,
+                                            gene_calls, parsing_success, stream_format, fields)
 
-            if not relevant:
-                explanation = "No actionable pharmacogenomic variants detected."
-            else:
-                try:
-                    explanation = generate_explanation(primary_gene, phenotype, drug_original)
-                except Exception:
-                    explanation = f"Analysis completed. Phenotype {phenotype} detected for {primary_gene} gene. Clinical interpretation should be confirmed with laboratory testing."
-
-            response = build_response(
-                patient_id, drug_original, primary_gene, phenotype,
-                risk_label, severity, confidence,
-                rsids, explanation, parsing_success
-            )
-        else:
-            drug_results = []
-            for drug_item in drug_list:
-                drug_original = drug_original_case.get(drug_item, drug_item)
-                primary_gene = PRIMARY_GENE_MAP[drug_original]
-                relevant = [v for v in variants if v.get("gene") == primary_gene]
-
-                genotype = None
-                phenotype = "Unknown"
-                rsids = []
-                
-                if relevant:
-                    genotype = relevant[0].get("genotype")
-                    phenotype = determine_phenotype(genotype)
-                    rsids = [v.get("rsid") for v in relevant if v.get("rsid")]
-
-                risk_label, severity, confidence = evaluate_risk(drug_original, phenotype)
-
-                if not relevant:
-                    explanation = "No actionable pharmacogenomic variants detected."
-                else:
-                    try:
-                        explanation = generate_explanation(primary_gene, phenotype, drug_original)
-                    except Exception:
-                        explanation = f"Analysis completed. Phenotype {phenotype} detected for {primary_gene} gene. Clinical interpretation should be confirmed with laboratory testing."
-
-                drug_results.append({
-                    "drug": drug_original,
-                    "gene": primary_gene,
-                    "phenotype": phenotype,
-                    "risk_label": risk_label,
-                    "severity": severity,
-                    "confidence": confidence,
-                    "rsids": rsids,
-                    "explanation": explanation,
-                    "has_relevant_variant": bool(relevant)
-                })
+        report = run_analysis(patient_id, drug_list, gene_calls, parsing_success, wants_explanation(fields))
+
+        save_scan(current_user.id, report, gene_calls)
+        return json_response(report_to_json(report, fields))
+
+
+@app.route("/api/patients/<patient_id>/analyze", methods=["POST"])
+@login_required
+@admission_controlled()
+def analyze_patient_profile(patient_id):
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        payload = {}
+    drugs = payload.get("drugs") or request.form.get("drug_input") or payload.get("drug_input") or ""
+    if isinstance(drugs, str):
+        drugs = drugs.split(",")
+    
+    drug_list = []
+    if isinstance(drugs, list) and all(isinstance(d, str) for d in drugs):
+        drug_list = [d.strip().upper() for d in drugs if d.strip()]
+    if not drug_list:
+        return jsonify({
+            "error": "Drug input is required",
+            "error_code": "DRUG_REQUIRED"
+        }), 400
+    
+    invalid_drugs = [d for d in drug_list if d not in SUPPORTED_DRUGS]
+    if invalid_drugs:
+        return jsonify({
+            "error": f"Unsupported drug: {invalid_drugs[0]}",
+            "error_code": "UNSUPPORTED_DRUG"
+        }), 400
+    
+    try:
+        fields = get_response_fields()
+    except ValueError as e:
+        return invalid_fields_response(e)
+    
+    gene_calls = load_profile(current_user.id, patient_id)
+    if gene_calls is None:
+        return jsonify({
+            "error": "No stored profile for this patient. Upload a VCF through /analyze first.",
+            "error_code": "PROFILE_NOT_FOUND"
+        }), 404
+    
+    report = run_analysis(patient_id, drug_list, gene_calls, True, wants_explanation(fields))
+    save_scan(current_user.id, report, gene_calls)
+    return json_response(report_to_json(report, fields))
+
+
+def parse_date_arg(value, end_of_day=False):
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+@app.route("/api/scans/export")
+@login_required
+def export_scans():
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({
+            "error": "Unsupported export format. Use ndjson or csv.",
+            "error_code": "INVALID_FORMAT"
+        }), 400
+    
+    try:
+        date_from = parse_date_arg(request.args.get('from'))
+        date_to = parse_date_arg(request.args.get('to'), end_of_day=True)
+    except ValueError:
+        return jsonify({
+            "error": "Invalid date. Use ISO format, e.g. 2026-01-31.",
+            "error_code": "INVALID_DATE"
+        }), 400
+    
+    compress = request.args.get('gzip', '').lower() in ('1', 'true')
+    batch_size = min(max(request.args.get('batch_size', 500, type=int), 1), 5000)
+    
+    cursor = Scan.iter_export(
+        current_user.id,
+        request.args.get('patient_id', ''),
+        request.args.get('risk', ''),
+        request.args.get('drug', ''),
+        date_from, date_to, batch_size
+    )
+    
+    filename = f"scans.{export_format}" + (".gz" if compress else "")
+    if compress:
+        mimetype = 'application/gzip'
+    elif export_format == 'csv':
+        mimetype = 'text/csv'
+    else:
+        mimetype = 'application/x-ndjson'
+    
+    return Response(stream_with_context(export_chunks(cursor, export_format, compress)),
+                    mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
 
-            response = build_multi_drug_response(patient_id, drug_results, parsing_success)
 
-        save_scan(current_user.id, response)
-        return jsonify(response)
+@app.route("/api/patients/suggest")
+@login_required
+def suggest_patients():
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    return jsonify({
+        "patients": Scan.suggest_patients(current_user.id, request.args.get('q', ''), limit)
+    })
+
+
+@app.route("/api/metrics")
+@login_required
+def metrics():
+    return jsonify({
+        "storage": get_storage_metrics(),
+        "llm": get_llm_metrics(),
+        "cache": get_cache_metrics(),
+        "admission": admission.snapshot()
+    })
+
+
+@app.route("/api/jobs/rescore")
+@login_required
+def rescore_progress():
+    if not current_user.is_admin:
+        return jsonify({
+            "error": "Rescore job progress is only available to admins",
+            "error_code": "ADMIN_REQUIRED"
+        }), 403
+    
+    rules_version = request.args.get('rules_version', RULES_VERSION, type=int)
+    job = Job.get(Job.rescore_id(rules_version))
+    if not job:
+        return jsonify({
+            "rules_version": rules_version,
+            "status": "not_started",
+            "outdated_scans": Scan.count_outdated(rules_version)
+        })
+    
+    total = job.get('total') or 0
+    return jsonify({
+        "job_id": job['_id'],
+        "rules_version": job['rules_version'],
+        "status": job.get('status'),
+        "scanned": job.get('scanned', 0),
+        "updated": job.get('updated', 0),
+        "skipped": job.get('skipped', 0),
+        "total": total,
+        "percent": round(100.0 * job.get('scanned', 0) / total, 1) if total else 100.0,
+        "error": job.get('error'),
+        "started_at": job.get('created_at'),
+        "updated_at": job.get('updated_at'),
+        "finished_at": job.get('finished_at')
+    })
+
+
+@app.route("/api/tokens", methods=["GET", "POST"])
+@login_required
+def api_tokens():
+    if request.method == "GET":
+        return jsonify({"tokens": [
+            {
+                "token_id": t['_id'],
+                "name": t.get('name', ''),
+                "scopes": t.get('scopes', []),
+                "created_at": t.get('created_at'),
+                "expires_at": t.get('expires_at'),
+                "revoked_at": t.get('revoked_at')
+            }
+            for t in ApiToken.list_for_user(current_user.id)
+        ]})
+    
+    data = request.get_json(silent=True) or {}
+    scopes = data.get('scopes') or ['analyze', 'read']
+    if not isinstance(scopes, list) or any(scope not in ApiToken.SCOPES for scope in scopes):
+        return jsonify({
+            "error": f"Scopes must be a list drawn from: {', '.join(ApiToken.SCOPES)}",
+            "error_code": "INVALID_SCOPE"
+        }), 400
+    
+    expires_at = None
+    expires_in_days = data.get('expires_in_days')
+    if expires_in_days is not None:
+        try:
+            expires_in_days = int(expires_in_days)
+        except (TypeError, ValueError):
+            expires_in_days = 0
+        if isinstance(data.get('expires_in_days'), bool) or not 0 < expires_in_days <= ApiToken.MAX_EXPIRES_IN_DAYS:
+            return jsonify({
+                "error": f"expires_in_days must be an integer from 1 to {ApiToken.MAX_EXPIRES_IN_DAYS}",
+                "error_code": "INVALID_INPUT"
+            }), 400
+        expires_at = datetime.utcnow() + timedelta(days=expires_in_days)
+    
+    token, token_id = ApiToken.create(current_user.id, str(data.get('name', ''))[:100], scopes,
+                                      app.config['API_TOKEN_PEPPER'] or app.config['SECRET_KEY'], expires_at)
+    return jsonify({
+        "token": token,
+        "token_id": token_id,
+        "scopes": scopes,
+        "expires_at": expires_at
+    }), 201
+
+
+@app.route("/api/tokens/<token_id>", methods=["DELETE"])
+@login_required
+def revoke_api_token(token_id):
+    if not ApiToken.revoke(current_user.id, token_id):
+        return jsonify({"error": "Token not found", "error_code": "TOKEN_NOT_FOUND"}), 404
+    return jsonify({"token_id": token_id, "revoked": True})
 
 
 @app.errorhandler(413)
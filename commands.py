@@ -0,0 +1,148 @@
+import sys
+import click
+from datetime import datetime, timedelta
+from models import ensure_indexes, ApiToken, ExplanationStore, Scan, ScanArchive, User
+from services.rsid_catalog import build_catalog
+from services.rescore import run_rescore
+from services.batch import completed_sources, expand_inputs, run_batch
+from services.analysis import DRUG_ORIGINAL_CASE
+
+
+def register_commands(app):
+    @app.cli.command("build-rsid-catalog")
+    @click.argument("source", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--output", "-o", default=None,
+                  help="Catalog file to write (defaults to RSID_CATALOG_PATH).")
+    def build_rsid_catalog_command(source, output):
+        """Build the memory-mapped rsID -> gene catalog from a TSV/CSV export."""
+        output = output or app.config.get("RSID_CATALOG_PATH")
+        count, genes = build_catalog(source, output)
+        click.echo(f"Wrote {count} rsIDs across {genes} genes to {output}")
+
+    @app.cli.command("create-indexes")
+    def create_indexes_command():
+        """Create the MongoDB indexes the application relies on."""
+        ensure_indexes(app.config.get("IDEMPOTENCY_TTL_S") or 86400)
+        click.echo("Indexes created")
+
+    @app.cli.command("migrate-explanations")
+    @click.option("--batch-size", default=500, show_default=True)
+    def migrate_explanations_command(batch_size):
+        """Move inline LLM explanations of existing scans to the content-addressed store."""
+        converted = ExplanationStore.migrate_scans(batch_size)
+        click.echo(f"Converted {converted} scans")
+
+    @app.cli.command("backfill-search-fields")
+    @click.option("--batch-size", default=1000, show_default=True)
+    def backfill_search_fields_command(batch_size):
+        """Add normalized patient_id/drug search fields to scans saved before they existed."""
+        updated = Scan.backfill_search_fields(batch_size)
+        click.echo(f"Updated {updated} scans")
+
+    @app.cli.command("rescore-scans")
+    @click.option("--batch-size", default=500, show_default=True)
+    @click.option("--workers", default=0, show_default=True,
+                  help="Processes used to recompute reports (0 = in this process).")
+    @click.option("--max-rate", default=2000, show_default=True,
+                  help="Maximum scans per second written to the primary (0 = unthrottled).")
+    @click.option("--restart", is_flag=True, help="Ignore the saved checkpoint and start over.")
+    def rescore_scans_command(batch_size, workers, max_rate, restart):
+        """Re-score stored scans saved under an older RULES_VERSION, resuming from the last checkpoint."""
+        def progress(job):
+            click.echo(f"{job['scanned']}/{job.get('total', '?')} scanned, {job['updated']} updated")
+
+        job = run_rescore(batch_size, workers, max_rate or None, restart, progress=progress)
+        click.echo(f"Rescore {job['_id']} {job['status']}: {job['scanned']} scanned, "
+                   f"{job['updated']} updated, {job['skipped']} skipped")
+
+    @app.cli.command("archive-scans")
+    @click.option("--older-than-days", default=None, type=int,
+                  help="Archive scans created more than this many days ago (default: SCAN_ARCHIVE_AFTER_DAYS).")
+    @click.option("--batch-size", default=500, show_default=True)
+    @click.option("--max-rate", default=2000, show_default=True,
+                  help="Maximum scans per second moved (0 = unthrottled).")
+    def archive_scans_command(older_than_days, batch_size, max_rate):
+        """Move old scan reports to the compressed archive, leaving summary stubs in scans."""
+        days = older_than_days if older_than_days is not None else app.config.get("SCAN_ARCHIVE_AFTER_DAYS")
+        cutoff = datetime.utcnow() - timedelta(days=days)
+
+        def progress(archived):
+            click.echo(f"{archived} scans archived")
+
+        archived = ScanArchive.archive_before(cutoff, batch_size, max_rate or None, progress)
+        click.echo(f"Archived {archived} scans created before {cutoff:%Y-%m-%d}")
+
+    @app.cli.command("create-api-token")
+    @click.argument("email")
+    @click.option("--name", default="", help="Label shown when listing tokens.")
+    @click.option("--scope", "scopes", multiple=True, type=click.Choice(ApiToken.SCOPES),
+                  help="Repeat for several scopes (default: all).")
+    @click.option("--expires-in-days", default=0, show_default=True,
+                  type=click.IntRange(0, ApiToken.MAX_EXPIRES_IN_DAYS), help="0 = never expires.")
+    def create_api_token_command(email, name, scopes, expires_in_days):
+        """Issue a bearer API token for a user. The token is printed once and not stored."""
+        user = User.get_by_email(email)
+        if not user:
+            raise click.ClickException(f"No user with email {email}")
+        expires_at = datetime.utcnow() + timedelta(days=expires_in_days) if expires_in_days else None
+        token, token_id = ApiToken.create(user.id, name, scopes or ApiToken.SCOPES,
+                                          app.config.get("API_TOKEN_PEPPER") or app.config["SECRET_KEY"],
+                                          expires_at)
+        click.echo(f"Token {token_id} for {email}: {token}")
+
+    @app.cli.command("set-user-role")
+    @click.argument("email")
+    @click.argument("role", type=click.Choice(User.ROLES))
+    def set_user_role_command(email, role):
+        """Change a user's role; only admins can see maintenance job progress."""
+        user = User.get_by_email(email)
+        if not user:
+            raise click.ClickException(f"No user with email {email}")
+        User.set_role(user.id, role)
+        click.echo(f"{email} is now {role}")
+
+    @app.cli.command("analyze-batch")
+    @click.argument("inputs", nargs=-1, required=True)
+    @click.option("--drugs", required=True, help="Comma-separated drugs analyzed for every file.")
+    @click.option("--output", "-o", default="-", show_default=True,
+                  help="NDJSON file with one result or error per input ('-' for stdout).")
+    @click.option("--workers", default=0, show_default=True,
+                  help="Processes used to analyze files (0 = in this process).")
+    @click.option("--save-as", "email", default=None, help="Also store the reports as scans of this user.")
+    @click.option("--explain", is_flag=True, help="Ask the LLM for explanations (default: deterministic text).")
+    @click.option("--batch-size", default=200, show_default=True, help="Results per bulk insert and output flush.")
+    @click.option("--resume", is_flag=True, help="Append to --output, skipping files it already lists as done.")
+    def analyze_batch_command(inputs, drugs, output, workers, email, explain, batch_size, resume):
+        """Analyze VCF files, directories or globs (.vcf, .vcf.gz, .vcf.bz2) without the HTTP stack."""
+        drug_list = [d.strip().upper() for d in drugs.split(",") if d.strip()]
+        unsupported = [d for d in drug_list if d not in DRUG_ORIGINAL_CASE]
+        if not drug_list or unsupported:
+            raise click.BadParameter(f"Unsupported drug: {unsupported[0] if unsupported else drugs}",
+                                     param_hint="--drugs")
+        if resume and output == "-":
+            raise click.BadParameter("--resume needs an --output file", param_hint="--resume")
+
+        user_id = None
+        if email:
+            user = User.get_by_email(email)
+            if not user:
+                raise click.ClickException(f"No user with email {email}")
+            user_id = user.id
+
+        paths = expand_inputs(inputs)
+        skip = completed_sources(output) if resume else set()
+        click.echo(f"{len(paths)} files, {len(skip & set(paths))} already done", err=True)
+
+        def progress(analyzed, failed, total):
+            click.echo(f"{analyzed + failed}/{total} files, {failed} failed", err=True)
+
+        stream = sys.stdout if output == "-" else open(output, "a" if resume else "w", encoding="utf-8")
+        try:
+            analyzed, failed = run_batch(paths, drug_list, stream, workers, user_id, explain, batch_size,
+                                         skip, app.config.get("RSID_CATALOG_PATH"), progress)
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        click.echo(f"Analyzed {analyzed} files, {failed} failed", err=True)
+        if failed:
+            sys.exit(1)
@@ -3,8 +3,69 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def _int_env(name, default=None):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+# Point at a local fake server for testing, e.g. http://127.0.0.1:8089
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
+GEMINI_TIMEOUT_MS = _int_env("GEMINI_TIMEOUT_MS", 8000)
+
+# Circuit breaker / load shedding for the LLM stage
+LLM_LATENCY_BUDGET_MS = _int_env("LLM_LATENCY_BUDGET_MS", 4000)
+LLM_BREAKER_WINDOW = _int_env("LLM_BREAKER_WINDOW", 20)
+LLM_BREAKER_COOLDOWN_S = _int_env("LLM_BREAKER_COOLDOWN_S", 30)
+LLM_MAX_IN_FLIGHT = _int_env("LLM_MAX_IN_FLIGHT", 16)
 
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY", "dev-secret-change-in-production")
+    # mongo | sqlite (one embedded database file at SQLITE_PATH, no server needed)
+    STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "mongo")
+    SQLITE_PATH = os.environ.get("SQLITE_PATH", "data/pharmaguard.sqlite3")
+    # Scans older than this many days are moved to the compressed archive by
+    # `flask archive-scans`; only their summary fields stay in scans.
+    SCAN_ARCHIVE_AFTER_DAYS = _int_env("SCAN_ARCHIVE_AFTER_DAYS", 365)
     MONGO_URI = os.environ.get("MONGO_URI")
+    MONGO_MAX_POOL_SIZE = _int_env("MONGO_MAX_POOL_SIZE", 50)
+    MONGO_MIN_POOL_SIZE = _int_env("MONGO_MIN_POOL_SIZE", 0)
+    MONGO_MAX_IDLE_TIME_MS = _int_env("MONGO_MAX_IDLE_TIME_MS", 60000)
+    MONGO_CONNECT_TIMEOUT_MS = _int_env("MONGO_CONNECT_TIMEOUT_MS", 5000)
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = _int_env("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)
+    MONGO_SOCKET_TIMEOUT_MS = _int_env("MONGO_SOCKET_TIMEOUT_MS", 20000)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = _int_env("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000)
+    MONGO_COMPRESSORS = os.environ.get("MONGO_COMPRESSORS", "")
+    # History, dashboard and analytics reads; writes always go to the primary.
+    MONGO_READ_PREFERENCE = os.environ.get("MONGO_READ_PREFERENCE", "secondaryPreferred")
+    # Shared cache: memory (per process), sqlite (shared by the workers on one
+    # host) or redis (any Redis-protocol server, e.g. scripts/fake_kv.py).
+    CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+    CACHE_MAX_ENTRIES = _int_env("CACHE_MAX_ENTRIES", _int_env("EXPLANATION_CACHE_SIZE", 4096))
+    CACHE_PATH = os.environ.get("CACHE_PATH", "data/cache.sqlite3")
+    CACHE_URL = os.environ.get("CACHE_URL", "redis://127.0.0.1:6379/0")
+    EXPLANATION_CACHE_TTL_S = _int_env("EXPLANATION_CACHE_TTL_S", 86400)
+    RSID_CATALOG_PATH = os.environ.get("RSID_CATALOG_PATH", "data/rsid_catalog.bin")
+    # Analysis admission control: per-user and per-API-client token buckets
+    # plus a global cap on concurrent analyses, part of it held back for the
+    # interactive web form.
+    RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+    RATE_LIMIT_PER_MINUTE = _int_env("RATE_LIMIT_PER_MINUTE", 30)
+    RATE_LIMIT_BURST = _int_env("RATE_LIMIT_BURST", 10)
+    ANALYSIS_MAX_IN_FLIGHT = _int_env("ANALYSIS_MAX_IN_FLIGHT", 8)
+    ANALYSIS_INTERACTIVE_RESERVED = _int_env("ANALYSIS_INTERACTIVE_RESERVED", 2)
+    ANALYSIS_QUEUE_TIMEOUT_MS = _int_env("ANALYSIS_QUEUE_TIMEOUT_MS", 2000)
+    # gzip for dynamic HTML/JSON; static assets are precompressed at build time.
+    COMPRESS_MIN_SIZE = _int_env("COMPRESS_MIN_SIZE", 500)
+    COMPRESS_LEVEL = _int_env("COMPRESS_LEVEL", 6)
+    # Idempotent /analyze submissions: how long results are replayable, how
+    # long a claim lasts before a retry may take it over, and how long a retry
+    # waits for the original request to finish.
+    IDEMPOTENCY_TTL_S = _int_env("IDEMPOTENCY_TTL_S", 86400)
+    IDEMPOTENCY_LEASE_S = _int_env("IDEMPOTENCY_LEASE_S", 120)
+    IDEMPOTENCY_WAIT_S = _int_env("IDEMPOTENCY_WAIT_S", 30)
+    # Bearer API tokens: digests are keyed with the pepper (SECRET_KEY unless
+    # set); validated tokens are cached for API_TOKEN_CACHE_TTL_S seconds.
+    API_TOKEN_PEPPER = os.environ.get("API_TOKEN_PEPPER")
+    API_TOKEN_CACHE_TTL_S = _int_env("API_TOKEN_CACHE_TTL_S", 60)
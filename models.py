@@ -1,25 +1,35 @@
-from pymongo import MongoClient
+import hashlib
+import hmac
+import json
+import secrets
+import time
+import zlib
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, timedelta
 from config import Config
+from storage import configure_storage, get_storage
+from utils.cache import configure_cache, get_cache
 
-client = None
-db = None
+# Explanation texts are immutable (content-addressed), so any backend may hold them.
+_explanation_cache = get_cache('explanations', Config.EXPLANATION_CACHE_TTL_S)
+# Short-lived: revocation reaches processes that do not share the cache backend within this TTL.
+_token_cache = get_cache('api_tokens', Config.API_TOKEN_CACHE_TTL_S)
 
 def init_db(app):
-    global client, db
-    mongo_uri = app.config.get('MONGO_URI')
-    if mongo_uri:
-        client = MongoClient(mongo_uri)
-        db = client.get_database()
-    return db
+    # MongoDB by default; STORAGE_BACKEND=sqlite keeps everything in one
+    # embedded database file instead (see storage/).
+    configure_storage(app.config)
+    configure_cache(app.config)
+    _explanation_cache.ttl = app.config.get('EXPLANATION_CACHE_TTL_S')
+    _token_cache.ttl = app.config.get('API_TOKEN_CACHE_TTL_S')
 
-def get_db():
-    return db
+def get_storage_metrics():
+    return get_storage().metrics()
 
 class User(UserMixin):
+    ROLES = ('clinician', 'researcher', 'admin')
+    
     def __init__(self, user_data):
         self.id = str(user_data.get('_id'))
         self.email = user_data.get('email')
@@ -41,49 +51,157 @@ class User(UserMixin):
             'created_at': datetime.utcnow(),
             'last_login': None
         }
-        result = db.users.insert_one(user_doc)
-        user_doc['_id'] = result.inserted_id
+        user_doc['_id'] = get_storage().insert_user(user_doc)
         return User(user_doc)
     
     @staticmethod
     def get_by_email(email):
-        user_data = db.users.find_one({'email': email})
+        user_data = get_storage().find_user_by_email(email)
         if user_data:
             return User(user_data)
         return None
     
     @staticmethod
     def get_by_id(user_id):
-        try:
-            user_data = db.users.find_one({'_id': ObjectId(user_id)})
-            if user_data:
-                return User(user_data)
-        except:
-            pass
+        user_data = get_storage().find_user_by_id(user_id)
+        if user_data:
+            return User(user_data)
         return None
     
     @staticmethod
     def update_last_login(user_id):
-        try:
-            db.users.update_one(
-                {'_id': ObjectId(user_id)},
-                {'$set': {'last_login': datetime.utcnow()}}
-            )
-        except:
-            pass
+        get_storage().update_user(user_id, {'last_login': datetime.utcnow()})
+    
+    @staticmethod
+    def set_role(user_id, role):
+        get_storage().update_user(user_id, {'role': role})
+    
+    @property
+    def is_admin(self):
+        return self.role == 'admin'
     
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
 
+class ApiToken:
+    """Per-user bearer tokens for machine clients: ``pgt_<token_id>_<secret>``.
+    Only an HMAC-SHA256 digest of the secret is stored, so verification is
+    a fast keyed hash rather than the password KDF. The token record and its
+    owner's profile are cached for a short TTL, so an authenticated API call
+    normally costs no database round trip at all."""
+    
+    PREFIX = 'pgt_'
+    SCOPES = ('analyze', 'read')
+    MAX_EXPIRES_IN_DAYS = 3650
+    
+    @staticmethod
+    def digest(secret, pepper):
+        return hmac.new(pepper.encode('utf-8'), secret.encode('utf-8'), hashlib.sha256).hexdigest()
+    
+    @staticmethod
+    def create(user_id, name, scopes, pepper, expires_at=None):
+        token_id = secrets.token_hex(8)
+        secret = secrets.token_urlsafe(32)
+        get_storage().insert_api_token({
+            '_id': token_id,
+            'user_id': user_id,
+            'name': name,
+            'scopes': list(scopes),
+            'digest': ApiToken.digest(secret, pepper),
+            'created_at': datetime.utcnow(),
+            'expires_at': expires_at,
+            'revoked_at': None
+        })
+        return f"{ApiToken.PREFIX}{token_id}_{secret}", token_id
+    
+    @staticmethod
+    def list_for_user(user_id):
+        return get_storage().list_api_tokens(user_id)
+    
+    @staticmethod
+    def revoke(user_id, token_id):
+        revoked = get_storage().revoke_api_token(token_id, user_id, datetime.utcnow())
+        _token_cache.delete(token_id)
+        return revoked
+    
+    @staticmethod
+    def _load(token_id):
+        cached = _token_cache.get(token_id)
+        if cached is not None:
+            return cached
+        
+        record = get_storage().find_api_token(token_id)
+        entry = {}
+        if record and not record.get('revoked_at'):
+            user = User.get_by_id(record['user_id'])
+            if user:
+                entry = {
+                    'digest': record['digest'],
+                    'scopes': record.get('scopes', []),
+                    'expires_at': record['expires_at'].timestamp() if record.get('expires_at') else None,
+                    'user': {'_id': user.id, 'email': user.email, 'name': user.name, 'role': user.role}
+                }
+        # Unknown and revoked tokens are cached too (as {}), so a client
+        # retrying a bad token cannot turn every request into a lookup.
+        _token_cache.set(token_id, entry)
+        return entry
+    
+    @staticmethod
+    def authenticate(raw_token, pepper):
+        """Returns (user, token_id, scopes) for a valid token, else None."""
+        if not raw_token or not raw_token.startswith(ApiToken.PREFIX):
+            return None
+        token_id, _, secret = raw_token[len(ApiToken.PREFIX):].partition('_')
+        if not token_id or not secret:
+            return None
+        
+        entry = ApiToken._load(token_id)
+        if not entry:
+            return None
+        if entry.get('expires_at') and entry['expires_at'] < datetime.utcnow().timestamp():
+            return None
+        if not hmac.compare_digest(entry['digest'], ApiToken.digest(secret, pepper)):
+            return None
+        return User(entry['user']), token_id, entry['scopes']
+
+
 class Scan:
     @staticmethod
-    def create(user_id, patient_id, drug, result_json):
+    def document(user_id, patient_id, drug, result_json, gene_calls=None, rules_version=None):
+        scan_doc = {
+            'user_id': user_id,
+            'patient_id': patient_id,
+            'drugs': drug,
+            **Scan.search_fields(patient_id, drug),
+            'result_json': ExplanationStore.dehydrate(result_json),
+            'explanation_refs': True,
+            **Scan.summary_fields(result_json),
+            'rules_version': rules_version,
+            'created_at': datetime.utcnow()
+        }
+        if gene_calls is not None:
+            # Kept so the scan can be re-scored when the rules change.
+            scan_doc['gene_calls'] = gene_calls
+        return scan_doc
+    
+    @staticmethod
+    def create(user_id, patient_id, drug, result_json, gene_calls=None, rules_version=None):
+        return get_storage().insert_scan(
+            Scan.document(user_id, patient_id, drug, result_json, gene_calls, rules_version))
+    
+    @staticmethod
+    def create_many(scan_docs):
+        """Insert documents built by Scan.document in one batch; returns their ids."""
+        if not scan_docs:
+            return []
+        return get_storage().insert_scans(scan_docs)
+    
+    @staticmethod
+    def summary_fields(result_json):
         risk_label = 'Unknown'
         severity = 'none'
         confidence_score = 0.0
-        primary_gene = ''
-        phenotype = 'Unknown'
         
         if 'risk_assessment' in result_json:
             risk_label = result_json.get('risk_assessment', {}).get('risk_label', 'Unknown')
@@ -97,57 +215,108 @@ class Scan:
                 confidence_score = results[0].get('confidence', 0.0)
         
         pgx_profile = result_json.get('pharmacogenomic_profile', {})
-        primary_gene = pgx_profile.get('primary_gene', '')
-        phenotype = pgx_profile.get('phenotype', 'Unknown')
-        
-        scan_doc = {
-            'user_id': user_id,
-            'patient_id': patient_id,
-            'drugs': drug,
-            'result_json': result_json,
+        return {
             'overall_risk_label': risk_label,
             'severity': severity,
             'confidence_score': confidence_score,
-            'primary_gene': primary_gene,
-            'phenotype': phenotype,
-            'created_at': datetime.utcnow()
+            'primary_gene': pgx_profile.get('primary_gene', ''),
+            'phenotype': pgx_profile.get('phenotype', 'Unknown')
         }
-        result = db.scans.insert_one(scan_doc)
-        return str(result.inserted_id)
+    
+    @staticmethod
+    def search_fields(patient_id, drug):
+        # Lower-cased copies let filters run as anchored, case-sensitive
+        # prefix regexes, which MongoDB can answer from an index.
+        return {
+            'patient_id_lc': (patient_id or '').strip().lower(),
+            'drugs_lc': [d.strip().lower() for d in (drug or '').split(',') if d.strip()]
+        }
+    
+    @staticmethod
+    def _filters(patient_filter='', risk_filter='', drug_filter=''):
+        # Filters match prefixes of the lower-cased search fields.
+        return ((patient_filter or '').strip().lower(), risk_filter or '',
+                (drug_filter or '').strip().lower())
     
     @staticmethod
     def get_by_user(user_id, limit=None, skip=0):
-        query = {'user_id': user_id}
-        cursor = db.scans.find(query).sort('created_at', -1)
-        if limit:
-            cursor = cursor.skip(skip).limit(limit)
-        return list(cursor)
+        return get_storage().find_scans(user_id, limit=limit, skip=skip)
     
     @staticmethod
     def get_by_id(scan_id, user_id):
-        try:
-            return db.scans.find_one({'_id': ObjectId(scan_id), 'user_id': user_id})
-        except:
-            return None
+        scan = get_storage().find_scan(scan_id, user_id)
+        if scan and scan.get('archived'):
+            ScanArchive.restore([scan])
+        if scan and scan.get('explanation_refs'):
+            scan['result_json'] = ExplanationStore.rehydrate(scan.get('result_json', {}))
+        return scan
     
     @staticmethod
     def count_by_user(user_id):
-        return db.scans.count_documents({'user_id': user_id})
+        return get_storage().count_scans(user_id)
     
     @staticmethod
     def search(user_id, patient_filter='', risk_filter='', drug_filter=''):
-        query = {'user_id': user_id}
-        
-        if patient_filter:
-            query['patient_id'] = {'$regex': patient_filter, '$options': 'i'}
-        
-        if risk_filter:
-            query['overall_risk_label'] = risk_filter
-        
-        if drug_filter:
-            query['drugs'] = {'$regex': drug_filter, '$options': 'i'}
-        
-        return list(db.scans.find(query).sort('created_at', -1))
+        return get_storage().find_scans(user_id, *Scan._filters(patient_filter, risk_filter, drug_filter))
+    
+    @staticmethod
+    def suggest_patients(user_id, prefix, limit=10):
+        return get_storage().suggest_patients(user_id, (prefix or '').strip().lower(), limit)
+    
+    @staticmethod
+    def backfill_search_fields(batch_size=1000):
+        updated = 0
+        storage = get_storage()
+        while True:
+            batch = storage.find_scans_missing_search_fields(batch_size)
+            if not batch:
+                return updated
+            storage.update_scans([
+                (scan['_id'], Scan.search_fields(scan.get('patient_id'), scan.get('drugs')))
+                for scan in batch
+            ])
+            updated += len(batch)
+    
+    @staticmethod
+    def find_outdated(rules_version, after_id=None, limit=500):
+        return ScanArchive.restore(get_storage().find_outdated_scans(rules_version, after_id, limit))
+    
+    @staticmethod
+    def count_outdated(rules_version):
+        return get_storage().count_outdated_scans(rules_version)
+    
+    @staticmethod
+    def apply_rescored(results, rules_version, restored_gene_calls=None):
+        """Write (scan_id, report) pairs from the re-scoring job in one bulk
+        write. Scans that could not be re-scored (report None) are only stamped
+        so later runs skip them. ``restored_gene_calls`` maps archived scan ids
+        to the gene calls read back from the archive; they return to the hot
+        document with the new report. Returns the number of reports rewritten."""
+        now = datetime.utcnow()
+        updates = []
+        updated = 0
+        for scan_id, report in results:
+            update = {'rules_version': rules_version, 'rescored_at': now}
+            if report is not None:
+                update.update(Scan.summary_fields(report))
+                update['result_json'] = ExplanationStore.dehydrate(report)
+                update['explanation_refs'] = True
+                # Back in the hot collection until the next archive run.
+                update['archived'] = False
+                if restored_gene_calls and restored_gene_calls.get(scan_id) is not None:
+                    update['gene_calls'] = restored_gene_calls[scan_id]
+                updated += 1
+            updates.append((scan_id, update))
+        get_storage().update_outdated_scans(updates, rules_version)
+        return updated
+    
+    @staticmethod
+    def iter_export(user_id, patient_filter='', risk_filter='', drug_filter='',
+                    date_from=None, date_to=None, batch_size=500):
+        # Returns a lazy iterator over the cursor: callers stream it, never list() it.
+        cursor = get_storage().iter_export_scans(user_id, *Scan._filters(patient_filter, risk_filter, drug_filter),
+                                                 date_from=date_from, date_to=date_to, batch_size=batch_size)
+        return ExplanationStore.rehydrate_stream(ScanArchive.restore_stream(cursor, batch_size), batch_size)
     
     @staticmethod
     def get_risk_label(result_json):
@@ -158,3 +327,345 @@ class Scan:
             if results:
                 return results[0].get('risk_label', 'Unknown')
         return 'Unknown'
+
+
+class ScanArchive:
+    """Cold storage for old reports. Archiving moves a scan's report and gene
+    calls into the scan_archive collection as one zlib-compressed JSON blob
+    and leaves the summary fields in scans, so history, search and the
+    dashboard never touch the archive while the hot collection stays small.
+    Reading an archived scan restores its body on demand."""
+    
+    BODY_FIELDS = ('result_json', 'gene_calls', 'explanation_refs')
+    
+    @staticmethod
+    def pack(scan):
+        body = {field: scan.get(field) for field in ScanArchive.BODY_FIELDS}
+        return zlib.compress(json.dumps(body, separators=(',', ':')).encode('utf-8'), 6)
+    
+    @staticmethod
+    def unpack(data):
+        return json.loads(zlib.decompress(data).decode('utf-8'))
+    
+    @staticmethod
+    def restore(scans):
+        archived = [scan for scan in scans if scan.get('archived')]
+        if archived:
+            blobs = get_storage().find_archived(str(scan['_id']) for scan in archived)
+            for scan in archived:
+                data = blobs.get(str(scan['_id']))
+                if data is not None:
+                    scan.update(ScanArchive.unpack(data))
+        return scans
+    
+    @staticmethod
+    def restore_stream(scans, batch_size=500):
+        batch = []
+        for scan in scans:
+            batch.append(scan)
+            if len(batch) >= batch_size:
+                yield from ScanArchive.restore(batch)
+                batch = []
+        yield from ScanArchive.restore(batch)
+    
+    @staticmethod
+    def _entries(storage, batch):
+        # A scan archived before keeps whatever its new body lacks from the
+        # existing blob; an empty body (None) never replaces a stored one.
+        previous = storage.find_archived(str(scan['_id']) for scan in batch)
+        entries = []
+        for scan in batch:
+            old = previous.get(str(scan['_id']))
+            if old is not None:
+                for field, value in ScanArchive.unpack(old).items():
+                    if scan.get(field) is None:
+                        scan[field] = value
+            has_body = any(scan.get(field) is not None for field in ScanArchive.BODY_FIELDS)
+            entries.append((scan['_id'], scan['user_id'], ScanArchive.pack(scan) if has_body else None))
+        return entries
+    
+    @staticmethod
+    def archive_before(cutoff, batch_size=500, max_rate=None, progress=None):
+        """Archive every scan created before ``cutoff``; returns the count.
+        Archived scans leave the query, so an interrupted run simply resumes."""
+        storage = get_storage()
+        started = time.monotonic()
+        archived = 0
+        while True:
+            batch = storage.find_scans_to_archive(cutoff, batch_size)
+            if not batch:
+                return archived
+            storage.archive_scans(ScanArchive._entries(storage, batch), datetime.utcnow())
+            archived += len(batch)
+            if progress:
+                progress(archived)
+            if max_rate:
+                ahead = archived / max_rate - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+
+class ExplanationStore:
+    """Content-addressed LLM explanation text. Explanations depend only on
+    (gene, phenotype, drug), so scans store a sha256 reference instead of
+    repeating the paragraph in every document. LLM output is not
+    deterministic, so the first explanation generated for a triple is also
+    filed under that triple and reused instead of asking the LLM again; its
+    text, and therefore its reference, is then the same in every scan."""
+    
+    @staticmethod
+    def key(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def drug_key(gene, phenotype, drug):
+        return hashlib.sha256(f"drug\x1f{gene}\x1f{phenotype}\x1f{drug}".encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def for_drug(gene, phenotype, drug):
+        key = ExplanationStore.drug_key(gene, phenotype, drug)
+        return ExplanationStore.get_many([key]).get(key)
+    
+    @staticmethod
+    def remember(gene, phenotype, drug, text):
+        ExplanationStore.put_many({ExplanationStore.drug_key(gene, phenotype, drug): text})
+    
+    @staticmethod
+    def _sections(result_json):
+        sections = [result_json]
+        sections.extend(result_json.get('drug_analyses', []))
+        return sections
+    
+    @staticmethod
+    def dehydrate(result_json):
+        # Copies only the dicts along the explanation paths; the caller's
+        # report is left untouched.
+        result = dict(result_json)
+        if 'drug_analyses' in result:
+            result['drug_analyses'] = [dict(a) for a in result['drug_analyses']]
+        
+        texts = {}
+        for section in ExplanationStore._sections(result):
+            explanation = section.get('llm_generated_explanation')
+            if isinstance(explanation, dict) and 'summary' in explanation:
+                text = explanation['summary'] or ''
+                ref = ExplanationStore.key(text)
+                texts[ref] = text
+                section['llm_generated_explanation'] = {'summary_ref': ref}
+        
+        ExplanationStore.put_many(texts)
+        return result
+    
+    @staticmethod
+    def put_many(texts):
+        cached = _explanation_cache.get_many(texts)
+        missing = {ref: text for ref, text in texts.items() if ref not in cached}
+        if missing:
+            get_storage().insert_explanations(missing, datetime.utcnow())
+            _explanation_cache.set_many(missing)
+    
+    @staticmethod
+    def get_many(refs):
+        refs = set(refs)
+        found = _explanation_cache.get_many(refs)
+        missing = [ref for ref in refs if ref not in found]
+        if missing:
+            fetched = get_storage().find_explanations(missing)
+            _explanation_cache.set_many(fetched)
+            found.update(fetched)
+        return found
+    
+    @staticmethod
+    def _refs(result_json):
+        for section in ExplanationStore._sections(result_json):
+            explanation = section.get('llm_generated_explanation')
+            if isinstance(explanation, dict) and 'summary_ref' in explanation:
+                yield section, explanation['summary_ref']
+    
+    @staticmethod
+    def rehydrate(result_json, texts=None):
+        refs = list(ExplanationStore._refs(result_json))
+        if texts is None:
+            texts = ExplanationStore.get_many(ref for _, ref in refs)
+        for section, ref in refs:
+            section['llm_generated_explanation'] = {'summary': texts.get(ref, '')}
+        return result_json
+    
+    @staticmethod
+    def rehydrate_stream(scans, batch_size=500):
+        # Resolve references a batch at a time so a long export costs one
+        # explanations lookup per batch rather than one per scan.
+        batch = []
+        for scan in scans:
+            batch.append(scan)
+            if len(batch) >= batch_size:
+                yield from ExplanationStore._rehydrate_batch(batch)
+                batch = []
+        yield from ExplanationStore._rehydrate_batch(batch)
+    
+    @staticmethod
+    def _rehydrate_batch(scans):
+        refs = [ref for scan in scans if scan.get('explanation_refs')
+                for _, ref in ExplanationStore._refs(scan.get('result_json', {}))]
+        texts = ExplanationStore.get_many(refs) if refs else {}
+        for scan in scans:
+            if scan.get('explanation_refs'):
+                ExplanationStore.rehydrate(scan.get('result_json', {}), texts)
+        return scans
+    
+    @staticmethod
+    def migrate_scans(batch_size=500):
+        """Move inline explanations of existing scans into the store.
+        Returns the number of scans converted."""
+        converted = 0
+        storage = get_storage()
+        while True:
+            batch = storage.find_scans_with_inline_explanations(batch_size)
+            if not batch:
+                return converted
+            storage.update_scans([
+                (scan['_id'], {
+                    'result_json': ExplanationStore.dehydrate(scan.get('result_json') or {}),
+                    'explanation_refs': True
+                })
+                for scan in batch
+            ])
+            converted += len(batch)
+
+
+class PatientProfile:
+    @staticmethod
+    def save(user_id, patient_id, gene_calls, rules_version):
+        get_storage().save_profile(user_id, patient_id, gene_calls, rules_version, datetime.utcnow())
+    
+    @staticmethod
+    def save_many(profiles, rules_version):
+        """Upsert (user_id, patient_id, gene_calls) triples in one write; the last entry per patient wins."""
+        latest = {(user_id, patient_id): gene_calls for user_id, patient_id, gene_calls in profiles}
+        get_storage().save_profiles([(user_id, patient_id, gene_calls) for (user_id, patient_id), gene_calls in latest.items()],
+                                    rules_version, datetime.utcnow())
+    
+    @staticmethod
+    def get(user_id, patient_id):
+        return get_storage().find_profile(user_id, patient_id)
+
+
+class Job:
+    """Progress and checkpoint documents for long-running maintenance jobs."""
+    
+    @staticmethod
+    def rescore_id(rules_version):
+        return f"rescore-v{rules_version}"
+    
+    @staticmethod
+    def start_rescore(rules_version, restart=False):
+        job_id = Job.rescore_id(rules_version)
+        job = get_storage().find_job(job_id)
+        if job and not restart and job.get('status') == 'completed':
+            return job
+        
+        now = datetime.utcnow()
+        if job is None or restart:
+            job = {
+                '_id': job_id,
+                'type': 'rescore',
+                'rules_version': rules_version,
+                'last_id': None,
+                'scanned': 0,
+                'updated': 0,
+                'skipped': 0,
+                'created_at': now
+            }
+        job.update({
+            'status': 'running',
+            'error': None,
+            'total': job.get('scanned', 0) + Scan.count_outdated(rules_version),
+            'updated_at': now,
+            'finished_at': None
+        })
+        get_storage().save_job(job)
+        return job
+    
+    @staticmethod
+    def checkpoint(job_id, last_id, scanned=0, updated=0, skipped=0):
+        return get_storage().update_job(
+            job_id,
+            {'last_id': last_id, 'updated_at': datetime.utcnow()},
+            {'scanned': scanned, 'updated': updated, 'skipped': skipped}
+        )
+    
+    @staticmethod
+    def fail(job_id, error):
+        get_storage().update_job(job_id, {
+            'status': 'failed', 'error': error, 'updated_at': datetime.utcnow()
+        })
+    
+    @staticmethod
+    def finish(job_id):
+        now = datetime.utcnow()
+        return get_storage().update_job(job_id, {'status': 'completed', 'updated_at': now, 'finished_at': now})
+    
+    @staticmethod
+    def get(job_id):
+        return get_storage().find_job(job_id)
+
+
+class IdempotencyRecord:
+    """One document per analysis submission key. The first request claims the
+    key with a lease; retries either replay the stored response or wait for
+    the claim holder to finish. Records expire after IDEMPOTENCY_TTL_S."""
+    
+    CLAIM_ATTEMPTS = 3
+    
+    @staticmethod
+    def claim(key, user_id, fingerprint, lease_s):
+        """Returns (state, record) where state is 'claimed', 'completed',
+        'in_progress' or 'mismatch' (the key was used for a different request)."""
+        storage = get_storage()
+        for _ in range(IdempotencyRecord.CLAIM_ATTEMPTS):
+            now = datetime.utcnow()
+            locked_until = now + timedelta(seconds=lease_s)
+            if storage.insert_idempotency({
+                '_id': key,
+                'user_id': user_id,
+                'fingerprint': fingerprint,
+                'status': 'in_progress',
+                'created_at': now,
+                'locked_until': locked_until
+            }):
+                return 'claimed', None
+            
+            record = storage.find_idempotency(key)
+            # None: expired or released between the insert and the read.
+            if record is not None:
+                break
+        else:
+            # Keeps flipping under us; the caller waits and asks again.
+            return 'in_progress', None
+        
+        if record.get('fingerprint') != fingerprint:
+            return 'mismatch', record
+        if record.get('status') == 'completed':
+            return 'completed', record
+        if record.get('locked_until') and record['locked_until'] < now:
+            # The original request died without finishing; take over its lease.
+            if storage.renew_idempotency_lease(key, record['locked_until'], locked_until):
+                return 'claimed', None
+        return 'in_progress', record
+    
+    @staticmethod
+    def complete(key, status_code, body, mimetype):
+        get_storage().complete_idempotency(key, {'status': status_code, 'body': body, 'mimetype': mimetype},
+                                           datetime.utcnow())
+    
+    @staticmethod
+    def release(key):
+        get_storage().release_idempotency(key)
+    
+    @staticmethod
+    def get(key):
+        return get_storage().find_idempotency(key)
+
+
+def ensure_indexes(idempotency_ttl_s=86400):
+    get_storage().ensure_indexes(idempotency_ttl_s)
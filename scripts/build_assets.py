@@ -0,0 +1,100 @@
+"""Build fingerprinted, precompressed static assets.
+
+Writes each stylesheet, script and image under ``static/`` unchanged as
+``static/dist/<name>.<hash>.<ext>`` next to ``.gz`` (and, when the ``brotli``
+package is installed, ``.br``) variants, and records the mapping in
+``static/dist/manifest.json``. Sources are not minified: a regex rewrite is
+not safe for strings, ``url()`` values and template literals, and gzip/brotli
+already remove most of what it would. Templates resolve names through
+``asset_url``, which falls back to the unhashed files when no manifest exists.
+Run it as part of every deploy:
+
+    python scripts/build_assets.py
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC = os.path.join(ROOT, "static")
+DIST = os.path.join(STATIC, "dist")
+
+ASSETS = ["css/style.css", "css/index.css", "js/index.js", "image.png"]
+# Images and other already-compressed formats gain nothing from gzip/brotli.
+COMPRESSIBLE = (".css", ".js", ".svg", ".json", ".txt")
+MIN_COMPRESS_SIZE = 256
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def build_asset(name):
+    src = os.path.join(STATIC, name)
+    base, ext = os.path.splitext(name)
+    with open(src, "rb") as f:
+        data = f.read()
+
+    hashed = f"{base}.{fingerprint(data)}{ext}"
+    out = os.path.join(DIST, hashed)
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "wb") as f:
+        f.write(data)
+
+    sizes = {"raw": len(data)}
+    if ext in COMPRESSIBLE and len(data) >= MIN_COMPRESS_SIZE:
+        with open(out + ".gz", "wb") as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        sizes["gzip"] = os.path.getsize(out + ".gz")
+        if brotli is not None:
+            with open(out + ".br", "wb") as f:
+                f.write(brotli.compress(data, quality=11))
+            sizes["br"] = os.path.getsize(out + ".br")
+    return hashed, sizes
+
+
+def build(assets=ASSETS, clean=True):
+    if clean and os.path.isdir(DIST):
+        shutil.rmtree(DIST)
+    os.makedirs(DIST, exist_ok=True)
+
+    manifest = {}
+    report = {}
+    for name in assets:
+        hashed, sizes = build_asset(name)
+        manifest[name] = hashed
+        report[name] = sizes
+
+    tmp_path = os.path.join(DIST, "manifest.json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(DIST, "manifest.json"))
+    return manifest, report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keep", action="store_true", help="keep earlier builds in static/dist")
+    args = parser.parse_args(argv)
+
+    manifest, report = build(clean=not args.keep)
+    for name, sizes in report.items():
+        compressed = ", ".join(f"{k} {v:,}" for k, v in sizes.items() if k in ("gzip", "br"))
+        print(f"{name:<18} -> {manifest[name]:<32} {sizes['raw']:>9,} B"
+              + (f"  ({compressed})" if compressed else ""))
+    if brotli is None:
+        print("brotli not installed; wrote gzip variants only", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
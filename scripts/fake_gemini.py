@@ -0,0 +1,93 @@
+"""Local stand-in for the Gemini generateContent API.
+
+Point the app at it with GEMINI_BASE_URL=http://127.0.0.1:<port> and any
+GEMINI_API_KEY. Latency and failure rate are configurable so the circuit
+breaker, load shedding and fallback paths can be exercised locally:
+
+    python scripts/fake_gemini.py --port 8089 --latency-ms 300 --jitter-ms 200 --failure-rate 0.1
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        server = self.server
+
+        delay = server.latency_ms + random.uniform(0, server.jitter_ms)
+        time.sleep(delay / 1000.0)
+
+        with server.lock:
+            server.requests += 1
+
+        if random.random() < server.failure_rate:
+            body = json.dumps({"error": {"code": 503, "message": "fake upstream failure", "status": "UNAVAILABLE"}})
+            self._send(503, body)
+            return
+
+        body = json.dumps({
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": server.reply}]},
+                "finishReason": "STOP"
+            }],
+            "modelVersion": "fake-gemini"
+        })
+        self._send(200, body)
+
+    def do_GET(self):
+        with self.server.lock:
+            body = json.dumps({"requests": self.server.requests})
+        self._send(200, body)
+
+    def _send(self, status, body):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host="127.0.0.1", port=0, latency_ms=0, jitter_ms=0, failure_rate=0.0,
+                reply="Fake clinical explanation generated for load testing."):
+    server = ThreadingHTTPServer((host, port), FakeGeminiHandler)
+    server.daemon_threads = True
+    server.latency_ms = latency_ms
+    server.jitter_ms = jitter_ms
+    server.failure_rate = failure_rate
+    server.reply = reply
+    server.requests = 0
+    server.lock = threading.Lock()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency_ms, args.jitter_ms, args.failure_rate)
+    print(f"Fake Gemini listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Local stand-in for the Redis-protocol cache server.
+
+Speaks the subset of RESP2 used by ``utils.cache.RedisBackend`` (PING, AUTH,
+SELECT, GET, MGET, SET with EX/PX, DEL, SCAN ... MATCH ... COUNT, DBSIZE,
+FLUSHDB), so the shared-cache path can be exercised without a Redis server:
+
+    python scripts/fake_kv.py --port 6390
+    CACHE_BACKEND=redis CACHE_URL=redis://127.0.0.1:6390/0 python app.py
+"""
+import argparse
+import fnmatch
+import socketserver
+import threading
+import time
+
+
+class Store:
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def _live(self, key, now):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del self.data[key]
+            return None
+        return value
+
+
+def _encode(reply):
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, Exception):
+        return b"-ERR %s\r\n" % str(reply).encode()
+    if isinstance(reply, str):
+        return b"+%s\r\n" % reply.encode()
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, bytes):
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+    return b"*%d\r\n" % len(reply) + b"".join(_encode(r) for r in reply)
+
+
+def execute(store, args):
+    command = args[0].upper().decode()
+    now = time.time()
+    with store.lock:
+        if command == "PING":
+            return "PONG"
+        if command in ("AUTH", "SELECT"):
+            return "OK"
+        if command == "GET":
+            return store._live(args[1], now)
+        if command == "MGET":
+            return [store._live(key, now) for key in args[1:]]
+        if command == "SET":
+            expires_at = None
+            options = [a.upper() for a in args[3:]]
+            if b"PX" in options:
+                expires_at = now + int(args[3 + options.index(b"PX") + 1]) / 1000.0
+            elif b"EX" in options:
+                expires_at = now + int(args[3 + options.index(b"EX") + 1])
+            store.data[args[1]] = (args[2], expires_at)
+            return "OK"
+        if command == "DEL":
+            return sum(1 for key in args[1:] if store.data.pop(key, None) is not None)
+        if command == "SCAN":
+            # Single pass: every matching key is returned with cursor 0.
+            pattern = b"*"
+            if b"MATCH" in [a.upper() for a in args[2:]]:
+                pattern = args[[a.upper() for a in args].index(b"MATCH") + 1]
+            keys = [k for k in list(store.data)
+                    if store._live(k, now) is not None
+                    and fnmatch.fnmatchcase(k.decode("utf-8", "replace"), pattern.decode("utf-8", "replace"))]
+            return [b"0", keys]
+        if command == "DBSIZE":
+            return len(store.data)
+        if command == "FLUSHDB":
+            store.data.clear()
+            return "OK"
+    return RuntimeError(f"unknown command '{command}'")
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if not line.startswith(b"*"):
+                continue
+            args = []
+            for _ in range(int(line[1:-2])):
+                length = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(length + 2)[:-2])
+            try:
+                reply = execute(self.server.store, args)
+            except Exception as e:
+                reply = e
+            self.wfile.write(_encode(reply))
+
+
+class FakeKVServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, RespHandler)
+        self.store = Store()
+
+
+def make_server(host="127.0.0.1", port=6390):
+    return FakeKVServer((host, port))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Redis-protocol cache stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port)
+    print(f"fake kv listening on redis://{args.host}:{server.server_address[1]}/0", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
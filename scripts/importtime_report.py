@@ -0,0 +1,108 @@
+"""Cold-start import profile for the serverless entry point.
+
+Runs ``python -X importtime -c "import app"`` in a fresh interpreter, prints a
+summary of the slowest imports and fails (exit 1) when the import exceeds the
+time budget or pulls in a module that must stay lazy. Use it in CI so cold
+start cannot silently regress:
+
+    python scripts/importtime_report.py --budget-ms 400
+    python scripts/importtime_report.py --json > importtime.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy dependencies that must only be imported on first use.
+DEFAULT_FORBIDDEN = ["google.genai", "pymongo"]
+
+
+def profile_import(module, python=sys.executable):
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        self_us, cumulative_us, raw_name = int(parts[0]), int(parts[1]), parts[2]
+        depth = (len(raw_name) - len(raw_name.lstrip())) // 2
+        entries.append({
+            "module": raw_name.strip(),
+            "depth": depth,
+            "self_ms": self_us / 1000.0,
+            "cumulative_ms": cumulative_us / 1000.0
+        })
+    return entries
+
+
+def summarize(entries, module, forbidden, top=15):
+    total = next((e["cumulative_ms"] for e in reversed(entries) if e["module"] == module and e["depth"] == 0), 0.0)
+    direct = [e for e in entries if e["depth"] == 1]
+    forbidden_hits = sorted({
+        e["module"] for e in entries
+        if any(e["module"] == f or e["module"].startswith(f + ".") for f in forbidden)
+    })
+    return {
+        "module": module,
+        "total_ms": round(total, 1),
+        "modules_imported": len(entries),
+        "slowest_direct_imports": [
+            {"module": e["module"], "cumulative_ms": round(e["cumulative_ms"], 1)}
+            for e in sorted(direct, key=lambda e: e["cumulative_ms"], reverse=True)[:top]
+        ],
+        "slowest_self": [
+            {"module": e["module"], "self_ms": round(e["self_ms"], 1)}
+            for e in sorted(entries, key=lambda e: e["self_ms"], reverse=True)[:top]
+        ],
+        "forbidden_imports": forbidden_hits
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("IMPORT_BUDGET_MS", 400)))
+    parser.add_argument("--runs", type=int, default=3, help="Best of N runs, to smooth out noise")
+    parser.add_argument("--forbid", action="append", default=None,
+                        help="Module that must not be imported at startup (repeatable)")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    forbidden = args.forbid if args.forbid is not None else DEFAULT_FORBIDDEN
+    runs = [summarize(profile_import(args.module), args.module, forbidden, args.top)
+            for _ in range(max(1, args.runs))]
+    report = min(runs, key=lambda r: r["total_ms"])
+    report["budget_ms"] = args.budget_ms
+    report["runs_ms"] = [r["total_ms"] for r in runs]
+    report["ok"] = report["total_ms"] <= args.budget_ms and not report["forbidden_imports"]
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"import {args.module}: {report['total_ms']} ms (budget {args.budget_ms} ms, "
+              f"runs {report['runs_ms']}), {report['modules_imported']} modules")
+        print("\nSlowest direct imports (cumulative):")
+        for e in report["slowest_direct_imports"]:
+            print(f"  {e['cumulative_ms']:8.1f} ms  {e['module']}")
+        print("\nSlowest modules (self):")
+        for e in report["slowest_self"]:
+            print(f"  {e['self_ms']:8.1f} ms  {e['module']}")
+        if report["forbidden_imports"]:
+            print("\nImported at startup but must stay lazy: " + ", ".join(report["forbidden_imports"]))
+        print("\nOK" if report["ok"] else "\nFAILED")
+
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
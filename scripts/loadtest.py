@@ -0,0 +1,449 @@
+"""Self-contained load test for /analyze, /history and /dashboard.
+
+Starts the app in a subprocess against the embedded SQLite backend (a fresh
+file under --sqlite-path) or a MongoDB server, plus a fake Gemini server with configurable
+latency and failure rate, then drives a mixed closed-loop workload from
+concurrent virtual users and prints a JSON report with throughput, latency
+percentiles per endpoint and server memory:
+
+    python scripts/loadtest.py --users 20 --duration 30 \\
+        --mix analyze=4,history=3,dashboard=3 --vcf-lines 50,2000,20000 \\
+        --max-drugs 3 --history-depth 50 --llm-latency-ms 400 --llm-failure-rate 0.05
+
+Use --storage mongo to test against MongoDB at --mongo-uri (the database is
+dropped first) and --server gunicorn --workers N to measure a pre-forking
+deployment (requires gunicorn).
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MONGO_URI = "mongodb://127.0.0.1:27017/pharmaguard_loadtest"
+SQLITE_PATH = os.path.join(ROOT, "data", "loadtest.sqlite3")
+
+DRUGS = ["WARFARIN", "CODEINE", "CLOPIDOGREL", "SIMVASTATIN", "AZATHIOPRINE", "FLUOROURACIL"]
+
+# GRCh38 positions of the supported variants, written with '.' IDs half the
+# time so both the rsID and the coordinate lookup paths are exercised.
+KNOWN_RECORDS = [
+    ("22", 42128945, "rs3892097", "C", "T"),
+    ("10", 94781859, "rs4244285", "G", "A"),
+    ("10", 94981296, "rs1057910", "A", "C"),
+    ("12", 21178615, "rs4149056", "T", "C"),
+    ("6", 18130687, "rs1142345", "T", "C"),
+    ("1", 97450058, "rs3918290", "C", "T"),
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_vcf(lines, rng):
+    out = ["##fileformat=VCFv4.2", "##reference=GRCh38",
+           "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tSAMPLE"]
+    for chrom, pos, rsid, ref, alt in KNOWN_RECORDS:
+        gt = rng.choice(["0/0", "0/1", "1/1"])
+        out.append(f"{chrom}\t{pos}\t{rsid if rng.random() < 0.5 else '.'}\t{ref}\t{alt}\t50\tPASS\t.\tGT:DP\t{gt}:30")
+    for _ in range(max(0, lines - len(KNOWN_RECORDS))):
+        chrom = str(rng.randint(1, 22))
+        out.append(f"{chrom}\t{rng.randint(1, 200_000_000)}\t.\tA\tG\t50\tPASS\t.\tGT:DP\t0/1:30")
+    return ("\n".join(out) + "\n").encode()
+
+
+def multipart(fields, file_field, filename, content):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+                 f'Content-Type: text/plain\r\n\r\n'.encode() + content + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class Session:
+    """One virtual user: a keep-alive connection plus the session cookie."""
+
+    def __init__(self, port):
+        self.port = port
+        self.conn = None
+        self.cookies = {}
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=120)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+        for header, value in response.getheaders():
+            if header.lower() == "set-cookie":
+                name, _, rest = value.partition("=")
+                self.cookies[name.strip()] = rest.split(";", 1)[0]
+        if response.getheader("Connection", "").lower() == "close":
+            self.conn.close()
+            self.conn = None
+        return response.status, data
+
+    def form(self, path, fields):
+        body = "&".join(f"{k}={v}" for k, v in fields.items())
+        return self.request("POST", path, body, {"Content-Type": "application/x-www-form-urlencoded"})
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(p / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+def read_rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def child_pids(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+class MemorySampler(threading.Thread):
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = {}
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            for pid in [self.pid] + child_pids(self.pid):
+                rss = read_rss_kb(pid)
+                if rss:
+                    self.samples.setdefault(pid, []).append(rss)
+            self.stop_event.wait(self.interval)
+
+    def report(self):
+        workers = {}
+        for pid, values in self.samples.items():
+            workers[str(pid)] = {"rss_mb_peak": round(max(values) / 1024, 1),
+                                 "rss_mb_last": round(values[-1] / 1024, 1)}
+        return workers
+
+
+def wait_for_port(port, proc, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("server process exited during startup")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"port {port} did not open within {timeout}s")
+
+
+def serve(args):
+    """Run the app in this process (used as the server subprocess)."""
+    sys.path.insert(0, ROOT)
+    if args.storage == "sqlite":
+        os.environ["STORAGE_BACKEND"] = "sqlite"
+        os.environ["SQLITE_PATH"] = args.sqlite_path
+    else:
+        os.environ["MONGO_URI"] = args.mongo_uri
+
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    from app import app
+
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"
+    server = make_server("127.0.0.1", args.port, app, threaded=True)
+    server.serve_forever()
+
+
+def start_server(args, port, llm_port):
+    env = dict(os.environ)
+    env.update({
+        "GEMINI_API_KEY": "loadtest",
+        "GEMINI_BASE_URL": f"http://127.0.0.1:{llm_port}",
+        "SECRET_KEY": "loadtest",
+        # The app's production limits would turn most of the load into 429s
+        # and 503s; the load test measures the service, not the throttle.
+        "RATE_LIMIT_PER_MINUTE": str(args.rate_limit_per_minute),
+        "RATE_LIMIT_BURST": str(args.rate_limit_burst),
+        "ANALYSIS_MAX_IN_FLIGHT": str(args.max_in_flight),
+    })
+    if args.server == "gunicorn":
+        if args.storage == "sqlite":
+            env.update({"STORAGE_BACKEND": "sqlite", "SQLITE_PATH": args.sqlite_path})
+        else:
+            env["MONGO_URI"] = args.mongo_uri
+        cmd = [sys.executable, "-m", "gunicorn", "-w", str(args.workers), "--threads", str(args.threads),
+               "-b", f"127.0.0.1:{port}", "wsgi:app"]
+    else:
+        cmd = [sys.executable, os.path.abspath(__file__), "serve", "--port", str(port),
+               "--mongo-uri", args.mongo_uri, "--storage", args.storage, "--sqlite-path", args.sqlite_path]
+    return subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                            stderr=None if args.verbose else subprocess.DEVNULL)
+
+
+def drop_database(args):
+    if args.storage == "sqlite":
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.sqlite_path + suffix):
+                os.remove(args.sqlite_path + suffix)
+        return
+    uri = args.mongo_uri
+    from pymongo import MongoClient
+    client = MongoClient(uri)
+    client.drop_database(client.get_database().name)
+    client.close()
+
+
+class Workload:
+    def __init__(self, args, port):
+        self.args = args
+        self.port = port
+        self.mix = []
+        for item in args.mix.split(","):
+            name, _, weight = item.partition("=")
+            self.mix.append((name.strip(), float(weight or 1)))
+        self.vcf_sizes = [int(v) for v in args.vcf_lines.split(",")]
+        self.results = []
+        self.lock = threading.Lock()
+
+    def record(self, op, started, status):
+        with self.lock:
+            self.results.append((op, (time.perf_counter() - started) * 1000.0, status))
+
+    def analyze(self, session, rng, index):
+        drugs = rng.sample(DRUGS, rng.randint(1, min(self.args.max_drugs, len(DRUGS))))
+        body, content_type = multipart(
+            {"drug_input": ",".join(drugs), "patient_id": f"LT-{index:04d}-{rng.randint(0, 999):03d}"},
+            "vcf_file", "sample.vcf", make_vcf(rng.choice(self.vcf_sizes), rng))
+        return session.request("POST", "/analyze", body, {"Content-Type": content_type})
+
+    def setup_user(self, index):
+        rng = random.Random(self.args.seed + index)
+        session = Session(self.port)
+        email = f"loadtest{index}@example.org"
+        status, _ = session.form("/register", {"name": f"LoadTest{index}", "email": email,
+                                               "password": "loadtest", "confirm_password": "loadtest"})
+        if status != 302:
+            session.form("/login", {"email": email, "password": "loadtest"})
+        for _ in range(self.args.history_depth):
+            self.analyze(session, rng, index)
+        return session
+
+    def run_user(self, index, session, deadline):
+        rng = random.Random(self.args.seed * 7919 + index)
+        names = [name for name, _ in self.mix]
+        weights = [weight for _, weight in self.mix]
+        while time.time() < deadline:
+            op = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                if op == "analyze":
+                    status, _ = self.analyze(session, rng, index)
+                elif op == "history":
+                    status, _ = session.request("GET", "/history")
+                elif op == "dashboard":
+                    status, _ = session.request("GET", "/dashboard")
+                else:
+                    status, _ = session.request("GET", op)
+            except Exception:
+                status = 0
+            self.record(op, started, status)
+
+    def summary(self, elapsed):
+        ops = {}
+        for op, ms, status in self.results:
+            entry = ops.setdefault(op, {"latencies": [], "errors": 0, "statuses": {}})
+            entry["latencies"].append(ms)
+            if status == 0 or status >= 400:
+                entry["errors"] += 1
+                entry["statuses"][str(status)] = entry["statuses"].get(str(status), 0) + 1
+        report = {}
+        for op, entry in sorted(ops.items()):
+            lat = entry["latencies"]
+            report[op] = {
+                "requests": len(lat),
+                "errors": entry["errors"],
+                "errors_by_status": dict(sorted(entry["statuses"].items())),
+                "throughput_rps": round(len(lat) / elapsed, 2),
+                "p50_ms": round(percentile(lat, 50), 1),
+                "p90_ms": round(percentile(lat, 90), 1),
+                "p99_ms": round(percentile(lat, 99), 1),
+                "max_ms": round(max(lat), 1),
+            }
+        return report
+
+
+def fetch_json(port, path, session=None):
+    try:
+        if session:
+            status, data = session.request("GET", path)
+        else:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", path)
+            response = conn.getresponse()
+            status, data = response.status, response.read()
+        return json.loads(data) if status == 200 else None
+    except Exception:
+        return None
+
+
+def run(args):
+    drop_database(args)
+    port = args.port or free_port()
+    llm_port = free_port()
+
+    llm = subprocess.Popen([sys.executable, os.path.join(ROOT, "scripts", "fake_gemini.py"),
+                            "--port", str(llm_port), "--latency-ms", str(args.llm_latency_ms),
+                            "--jitter-ms", str(args.llm_jitter_ms), "--failure-rate", str(args.llm_failure_rate)],
+                           stdout=subprocess.DEVNULL)
+    server = start_server(args, port, llm_port)
+    try:
+        wait_for_port(llm_port, llm)
+        wait_for_port(port, server)
+        sampler = MemorySampler(server.pid)
+        sampler.start()
+
+        workload = Workload(args, port)
+        setup_started = time.perf_counter()
+        sessions = [None] * args.users
+        def setup(i):
+            sessions[i] = workload.setup_user(i)
+        threads = [threading.Thread(target=setup, args=(i,)) for i in range(args.users)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        setup_seconds = time.perf_counter() - setup_started
+
+        started = time.perf_counter()
+        deadline = time.time() + args.duration
+        threads = [threading.Thread(target=workload.run_user, args=(i, sessions[i], deadline))
+                   for i in range(args.users)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        sampler.stop_event.set()
+
+        total = len(workload.results)
+        report = {
+            "config": {
+                "users": args.users, "duration_s": args.duration, "mix": args.mix,
+                "vcf_lines": workload.vcf_sizes, "max_drugs": args.max_drugs,
+                "history_depth": args.history_depth, "server": args.server,
+                "workers": args.workers if args.server == "gunicorn" else 1,
+                "storage": args.storage,
+                "mongo": args.mongo_uri if args.storage == "mongo" else None,
+                "llm_latency_ms": args.llm_latency_ms, "llm_jitter_ms": args.llm_jitter_ms,
+                "llm_failure_rate": args.llm_failure_rate,
+                "rate_limit_per_minute": args.rate_limit_per_minute,
+                "rate_limit_burst": args.rate_limit_burst, "max_in_flight": args.max_in_flight,
+            },
+            "setup_s": round(setup_seconds, 2),
+            "elapsed_s": round(elapsed, 2),
+            "total_requests": total,
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "endpoints": workload.summary(elapsed),
+            "server_memory": sampler.report(),
+            "fake_llm": fetch_json(llm_port, "/"),
+            "app_metrics": fetch_json(port, "/api/metrics", sessions[0]) if sessions else None,
+        }
+    finally:
+        server.terminate()
+        llm.terminate()
+        server.wait(timeout=10)
+        llm.wait(timeout=10)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command")
+
+    serve_parser = sub.add_parser("serve", help=argparse.SUPPRESS)
+    serve_parser.add_argument("--port", type=int, required=True)
+    serve_parser.add_argument("--mongo-uri", default=MONGO_URI)
+    serve_parser.add_argument("--storage", default="sqlite")
+    serve_parser.add_argument("--sqlite-path", default=SQLITE_PATH)
+
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of measured load")
+    parser.add_argument("--mix", default="analyze=4,history=3,dashboard=3",
+                        help="Weighted operations: analyze, history, dashboard or a GET path")
+    parser.add_argument("--vcf-lines", default="20,500,5000", help="Upload sizes to pick from (records)")
+    parser.add_argument("--max-drugs", type=int, default=3)
+    parser.add_argument("--history-depth", type=int, default=10, help="Scans seeded per user before measuring")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-jitter-ms", type=float, default=200)
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--mongo-uri", default=MONGO_URI,
+                        help="MongoDB to test with --storage mongo (its database is dropped first)")
+    parser.add_argument("--storage", choices=["mongo", "sqlite"], default="sqlite",
+                        help="Storage backend under test (STORAGE_BACKEND)")
+    parser.add_argument("--sqlite-path", default=SQLITE_PATH,
+                        help="Database file for --storage sqlite (recreated on each run)")
+    parser.add_argument("--rate-limit-per-minute", type=int, default=1000000,
+                        help="Server RATE_LIMIT_PER_MINUTE (default effectively off)")
+    parser.add_argument("--rate-limit-burst", type=int, default=1000000, help="Server RATE_LIMIT_BURST")
+    parser.add_argument("--max-in-flight", type=int, default=64, help="Server ANALYSIS_MAX_IN_FLIGHT")
+    parser.add_argument("--server", choices=["werkzeug", "gunicorn"], default="werkzeug")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show server stderr")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from services.phenotype_engine import determine_phenotype
+from services.risk_engine import PRIMARY_GENE_MAP, evaluate_risk
+from services.gemini_service import generate_explanation, get_fallback_explanation
+from services.json_builder import utc_timestamp
+from services.domain import DrugResult, GeneCall, Report
+
+
+DRUG_ORIGINAL_CASE = {d.upper(): d for d in PRIMARY_GENE_MAP.keys()}
+
+PENDING_EXPLANATION = "Generating clinical explanation..."
+
+
+def build_gene_calls(variants):
+    # One call per gene: the first panel variant seen sets the
+    # genotype/phenotype, every variant of the gene contributes its rsID.
+    # Catalog annotations only add rsIDs to genes that have a panel call.
+    genotypes = {}
+    rsids = {}
+    for variant in variants:
+        gene = variant.gene
+        if not gene or variant.annotation:
+            continue
+        if gene not in genotypes:
+            genotypes[gene] = variant.genotype
+            rsids[gene] = []
+        if variant.rsid:
+            rsids[gene].append(variant.rsid)
+    for variant in variants:
+        if variant.annotation and variant.rsid and variant.gene in rsids:
+            rsids[variant.gene].append(variant.rsid)
+    return {
+        gene: GeneCall(gene, genotype, determine_phenotype(genotype), tuple(rsids[gene]))
+        for gene, genotype in genotypes.items()
+    }
+
+
+def rederive_phenotypes(gene_calls):
+    return {
+        gene: GeneCall(gene, call.genotype, determine_phenotype(call.genotype), call.rsids)
+        for gene, call in gene_calls.items()
+    }
+
+
+def fallback_explanation(gene, phenotype):
+    return f"Analysis completed. Phenotype {phenotype} detected for {gene} gene. Clinical interpretation should be confirmed with laboratory testing."
+
+
+def _stored_explanation(gene, phenotype, drug):
+    from models import ExplanationStore
+    try:
+        return ExplanationStore.for_drug(gene, phenotype, drug)
+    except Exception as e:
+        print(f"Error reading stored explanation: {e}")
+        return None
+
+
+def _store_explanation(gene, phenotype, drug, text):
+    from models import ExplanationStore
+    try:
+        ExplanationStore.remember(gene, phenotype, drug, text)
+    except Exception as e:
+        print(f"Error storing explanation: {e}")
+
+
+def explain_drug(gene, phenotype, drug):
+    # An explanation already generated for this (gene, phenotype, drug) is
+    # reused, so the LLM is asked once per triple and identical explanations
+    # share one stored copy.
+    stored = _stored_explanation(gene, phenotype, drug)
+    if stored:
+        return stored
+    try:
+        text = generate_explanation(gene, phenotype, drug)
+    except Exception:
+        return fallback_explanation(gene, phenotype)
+    # Fallback text (breaker open, load shed, no client) is not worth keeping.
+    if text and text != get_fallback_explanation(gene, phenotype, drug):
+        _store_explanation(gene, phenotype, drug, text)
+    return text
+
+
+def analyze_drug(drug_original, gene_calls, explain=True):
+    primary_gene = PRIMARY_GENE_MAP[drug_original]
+    call = gene_calls.get(primary_gene)
+    
+    phenotype = call.phenotype if call else "Unknown"
+    rsids = call.rsids if call else ()
+    
+    risk_label, severity, confidence = evaluate_risk(drug_original, phenotype)
+    
+    if not call:
+        explanation = "No actionable pharmacogenomic variants detected."
+    elif explain:
+        explanation = explain_drug(primary_gene, phenotype, drug_original)
+    else:
+        explanation = PENDING_EXPLANATION
+    
+    return DrugResult(drug_original, primary_gene, phenotype, risk_label, severity,
+                      confidence, rsids, explanation, bool(call))
+
+
+def build_report(patient_id, drug_results, parsing_success, timestamp=None):
+    return Report(patient_id or "", drug_results, parsing_success, timestamp or utc_timestamp())
+
+
+def set_explanation(report, index, summary):
+    report.results[index].explanation = summary
+
+
+def use_fallback_explanations(drug_results):
+    # Callers that do not want the LLM text still store a readable explanation.
+    for result in drug_results:
+        if result.has_relevant_variant:
+            result.explanation = fallback_explanation(result.gene, result.phenotype)
+
+
+def run_analysis(patient_id, drug_list, gene_calls, parsing_success, explain=True):
+    drug_results = [
+        analyze_drug(DRUG_ORIGINAL_CASE.get(d, d), gene_calls, explain) for d in drug_list
+    ]
+    if not explain:
+        use_fallback_explanations(drug_results)
+    return build_report(patient_id, drug_results, parsing_success)
+
+
+def stream_analysis(patient_id, drug_list, gene_calls, parsing_success, explain=True):
+    """Yield ("report", report) with the deterministic sections as soon as they
+    are computed, then ("explanation", {...}) per drug as each LLM call
+    finishes, then ("complete", report) with the assembled report. Without
+    ``explain`` there are no explanation events."""
+    drug_results = [
+        analyze_drug(DRUG_ORIGINAL_CASE.get(d, d), gene_calls, explain=False) for d in drug_list
+    ]
+    if not explain:
+        use_fallback_explanations(drug_results)
+    report = build_report(patient_id, drug_results, parsing_success)
+    yield "report", report
+    
+    pending = [i for i, r in enumerate(drug_results) if explain and r.has_relevant_variant]
+    if pending:
+        with ThreadPoolExecutor(max_workers=len(pending)) as pool:
+            futures = {
+                pool.submit(explain_drug, drug_results[i].gene, drug_results[i].phenotype, drug_results[i].drug): i
+                for i in pending
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                summary = future.result()
+                set_explanation(report, i, summary)
+                yield "explanation", {
+                    "index": i,
+                    "drug": drug_results[i].drug,
+                    "summary": summary
+                }
+    
+    yield "complete", report
@@ -0,0 +1,161 @@
+import bz2
+import glob
+import gzip
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from services.analysis import DRUG_ORIGINAL_CASE, build_gene_calls, run_analysis
+from services.domain import gene_calls_to_document
+from services.json_builder import report_to_document
+from services.rsid_catalog import load_catalog
+from services.vcf_parser import parse_vcf
+
+
+VCF_SUFFIXES = (".vcf", ".vcf.gz", ".vcf.bz2")
+
+
+def expand_inputs(inputs):
+    """Files, directories (searched recursively for VCFs) and glob patterns,
+    expanded to a sorted, de-duplicated list of paths."""
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                paths.update(os.path.join(root, f) for f in files if f.lower().endswith(VCF_SUFFIXES))
+        elif os.path.exists(item):
+            paths.add(item)
+        else:
+            paths.update(p for p in glob.glob(item, recursive=True) if os.path.isfile(p))
+    return sorted(paths)
+
+
+def open_vcf(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+
+def patient_id_for(path):
+    name = os.path.basename(path)
+    for suffix in (".gz", ".bz2", ".vcf"):
+        if name.lower().endswith(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+
+def analyze_file(task):
+    """Run one VCF through parse -> gene calls -> risk -> report. Returns a
+    plain dict (it crosses the process boundary); failures are reported in
+    it rather than raised, so one bad file never stops the batch."""
+    path, drugs, explain = task
+    patient_id = patient_id_for(path)
+    try:
+        # Read (and decompress) here so an unreadable or truncated archive is
+        # reported as such rather than as a parse error.
+        with open_vcf(path) as stream:
+            content = stream.read()
+    except Exception as e:
+        return {"source": path, "patient_id": patient_id, "status": "error",
+                "error": f"Failed to read VCF file: {e}"}
+    try:
+        variants = parse_vcf(io.BytesIO(content))
+    except ValueError as e:
+        return {"source": path, "patient_id": patient_id, "status": "error", "error": str(e)}
+    except Exception as e:
+        return {"source": path, "patient_id": patient_id, "status": "error",
+                "error": f"Failed to parse VCF file: {e}"}
+
+    gene_calls = build_gene_calls(variants)
+    report = run_analysis(patient_id, drugs, gene_calls, True, explain)
+    return {
+        "source": path,
+        "patient_id": patient_id,
+        "status": "ok",
+        "drugs": report.drugs,
+        "report": report_to_document(report),
+        "gene_calls": gene_calls_to_document(gene_calls)
+    }
+
+
+def completed_sources(output_path):
+    """Sources already analyzed successfully according to an existing output
+    file; a truncated last line from an interrupted run is ignored."""
+    done = set()
+    if not output_path or not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") == "ok":
+                done.add(record.get("source"))
+    return done
+
+
+def _init_worker(catalog_path):
+    load_catalog(catalog_path)
+
+
+def run_batch(paths, drug_list, output, workers=0, save_user_id=None, explain=False,
+              batch_size=200, skip=(), catalog_path=None, progress=None):
+    """Analyze every path and write one NDJSON line per file to ``output``.
+
+    Files are analyzed in a process pool when ``workers`` > 1. With
+    ``save_user_id`` the reports are also bulk-inserted into scans, a batch
+    at a time, and each output line carries its scan_id; an output line is
+    only written once its scan is stored, so ``skip`` (the sources finished
+    by an interrupted run) never causes a duplicate scan. Returns
+    (analyzed, failed) counts."""
+    from models import Scan, PatientProfile
+    from services.risk_engine import RULES_VERSION
+
+    drugs = [DRUG_ORIGINAL_CASE[d] for d in drug_list]
+    tasks = [(path, drugs, explain) for path in paths if path not in skip]
+    pool = None
+    if workers and workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(catalog_path,))
+        results = pool.map(analyze_file, tasks, chunksize=max(1, min(32, len(tasks) // (workers * 4))))
+    else:
+        results = map(analyze_file, tasks)
+
+    analyzed = failed = 0
+    pending = []
+
+    def flush():
+        ok = [r for r in pending if r["status"] == "ok"]
+        if save_user_id and ok:
+            scan_ids = Scan.create_many([
+                Scan.document(save_user_id, r["patient_id"], r["drugs"], r["report"], r["gene_calls"], RULES_VERSION)
+                for r in ok
+            ])
+            for record, scan_id in zip(ok, scan_ids):
+                record["scan_id"] = scan_id
+            PatientProfile.save_many([(save_user_id, r["patient_id"], r["gene_calls"]) for r in ok], RULES_VERSION)
+        for record in pending:
+            record.pop("gene_calls", None)
+            record.pop("drugs", None)
+            output.write(json.dumps(record, separators=(",", ":")) + "\n")
+        output.flush()
+        pending.clear()
+
+    try:
+        for record in results:
+            if record["status"] == "ok":
+                analyzed += 1
+            else:
+                failed += 1
+            pending.append(record)
+            if len(pending) >= batch_size:
+                flush()
+                if progress:
+                    progress(analyzed, failed, len(tasks))
+        flush()
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+    return analyzed, failed
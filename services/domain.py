@@ -0,0 +1,75 @@
+import sys
+from dataclasses import dataclass
+
+
+def intern_str(value):
+    # Genes, phenotypes, genotypes and recurring rsIDs repeat across every
+    # record and request; interning keeps one copy of each string alive.
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+@dataclass(frozen=True, slots=True)
+class Variant:
+    rsid: str
+    gene: str
+    genotype: str
+    # Catalog-only hits: reported with the gene's rsIDs, never used to call
+    # its genotype/phenotype.
+    annotation: bool = False
+
+
+@dataclass(frozen=True, slots=True)
+class GeneCall:
+    gene: str
+    genotype: str
+    phenotype: str
+    rsids: tuple = ()
+
+
+# DrugResult and Report stay mutable: explanations are filled in after the
+# deterministic result is built (streamed LLM answers, fallback text, rescored
+# sections). Their strings come from the interned GeneCall records and the
+# risk tables, so they are shared rather than copied per request.
+@dataclass(slots=True)
+class DrugResult:
+    drug: str
+    gene: str
+    phenotype: str
+    risk_label: str
+    severity: str
+    confidence: float
+    rsids: tuple
+    # Plain text, or an already-stored {"summary"}/{"summary_ref"} section.
+    explanation: object
+    has_relevant_variant: bool
+
+
+@dataclass(slots=True)
+class Report:
+    patient_id: str
+    results: list
+    parsing_success: bool
+    timestamp: str
+
+    @property
+    def drugs(self):
+        return ", ".join(r.drug for r in self.results)
+
+
+def gene_calls_to_document(gene_calls):
+    return {
+        gene: {"genotype": call.genotype, "phenotype": call.phenotype, "rsids": list(call.rsids)}
+        for gene, call in gene_calls.items()
+    }
+
+
+def gene_calls_from_document(document):
+    return {
+        intern_str(gene): GeneCall(
+            intern_str(gene),
+            intern_str(call.get("genotype")),
+            intern_str(call.get("phenotype") or "Unknown"),
+            tuple(intern_str(r) for r in call.get("rsids", []))
+        )
+        for gene, call in (document or {}).items()
+    }
@@ -1,31 +1,108 @@
 import os
-import google.genai
-from config import GEMINI_API_KEY
+import threading
+import time
+from config import (GEMINI_API_KEY, GEMINI_MODEL, GEMINI_BASE_URL, GEMINI_TIMEOUT_MS,
+                    LLM_LATENCY_BUDGET_MS, LLM_BREAKER_WINDOW, LLM_BREAKER_COOLDOWN_S,
+                    LLM_MAX_IN_FLIGHT)
+from utils.circuit_breaker import CircuitBreaker
 
 _client = None
+_client_lock = threading.Lock()
+
+_breaker = CircuitBreaker(
+    window=LLM_BREAKER_WINDOW,
+    latency_budget_ms=LLM_LATENCY_BUDGET_MS,
+    cooldown_s=LLM_BREAKER_COOLDOWN_S
+)
+
+_stats_lock = threading.Lock()
+_in_flight = 0
+_stats = {
+    "calls": 0,
+    "llm_success": 0,
+    "fallback_no_client": 0,
+    "fallback_breaker_open": 0,
+    "fallback_load_shed": 0,
+    "fallback_error": 0,
+    "fallback_empty": 0
+}
 
 def _get_client():
     global _client
     if _client is None and GEMINI_API_KEY:
-        try:
-            _client = google.genai.Client(api_key=GEMINI_API_KEY)
-        except Exception:
-            _client = False
+        with _client_lock:
+            if _client is None:
+                try:
+                    # Imported on first use: the SDK dominates cold-start import
+                    # time and most routes never call the LLM.
+                    import google.genai
+                    from google.genai import types
+                    http_options = types.HttpOptions(timeout=GEMINI_TIMEOUT_MS, base_url=GEMINI_BASE_URL)
+                    _client = google.genai.Client(api_key=GEMINI_API_KEY, http_options=http_options)
+                except Exception:
+                    _client = False
     return _client if _client else None
 
 
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def _acquire_slot():
+    global _in_flight
+    with _stats_lock:
+        if _in_flight >= LLM_MAX_IN_FLIGHT:
+            return False
+        _in_flight += 1
+        return True
+
+
+def _release_slot():
+    global _in_flight
+    with _stats_lock:
+        _in_flight -= 1
+
+
+def get_llm_metrics():
+    with _stats_lock:
+        stats = dict(_stats)
+        in_flight = _in_flight
+    fallbacks = sum(v for k, v in stats.items() if k.startswith("fallback_"))
+    stats["fallback_rate"] = round(fallbacks / stats["calls"], 4) if stats["calls"] else 0.0
+    stats["in_flight"] = in_flight
+    stats["max_in_flight"] = LLM_MAX_IN_FLIGHT
+    stats["breaker"] = _breaker.snapshot()
+    return stats
+
+
 def generate_explanation(gene, phenotype, drug):
     if not gene or not drug:
         return "Gene or drug information missing. Please verify input data."
     
+    _count("calls")
+    
     if not GEMINI_API_KEY:
+        _count("fallback_no_client")
         return get_fallback_explanation(gene, phenotype, drug)
     
     client = _get_client()
     if not client:
+        _count("fallback_no_client")
+        return get_fallback_explanation(gene, phenotype, drug)
+    
+    # Shed before asking the breaker so a probe slot is never taken by a
+    # call that would be dropped anyway.
+    if not _acquire_slot():
+        _count("fallback_load_shed")
         return get_fallback_explanation(gene, phenotype, drug)
     
     try:
+        ticket = _breaker.allow()
+        if not ticket:
+            _count("fallback_breaker_open")
+            return get_fallback_explanation(gene, phenotype, drug)
+        
         phenotype_desc = get_phenotype_description(phenotype)
         
         prompt = f"""
@@ -39,18 +116,31 @@ Provide a 2-3 sentence clinical explanation suitable for healthcare professional
 Do NOT speculate beyond the provided phenotype information.
 """
         
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt
-        )
+        started = time.perf_counter()
+        try:
+            response = client.models.generate_content(
+                model=GEMINI_MODEL,
+                contents=prompt
+            )
+        except Exception:
+            _breaker.record(ticket, False, (time.perf_counter() - started) * 1000.0)
+            _count("fallback_error")
+            return get_fallback_explanation(gene, phenotype, drug)
+        
+        _breaker.record(ticket, True, (time.perf_counter() - started) * 1000.0)
         
         if response and response.text:
+            _count("llm_success")
             return response.text.strip()
         else:
+            _count("fallback_empty")
             return get_fallback_explanation(gene, phenotype, drug)
             
     except Exception as e:
+        _count("fallback_error")
         return get_fallback_explanation(gene, phenotype, drug)
+    finally:
+        _release_slot()
 
 
 def get_phenotype_description(phenotype):
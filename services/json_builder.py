@@ -1,11 +1,61 @@
-from collections import OrderedDict
+import json
 from datetime import datetime
+from services.domain import DrugResult, Report, intern_str
 
 
 VALID_RISK_LABELS = {"Safe", "Adjust Dosage", "Toxic", "Ineffective", "Unknown"}
 VALID_SEVERITY_LEVELS = {"none", "low", "moderate", "high", "critical"}
 VALID_PHENOTYPES = {"PM", "IM", "NM", "RM", "UM", "URM", "Unknown"}
 
+SEVERITY_RANK = {"none": 0, "low": 1, "moderate": 2, "high": 3, "critical": 4}
+SEVERITY_LABELS = {rank: label for label, rank in SEVERITY_RANK.items()}
+
+DIPLOTYPES = {
+    "PM": "*4/*4",
+    "IM": "*1/*4",
+    "NM": "*1/*1",
+    "RM": "*1x2/*1",
+    "UM": "*1xN/*1",
+    "URM": "*1xN/*1"
+}
+
+RECOMMENDATIONS = {
+    "PM": {
+        "action": "Reduce dose or consider alternative therapy",
+        "dose_adjustment": "Significant dose reduction recommended",
+        "monitoring": "Frequent therapeutic drug monitoring required"
+    },
+    "IM": {
+        "action": "Consider dose adjustment",
+        "dose_adjustment": "Moderate dose reduction may be needed",
+        "monitoring": "Regular clinical monitoring advised"
+    },
+    "NM": {
+        "action": "Standard dosing",
+        "dose_adjustment": "No dose adjustment required",
+        "monitoring": "Standard monitoring per protocol"
+    },
+    "RM": {
+        "action": "Standard dosing",
+        "dose_adjustment": "Standard dose, may consider increase if needed",
+        "monitoring": "Monitor for efficacy"
+    },
+    "UM": {
+        "action": "Consider increased dose or alternative",
+        "dose_adjustment": "May require higher than standard doses",
+        "monitoring": "Monitor for therapeutic response"
+    },
+    "URM": {
+        "action": "Consider increased dose or alternative",
+        "dose_adjustment": "May require higher than standard doses",
+        "monitoring": "Monitor for therapeutic response"
+    },
+    "Unknown": {
+        "action": "Refer to clinical genetics",
+        "dose_adjustment": "Use standard dosing with caution",
+        "monitoring": "Close clinical monitoring recommended"
+    }
+}
 
 def validate_risk_label(value):
     if value in VALID_RISK_LABELS:
@@ -25,152 +75,55 @@ def validate_phenotype(value):
     return "Unknown"
 
 
-def build_multi_drug_response(patient_id, drug_results, parsing_success):
-    drug_analyses = []
-    overall_confidence = 0.0
+def determine_diplotype(phenotype):
+    return DIPLOTYPES.get(phenotype, "*1/*1")
+
+
+def get_clinical_recommendation(phenotype, drug):
+    return dict(RECOMMENDATIONS[validate_phenotype(phenotype)])
+
+
+def overall_risk(drug_results):
+    """(risk_label, severity, confidence) summarizing a multi-drug report."""
     has_toxic = False
     has_adjust = False
     has_relevant = False
     max_severity = 0
-    severity_map = {"none": 0, "low": 1, "moderate": 2, "high": 3, "critical": 4}
-    
-    for result in drug_results:
-        phenotype = result.get("phenotype", "Unknown")
-        phenotype = validate_phenotype(phenotype)
-        
-        confidence = float(result.get("confidence", 0.0)) if result.get("confidence") is not None else 0.0
-        severity = validate_severity(result.get("severity", "none"))
-        
-        overall_confidence = max(overall_confidence, confidence)
-        
-        risk_label = validate_risk_label(result.get("risk_label", "Unknown"))
-        if risk_label == "Toxic":
-            has_toxic = True
-        elif risk_label == "Adjust Dosage":
-            has_adjust = True
-        
-        if severity in severity_map:
-            max_severity = max(max_severity, severity_map[severity])
-        
-        has_relevant = has_relevant or result.get("has_relevant_variant", False)
-        
-        drug_analyses.append(OrderedDict([
-            ("drug", result.get("drug", "")),
-            ("risk_assessment", OrderedDict([
-                ("risk_label", risk_label),
-                ("confidence_score", confidence),
-                ("severity", severity)
-            ])),
-            ("pharmacogenomic_profile", OrderedDict([
-                ("primary_gene", result.get("gene", "")),
-                ("diplotype", determine_diplotype(phenotype)),
-                ("phenotype", phenotype),
-                ("detected_variants", [{"rsid": r} for r in result.get("rsids", [])])
-            ])),
-            ("clinical_recommendation", get_clinical_recommendation(phenotype, result.get("drug", ""))),
-            ("llm_generated_explanation", OrderedDict([
-                ("summary", result.get("explanation", ""))
-            ]))
-        ]))
-    
-    severity_labels = {0: "none", 1: "low", 2: "moderate", 3: "high", 4: "critical"}
-    
-    if has_toxic:
-        overall_risk_label = "Toxic"
-        overall_severity = "high"
-    elif has_adjust:
-        overall_risk_label = "Adjust Dosage"
-        overall_severity = severity_labels.get(max_severity, "moderate")
-    elif not has_relevant:
-        overall_risk_label = "Unknown"
-        overall_severity = "none"
-    else:
-        overall_risk_label = "Safe"
-        overall_severity = severity_labels.get(max_severity, "low")
-    
-    overall_risk_label = validate_risk_label(overall_risk_label)
-    overall_severity = validate_severity(overall_severity)
-    overall_summary = generate_overall_summary(drug_results)
-    
-    return OrderedDict([
-        ("patient_id", patient_id if patient_id else ""),
-        ("drug", ", ".join([r.get("drug", "") for r in drug_results])),
-        ("timestamp", datetime.utcnow().isoformat() + "Z"),
-        ("risk_assessment", OrderedDict([
-            ("risk_label", overall_risk_label),
-            ("confidence_score", overall_confidence),
-            ("severity", overall_severity)
-        ])),
-        ("pharmacogenomic_profile", OrderedDict([
-            ("primary_gene", ""),
-            ("diplotype", ""),
-            ("phenotype", ""),
-            ("detected_variants", [])
-        ])),
-        ("clinical_recommendation", OrderedDict([
-            ("action", overall_risk_label),
-            ("dose_adjustment", "See drug analyses"),
-            ("monitoring", "See drug analyses")
-        ])),
-        ("llm_generated_explanation", OrderedDict([
-            ("summary", overall_summary)
-        ])),
-        ("drug_analyses", drug_analyses)
-    ])
-
-
-def determine_overall_risk(drug_results):
-    has_toxic = False
-    has_adjust = False
-    max_severity = 0
-    severity_map = {"none": 0, "low": 1, "moderate": 2, "high": 3, "critical": 4}
-    
+    confidence = 0.0
+
     for result in drug_results:
-        risk_label = validate_risk_label(result.get("risk_label", ""))
-        sev = validate_severity(result.get("severity", "none"))
-        
+        risk_label = validate_risk_label(result.risk_label)
         if risk_label == "Toxic":
             has_toxic = True
         elif risk_label == "Adjust Dosage":
             has_adjust = True
-        
-        if sev in severity_map:
-            max_severity = max(max_severity, severity_map[sev])
-    
-    severity_labels = {0: "none", 1: "low", 2: "moderate", 3: "high", 4: "critical"}
-    
+        max_severity = max(max_severity, SEVERITY_RANK[validate_severity(result.severity)])
+        confidence = max(confidence, float(result.confidence or 0.0))
+        has_relevant = has_relevant or result.has_relevant_variant
+
     if has_toxic:
-        return {
-            "overall_risk_label": "Toxic",
-            "overall_severity": "high"
-        }
-    elif has_adjust:
-        return {
-            "overall_risk_label": "Adjust Dosage",
-            "overall_severity": severity_labels.get(max_severity, "moderate")
-        }
-    else:
-        return {
-            "overall_risk_label": "Safe",
-            "overall_severity": severity_labels.get(max_severity, "low")
-        }
+        return "Toxic", "high", confidence
+    if has_adjust:
+        return "Adjust Dosage", SEVERITY_LABELS.get(max_severity, "moderate"), confidence
+    if not has_relevant:
+        return "Unknown", "none", confidence
+    return "Safe", SEVERITY_LABELS.get(max_severity, "low"), confidence
 
 
 def generate_overall_summary(drug_results):
     toxic_drugs = []
     adjust_drugs = []
     safe_drugs = []
-    
+
     for result in drug_results:
-        drug = result.get("drug", "")
-        risk = validate_risk_label(result.get("risk_label", ""))
+        risk = validate_risk_label(result.risk_label)
         if risk == "Toxic":
-            toxic_drugs.append(drug)
+            toxic_drugs.append(result.drug)
         elif risk == "Adjust Dosage":
-            adjust_drugs.append(drug)
+            adjust_drugs.append(result.drug)
         else:
-            safe_drugs.append(drug)
-    
+            safe_drugs.append(result.drug)
+
     parts = []
     if toxic_drugs:
         parts.append(f"Drugs with potential toxicity risk: {', '.join(toxic_drugs)}. Consider dose reduction or alternative therapy.")
@@ -178,97 +131,175 @@ def generate_overall_summary(drug_results):
         parts.append(f"Dose adjustment recommended for: {', '.join(adjust_drugs)}.")
     if safe_drugs:
         parts.append(f"Standard dosing appropriate for: {', '.join(safe_drugs)}.")
-    
+
     if not parts:
         return "Multi-drug analysis completed. Please refer to individual drug recommendations."
-    
+
     return " ".join(parts)
 
 
-def build_response(patient_id, drug, gene, phenotype,
-                   risk_label, severity, confidence,
-                   rsids, explanation, parsing_success):
-    
-    phenotype = validate_phenotype(phenotype if phenotype else "Unknown")
-    risk_label = validate_risk_label(risk_label if risk_label else "Unknown")
-    severity = validate_severity(severity if severity else "none")
-    confidence = float(confidence) if confidence is not None else 0.0
-    
-    return OrderedDict([
-        ("patient_id", patient_id if patient_id else ""),
-        ("drug", drug if drug else ""),
-        ("timestamp", datetime.utcnow().isoformat() + "Z"),
-        ("risk_assessment", OrderedDict([
-            ("risk_label", risk_label),
-            ("confidence_score", confidence),
-            ("severity", severity)
-        ])),
-        ("pharmacogenomic_profile", OrderedDict([
-            ("primary_gene", gene if gene else ""),
-            ("diplotype", determine_diplotype(phenotype)),
-            ("phenotype", phenotype),
-            ("detected_variants", [{"rsid": r} for r in rsids] if rsids else [])
-        ])),
-        ("clinical_recommendation", get_clinical_recommendation(phenotype, drug)),
-        ("llm_generated_explanation", OrderedDict([
-            ("summary", explanation if explanation else "No explanation available")
-        ])),
-        ("quality_metrics", OrderedDict([
-            ("vcf_parsing_success", parsing_success)
-        ]))
-    ])
+def _explanation_section(explanation, default=""):
+    # Re-scored reports carry explanations in their stored form.
+    if isinstance(explanation, dict):
+        return dict(explanation)
+    return {"summary": explanation if explanation else default}
 
 
-def determine_diplotype(phenotype):
-    diplotype_map = {
-        "PM": "*4/*4",
-        "IM": "*1/*4",
-        "NM": "*1/*1",
-        "RM": "*1x2/*1",
-        "UM": "*1xN/*1",
-        "URM": "*1xN/*1"
+# Report serializer. One table of section builders feeds both outputs, so the
+# stored document and the response text cannot drift apart: a single-drug
+# report is flat; a multi-drug report adds an overall summary and one entry per
+# drug under "drug_analyses". report_to_document builds the plain dict stored in
+# MongoDB and passed to templates; report_to_json encodes that same dict.
+
+def _risk_section(result, single, phenotype):
+    return {
+        "risk_label": validate_risk_label(result.risk_label or "Unknown"),
+        "confidence_score": float(result.confidence or 0.0),
+        "severity": validate_severity(result.severity or "none")
     }
-    return diplotype_map.get(phenotype, "*1/*1")
 
 
-def get_clinical_recommendation(phenotype, drug):
-    phenotype = validate_phenotype(phenotype)
-    recommendations = {
-        "PM": {
-            "action": "Reduce dose or consider alternative therapy",
-            "dose_adjustment": "Significant dose reduction recommended",
-            "monitoring": "Frequent therapeutic drug monitoring required"
-        },
-        "IM": {
-            "action": "Consider dose adjustment",
-            "dose_adjustment": "Moderate dose reduction may be needed",
-            "monitoring": "Regular clinical monitoring advised"
-        },
-        "NM": {
-            "action": "Standard dosing",
-            "dose_adjustment": "No dose adjustment required",
-            "monitoring": "Standard monitoring per protocol"
-        },
-        "RM": {
-            "action": "Standard dosing",
-            "dose_adjustment": "Standard dose, may consider increase if needed",
-            "monitoring": "Monitor for efficacy"
-        },
-        "UM": {
-            "action": "Consider increased dose or alternative",
-            "dose_adjustment": "May require higher than standard doses",
-            "monitoring": "Monitor for therapeutic response"
-        },
-        "URM": {
-            "action": "Consider increased dose or alternative",
-            "dose_adjustment": "May require higher than standard doses",
-            "monitoring": "Monitor for therapeutic response"
-        },
-        "Unknown": {
-            "action": "Refer to clinical genetics",
-            "dose_adjustment": "Use standard dosing with caution",
-            "monitoring": "Close clinical monitoring recommended"
+def _profile_section(result, single, phenotype):
+    return {
+        "primary_gene": result.gene or "",
+        "diplotype": determine_diplotype(phenotype),
+        "phenotype": phenotype,
+        "detected_variants": [{"rsid": r} for r in result.rsids]
+    }
+
+
+def _recommendation_section(result, single, phenotype):
+    return get_clinical_recommendation(phenotype, result.drug)
+
+
+def _drug_explanation_section(result, single, phenotype):
+    return _explanation_section(result.explanation, "No explanation available" if single else "")
+
+
+# Per-drug sections in response order. A sparse response (``fields``) only
+# calls the builders of the sections it asked for.
+_DRUG_SECTIONS = (
+    ("risk_assessment", _risk_section),
+    ("pharmacogenomic_profile", _profile_section),
+    ("clinical_recommendation", _recommendation_section),
+    ("llm_generated_explanation", _drug_explanation_section)
+)
+
+RESPONSE_FIELDS = tuple(name for name, _ in _DRUG_SECTIONS) + ("quality_metrics",)
+# compact=1: just what bulk consumers act on, the risk label and the phenotype.
+COMPACT_FIELDS = frozenset({"risk_assessment", "pharmacogenomic_profile"})
+
+
+def parse_fields(fields=None, compact=False):
+    """The response sections selected by a ``fields=a,b`` list and/or the
+    compact flag, or None for the full response. Raises ValueError on an
+    unknown section name."""
+    selected = set(COMPACT_FIELDS) if compact else set()
+    for name in (fields or "").split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in RESPONSE_FIELDS:
+            raise ValueError(f"Unknown response field: {name}. Valid fields: {', '.join(RESPONSE_FIELDS)}")
+        selected.add(name)
+    return frozenset(selected) if selected else None
+
+
+def _drug_sections(document, result, single, fields):
+    phenotype = validate_phenotype(result.phenotype or "Unknown")
+    for name, build in _DRUG_SECTIONS:
+        if fields is None or name in fields:
+            document[name] = build(result, single, phenotype)
+    return document
+
+
+def report_to_document(report, fields=None):
+    """``fields`` (see parse_fields) limits the report to those sections;
+    patient_id, drug and timestamp are always included, and a multi-drug
+    report always has its drug_analyses."""
+    if len(report.results) == 1:
+        result = report.results[0]
+        document = {
+            "patient_id": report.patient_id or "",
+            "drug": result.drug or "",
+            "timestamp": report.timestamp
         }
+        _drug_sections(document, result, True, fields)
+        if fields is None or "quality_metrics" in fields:
+            document["quality_metrics"] = {"vcf_parsing_success": report.parsing_success}
+        return document
+
+    document = {
+        "patient_id": report.patient_id or "",
+        "drug": report.drugs,
+        "timestamp": report.timestamp
     }
-    
-    return recommendations.get(phenotype, recommendations["Unknown"])
+    if fields is None or "risk_assessment" in fields or "clinical_recommendation" in fields:
+        risk_label, severity, confidence = overall_risk(report.results)
+    if fields is None or "risk_assessment" in fields:
+        document["risk_assessment"] = {
+            "risk_label": risk_label,
+            "confidence_score": confidence,
+            "severity": severity
+        }
+    if fields is None:
+        # Placeholder kept for existing clients; sparse responses leave it out
+        # since the profiles are per drug.
+        document["pharmacogenomic_profile"] = {
+            "primary_gene": "",
+            "diplotype": "",
+            "phenotype": "",
+            "detected_variants": []
+        }
+    if fields is None or "clinical_recommendation" in fields:
+        document["clinical_recommendation"] = {
+            "action": risk_label,
+            "dose_adjustment": "See drug analyses",
+            "monitoring": "See drug analyses"
+        }
+    if fields is None or "llm_generated_explanation" in fields:
+        document["llm_generated_explanation"] = {"summary": generate_overall_summary(report.results)}
+    document["drug_analyses"] = [
+        _drug_sections({"drug": result.drug or ""}, result, False, fields) for result in report.results
+    ]
+    return document
+
+
+# The response is encoded from the report document rather than written
+# straight from the domain objects: a second, hand-written text builder of the
+# same layout drifted from this one, and the document is a few small dicts per
+# drug that the C encoder turns into text in one pass.
+_encode = json.JSONEncoder(separators=(",", ":")).encode
+
+
+def report_to_json(report, fields=None):
+    return _encode(report_to_document(report, fields))
+
+
+def utc_timestamp():
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def _drug_result(result):
+    if isinstance(result, DrugResult):
+        return result
+    return DrugResult(
+        intern_str(result.get("drug", "")), intern_str(result.get("gene", "")),
+        intern_str(result.get("phenotype", "Unknown")), intern_str(result.get("risk_label", "Unknown")),
+        intern_str(result.get("severity", "none")), result.get("confidence"),
+        tuple(intern_str(r) for r in result.get("rsids", [])), result.get("explanation", ""),
+        result.get("has_relevant_variant", False)
+    )
+
+
+def build_multi_drug_response(patient_id, drug_results, parsing_success):
+    results = [_drug_result(r) for r in drug_results]
+    return report_to_document(Report(patient_id, results, parsing_success, utc_timestamp()))
+
+
+def build_response(patient_id, drug, gene, phenotype,
+                   risk_label, severity, confidence,
+                   rsids, explanation, parsing_success):
+    result = DrugResult(drug, gene, phenotype, risk_label, severity, confidence,
+                        tuple(rsids or ()), explanation, True)
+    return report_to_document(Report(patient_id, [result], parsing_success, utc_timestamp()))
@@ -0,0 +1,111 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from services.analysis import (DRUG_ORIGINAL_CASE, analyze_drug, build_report,
+                               fallback_explanation, rederive_phenotypes)
+from services.domain import GeneCall, gene_calls_from_document
+from services.json_builder import report_to_document
+from services.risk_engine import RULES_VERSION
+
+
+def _sections(report):
+    if "drug_analyses" in report:
+        return report["drug_analyses"]
+    return [report]
+
+
+def gene_calls_from_report(report):
+    # Scans saved before genotypes were stored only carry the phenotype each
+    # drug was scored with; re-scoring them re-applies the risk and
+    # recommendation rules to that phenotype.
+    gene_calls = {}
+    for section in _sections(report):
+        profile = section.get("pharmacogenomic_profile", {})
+        gene = profile.get("primary_gene")
+        rsids = [v.get("rsid") for v in profile.get("detected_variants", []) if v.get("rsid")]
+        phenotype = profile.get("phenotype") or "Unknown"
+        if gene and (rsids or phenotype != "Unknown"):
+            gene_calls.setdefault(gene, GeneCall(gene, None, phenotype, tuple(rsids)))
+    return gene_calls
+
+
+def rescore_scan(scan):
+    """Recompute a stored scan under the current rules. Returns
+    (scan_id, document), with document None when the scan cannot be re-scored.
+    Explanations are kept where gene and phenotype are unchanged; otherwise
+    the deterministic fallback text replaces them, so no LLM calls are made."""
+    report = scan.get("result_json") or {}
+    old_sections = _sections(report)
+    drugs = [DRUG_ORIGINAL_CASE.get((s.get("drug") or "").strip().upper()) for s in old_sections]
+    if not drugs or None in drugs:
+        return scan["_id"], None
+
+    if scan.get("gene_calls"):
+        gene_calls = rederive_phenotypes(gene_calls_from_document(scan["gene_calls"]))
+    else:
+        gene_calls = gene_calls_from_report(report)
+
+    parsing_success = report.get("quality_metrics", {}).get("vcf_parsing_success", True)
+    drug_results = [analyze_drug(drug, gene_calls, explain=False) for drug in drugs]
+    for result, old in zip(drug_results, old_sections):
+        if not result.has_relevant_variant:
+            continue
+        old_profile = old.get("pharmacogenomic_profile", {})
+        if (old_profile.get("primary_gene"), old_profile.get("phenotype")) == (result.gene, result.phenotype):
+            # Kept in its stored {"summary_ref"} or {"summary"} form.
+            result.explanation = old.get("llm_generated_explanation")
+        else:
+            result.explanation = fallback_explanation(result.gene, result.phenotype)
+
+    new_report = build_report(report.get("patient_id", ""), drug_results, parsing_success,
+                              report.get("timestamp"))
+    return scan["_id"], report_to_document(new_report)
+
+
+def run_rescore(batch_size=500, workers=0, max_rate=None, restart=False,
+                target_version=RULES_VERSION, progress=None):
+    """Re-score every scan whose rules_version is older than target_version.
+
+    Scans are read from the read preference (secondaries when available) in
+    _id order, recomputed in a process pool when ``workers`` > 1, and written
+    with one bulk_write per batch. The last written _id is checkpointed in the
+    jobs collection, so an interrupted run resumes where it stopped.
+    ``max_rate`` caps scans per second to bound the write load on the primary."""
+    from models import Job, Scan
+
+    job = Job.start_rescore(target_version, restart=restart)
+    if job.get("status") == "completed":
+        return job
+    last_id = job.get("last_id")
+    pool = ProcessPoolExecutor(max_workers=workers) if workers and workers > 1 else None
+    started = time.monotonic()
+    processed = 0
+    try:
+        while True:
+            batch = Scan.find_outdated(target_version, last_id, batch_size)
+            if not batch:
+                break
+            if pool:
+                results = list(pool.map(rescore_scan, batch, chunksize=max(1, len(batch) // (workers * 4))))
+            else:
+                results = [rescore_scan(scan) for scan in batch]
+
+            restored = {scan["_id"]: scan.get("gene_calls") for scan in batch if scan.get("archived")}
+            updated = Scan.apply_rescored(results, target_version, restored)
+            last_id = batch[-1]["_id"]
+            job = Job.checkpoint(job["_id"], last_id, scanned=len(batch), updated=updated,
+                                 skipped=len(batch) - updated)
+            if progress:
+                progress(job)
+
+            processed += len(batch)
+            if max_rate:
+                ahead = processed / max_rate - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+    except Exception as e:
+        Job.fail(job["_id"], str(e))
+        raise
+    finally:
+        if pool:
+            pool.shutdown()
+    return Job.finish(job["_id"])
@@ -1,3 +1,8 @@
+# Bump whenever phenotype, risk or recommendation rules change so stored
+# patient profiles are re-derived instead of served stale and stored scans
+# can be re-scored (flask rescore-scans).
+RULES_VERSION = 1
+
 PRIMARY_GENE_MAP = {
     "Codeine": "CYP2D6",
     "Clopidogrel": "CYP2C19",
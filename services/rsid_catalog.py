@@ -0,0 +1,119 @@
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+
+
+# Layout: header | int64 rsid[count] (sorted) | uint16 gene_code[count] | gene names
+# The rsid column starts at an 8-byte boundary so it can be cast in place.
+MAGIC = b"PGXCAT01"
+HEADER = struct.Struct("<8sII")
+
+_catalog = None
+
+
+class RsidCatalog:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, gene_count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Not an rsID catalog: {path}")
+        self._view = view = memoryview(self._mmap)
+        rsid_start = HEADER.size
+        code_start = rsid_start + count * 8
+        names_start = code_start + count * 2
+        self.count = count
+        self.rsids = view[rsid_start:code_start].cast("q")
+        self.codes = view[code_start:names_start].cast("H")
+        self.genes = bytes(view[names_start:]).decode("utf-8").split("\n")[:gene_count]
+
+    def lookup(self, rsid):
+        number = _rsid_number(rsid)
+        if number is None:
+            return None
+        i = bisect_left(self.rsids, number)
+        if i < self.count and self.rsids[i] == number:
+            return self.genes[self.codes[i]]
+        return None
+
+    def lookup_many(self, rsids):
+        # Resolve a whole file's IDs in one sorted pass: each search starts where
+        # the previous one ended, so the mapped pages are walked front to back.
+        queries = sorted((n, r) for r in rsids for n in [_rsid_number(r)] if n is not None)
+        found = {}
+        lo = 0
+        for number, rsid in queries:
+            lo = bisect_left(self.rsids, number, lo)
+            if lo >= self.count:
+                break
+            if self.rsids[lo] == number:
+                found[rsid] = self.genes[self.codes[lo]]
+        return found
+
+    def close(self):
+        for attr in ("rsids", "codes", "_view"):
+            if hasattr(self, attr):
+                getattr(self, attr).release()
+        self._mmap.close()
+        self._file.close()
+
+
+def _rsid_number(rsid):
+    if not rsid or rsid[:2].lower() != "rs" or not rsid[2:].isdigit():
+        return None
+    return int(rsid[2:])
+
+
+def build_catalog(source_path, output_path):
+    """Build a catalog from a tab- or comma-separated ``rsid, gene`` file such as
+    a PharmGKB/CPIC variant export. Returns (entries, genes) written."""
+    entries = {}
+    with open(source_path, encoding="utf-8") as source:
+        for line in source:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = line.split("\t") if "\t" in line else line.split(",")
+            if len(fields) < 2:
+                continue
+            number = _rsid_number(fields[0].strip())
+            gene = fields[1].strip()
+            if number is None or not gene:
+                continue
+            entries.setdefault(number, gene)
+
+    genes = sorted(set(entries.values()))
+    if len(genes) > 0xFFFF:
+        raise ValueError("Too many genes for a 16-bit gene code")
+    gene_codes = {gene: i for i, gene in enumerate(genes)}
+
+    numbers = sorted(entries)
+    rsid_column = array("q", numbers)
+    code_column = array("H", (gene_codes[entries[n]] for n in numbers))
+
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "wb") as out:
+        out.write(HEADER.pack(MAGIC, len(numbers), len(genes)))
+        out.write(rsid_column.tobytes())
+        out.write(code_column.tobytes())
+        out.write("\n".join(genes).encode("utf-8"))
+    os.replace(tmp_path, output_path)
+    return len(numbers), len(genes)
+
+
+def load_catalog(path):
+    global _catalog
+    if not path or not os.path.exists(path):
+        return None
+    if _catalog is not None and _catalog.path == path:
+        return _catalog
+    _catalog = RsidCatalog(path)
+    return _catalog
+
+
+def get_catalog():
+    return _catalog
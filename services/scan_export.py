@@ -0,0 +1,114 @@
+import csv
+import io
+import json
+import zlib
+
+
+CSV_COLUMNS = [
+    "scan_id", "created_at", "patient_id", "drug", "primary_gene", "phenotype",
+    "diplotype", "risk_label", "severity", "confidence_score", "overall_risk_label",
+    "detected_variants", "explanation"
+]
+
+FLUSH_BYTES = 64 * 1024
+
+
+def _isoformat(value):
+    return value.isoformat() + "Z" if hasattr(value, "isoformat") else value
+
+
+def scan_to_record(scan):
+    return {
+        "scan_id": str(scan["_id"]),
+        "created_at": _isoformat(scan.get("created_at")),
+        "patient_id": scan.get("patient_id", ""),
+        "drugs": scan.get("drugs", ""),
+        "overall_risk_label": scan.get("overall_risk_label", "Unknown"),
+        "severity": scan.get("severity", "none"),
+        "confidence_score": scan.get("confidence_score", 0.0),
+        "primary_gene": scan.get("primary_gene", ""),
+        "phenotype": scan.get("phenotype", "Unknown"),
+        "result": scan.get("result_json", {})
+    }
+
+
+def scan_to_csv_rows(scan):
+    # One row per drug: multi-drug reports are flattened from drug_analyses,
+    # single-drug reports from the top-level sections.
+    result = scan.get("result_json") or {}
+    analyses = result.get("drug_analyses") or [result]
+    for analysis in analyses:
+        profile = analysis.get("pharmacogenomic_profile") or {}
+        risk = analysis.get("risk_assessment") or {}
+        explanation = analysis.get("llm_generated_explanation") or {}
+        yield [
+            str(scan["_id"]),
+            _isoformat(scan.get("created_at")),
+            scan.get("patient_id", ""),
+            analysis.get("drug", ""),
+            profile.get("primary_gene", ""),
+            profile.get("phenotype", ""),
+            profile.get("diplotype", ""),
+            risk.get("risk_label", ""),
+            risk.get("severity", ""),
+            risk.get("confidence_score", ""),
+            scan.get("overall_risk_label", ""),
+            ";".join(v.get("rsid", "") for v in profile.get("detected_variants", [])),
+            explanation.get("summary", "")
+        ]
+
+
+# Cells a spreadsheet would evaluate as a formula (patient IDs and
+# explanations are user- or LLM-supplied).
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _csv_cell(value):
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _ndjson_lines(cursor):
+    for scan in cursor:
+        yield json.dumps(scan_to_record(scan), separators=(",", ":"), default=str) + "\n"
+
+
+def _csv_lines(cursor):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for scan in cursor:
+        for row in scan_to_csv_rows(scan):
+            writer.writerow([_csv_cell(value) for value in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_chunks(cursor, export_format="ndjson", compress=False):
+    """Encode a scan cursor as NDJSON or CSV in ~64KB chunks, optionally gzip'd,
+    holding at most one chunk in memory at a time."""
+    lines = _csv_lines(cursor) if export_format == "csv" else _ndjson_lines(cursor)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    pending = []
+    size = 0
+    for line in lines:
+        data = line.encode("utf-8")
+        pending.append(data)
+        size += len(data)
+        if size >= FLUSH_BYTES:
+            chunk = b"".join(pending)
+            pending, size = [], 0
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+
+    chunk = b"".join(pending)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
@@ -0,0 +1,151 @@
+from bisect import bisect_left, bisect_right
+
+
+DEFAULT_BUILD = "GRCh38"
+
+# (rsid, gene, chrom, pos, ref, alt) per reference build, forward strand.
+KNOWN_VARIANTS = {
+    "GRCh37": [
+        ("rs3892097", "CYP2D6", "22", 42524947, "C", "T"),
+        ("rs4244285", "CYP2C19", "10", 96541616, "G", "A"),
+        ("rs1057910", "CYP2C9", "10", 96741053, "A", "C"),
+        ("rs4149056", "SLCO1B1", "12", 21331549, "T", "C"),
+        ("rs1142345", "TPMT", "6", 18130918, "T", "C"),
+        ("rs3918290", "DPYD", "1", 97915614, "C", "T"),
+    ],
+    "GRCh38": [
+        ("rs3892097", "CYP2D6", "22", 42128945, "C", "T"),
+        ("rs4244285", "CYP2C19", "10", 94781859, "G", "A"),
+        ("rs1057910", "CYP2C9", "10", 94981296, "A", "C"),
+        ("rs4149056", "SLCO1B1", "12", 21178615, "T", "C"),
+        ("rs1142345", "TPMT", "6", 18130687, "T", "C"),
+        ("rs3918290", "DPYD", "1", 97450058, "C", "T"),
+    ],
+}
+
+# (gene, chrom, start, end) per reference build, 1-based inclusive.
+GENE_REGIONS = {
+    "GRCh37": [
+        ("CYP2D6", "22", 42522501, 42526883),
+        ("CYP2C19", "10", 96522438, 96612671),
+        ("CYP2C9", "10", 96698415, 96749148),
+        ("SLCO1B1", "12", 21284128, 21392730),
+        ("TPMT", "6", 18128542, 18155305),
+        ("DPYD", "1", 97543299, 98386615),
+    ],
+    "GRCh38": [
+        ("CYP2D6", "22", 42126499, 42130881),
+        ("CYP2C19", "10", 94762681, 94855547),
+        ("CYP2C9", "10", 94938658, 94990091),
+        ("SLCO1B1", "12", 21131194, 21239796),
+        ("TPMT", "6", 18128311, 18155169),
+        ("DPYD", "1", 97077743, 97921049),
+    ],
+}
+
+BUILD_ALIASES = {
+    "grch37": "GRCh37",
+    "hg19": "GRCh37",
+    "b37": "GRCh37",
+    "hs37d5": "GRCh37",
+    "grch38": "GRCh38",
+    "hg38": "GRCh38",
+    "b38": "GRCh38",
+}
+
+# chr1 length differs between builds, so a ##contig line is enough to tell them apart.
+CHR1_LENGTHS = {
+    "249250621": "GRCh37",
+    "248956422": "GRCh38",
+}
+
+
+def normalize_chrom(chrom):
+    chrom = chrom.strip()
+    if chrom[:3].lower() == "chr":
+        chrom = chrom[3:]
+    if chrom == "M":
+        return "MT"
+    return chrom
+
+
+def _build_position_index(entries):
+    index = {}
+    for rsid, gene, chrom, pos, ref, alt in sorted(entries, key=lambda e: (e[2], e[3])):
+        positions, records = index.setdefault(chrom, ([], []))
+        positions.append(pos)
+        records.append((rsid, gene, ref, alt))
+    return index
+
+
+def _build_region_index(regions):
+    index = {}
+    for gene, chrom, start, end in sorted(regions, key=lambda r: (r[1], r[2])):
+        starts, ends, genes = index.setdefault(chrom, ([], [], []))
+        starts.append(start)
+        ends.append(end)
+        genes.append(gene)
+    return index
+
+
+POSITION_INDEX = {build: _build_position_index(v) for build, v in KNOWN_VARIANTS.items()}
+REGION_INDEX = {build: _build_region_index(v) for build, v in GENE_REGIONS.items()}
+
+
+def detect_build(header_lines):
+    for line in header_lines:
+        lowered = line.lower()
+        if lowered.startswith("##reference=") or lowered.startswith("##assembly="):
+            for alias, build in BUILD_ALIASES.items():
+                if alias in lowered:
+                    return build
+        elif lowered.startswith("##contig=<id=chr1,") or lowered.startswith("##contig=<id=1,"):
+            for field in line[10:].rstrip(">").split(","):
+                key, _, value = field.partition("=")
+                if key.strip().lower() == "length" and value.strip() in CHR1_LENGTHS:
+                    return CHR1_LENGTHS[value.strip()]
+                if key.strip().lower() == "assembly":
+                    build = BUILD_ALIASES.get(value.strip().lower())
+                    if build:
+                        return build
+    return None
+
+
+def find_gene_region(chrom, pos, build=DEFAULT_BUILD):
+    regions = REGION_INDEX.get(build, {}).get(chrom)
+    if not regions:
+        return None
+    starts, ends, genes = regions
+    # Pharmacogene regions do not overlap, so only the nearest start can cover pos.
+    i = bisect_right(starts, pos) - 1
+    if i >= 0 and pos <= ends[i]:
+        return genes[i]
+    return None
+
+
+def lookup_variant(chrom, pos, ref, alts, build=DEFAULT_BUILD):
+    """Return (rsid, gene, alt_index) for a known pharmacogenomic allele at the
+    given coordinates, or None. ``alts`` is the list of ALT alleles of the record
+    and alt_index is the 1-based allele number of the match within it."""
+    positions_index = POSITION_INDEX.get(build, {}).get(chrom)
+    if not positions_index:
+        return None
+    positions, records = positions_index
+    lo = bisect_left(positions, pos)
+    hi = bisect_right(positions, pos, lo)
+    for i in range(lo, hi):
+        rsid, gene, known_ref, known_alt = records[i]
+        if ref.upper() == known_ref and known_alt in alts:
+            return rsid, gene, alts.index(known_alt) + 1
+    return None
+
+
+def match_coordinates(chrom, pos, ref, alts, builds):
+    chrom = normalize_chrom(chrom)
+    for build in builds:
+        if find_gene_region(chrom, pos, build) is None:
+            continue
+        match = lookup_variant(chrom, pos, ref, alts, build)
+        if match:
+            return match
+    return None
@@ -1,3 +1,7 @@
+from services.domain import Variant, intern_str
+from services.rsid_catalog import get_catalog
+from services.variant_index import GENE_REGIONS, detect_build, match_coordinates
+
 SUPPORTED_RSIDS = {
     "rs3892097": "CYP2D6",
     "rs4244285": "CYP2C19",
@@ -15,54 +19,90 @@ def validate_vcf_header(content):
     return False
 
 
+def _remap_genotype(genotype, alt_index):
+    # Phenotype rules expect the pharmacogenomic allele as "1"; swap it in when
+    # the record is multi-allelic and the known ALT is listed later.
+    if alt_index == 1:
+        return genotype
+    alt = str(alt_index)
+    sep = "|" if "|" in genotype else "/"
+    alleles = ["1" if a == alt else alt if a == "1" else a for a in genotype.split(sep)]
+    return sep.join(alleles)
+
+
 def parse_vcf(file_stream):
     variants = []
     
-    try:
-        content = file_stream.read()
-        
-        if isinstance(content, bytes):
-            content = content.decode("utf-8")
+    content = file_stream.read()
+    
+    if isinstance(content, bytes):
+        content = content.decode("utf-8")
+    
+    if not validate_vcf_header(content):
+        raise ValueError("Invalid VCF format: missing ##fileformat=VCFv4.2 header")
+    
+    lines = content.split("\n")
+    
+    build = detect_build(line for line in lines if line.startswith("##"))
+    builds = [build] if build else list(GENE_REGIONS)
+    
+    catalog = get_catalog()
+    # Records whose ID is only found in the large on-disk catalog are
+    # resolved together after the scan and listed after the core panel
+    # variants, which keep driving the primary genotype per gene.
+    pending = []
+    
+    for line in lines:
+        if not line.strip() or line.startswith("#"):
+            continue
         
-        if not validate_vcf_header(content):
-            raise ValueError("Invalid VCF format: missing ##fileformat=VCFv4.2 header")
+        columns = line.strip().split("\t")
+        if len(columns) < 10:
+            continue
         
-        lines = content.split("\n")
+        rsid = columns[2].strip()
+        alt_index = 1
         
-        for line in lines:
-            if not line.strip() or line.startswith("#"):
-                continue
-            
-            columns = line.strip().split("\t")
-            if len(columns) < 10:
+        if rsid in SUPPORTED_RSIDS:
+            gene = SUPPORTED_RSIDS[rsid]
+        else:
+            try:
+                pos = int(columns[1])
+            except ValueError:
                 continue
-            
-            rsid = columns[2].strip()
-            
-            if rsid not in SUPPORTED_RSIDS:
+            match = match_coordinates(columns[0], pos, columns[3].strip(),
+                                      columns[4].strip().split(","), builds)
+            if match:
+                rsid, gene, alt_index = match
+            elif catalog is not None and rsid.startswith("rs"):
+                gene = None
+            else:
                 continue
-            
-            format_field = columns[8] if len(columns) > 8 else "GT"
-            sample_data = columns[9] if len(columns) > 9 else "."
-            
-            format_indices = format_field.split(":")
-            sample_values = sample_data.split(":")
-            
-            gt_index = format_indices.index("GT") if "GT" in format_indices else 0
-            genotype = sample_values[gt_index] if gt_index < len(sample_values) else "./."
-            
-            if genotype in ["./.", "./.", ""]:
-                continue
-            
-            variants.append({
-                "rsid": rsid,
-                "gene": SUPPORTED_RSIDS[rsid],
-                "genotype": genotype
-            })
+        
+        format_field = columns[8] if len(columns) > 8 else "GT"
+        sample_data = columns[9] if len(columns) > 9 else "."
+        
+        format_indices = format_field.split(":")
+        sample_values = sample_data.split(":")
+        
+        gt_index = format_indices.index("GT") if "GT" in format_indices else 0
+        genotype = sample_values[gt_index] if gt_index < len(sample_values) else "./."
+        
+        if genotype in ["./.", "./.", ""]:
+            continue
+        
+        rsid = intern_str(rsid)
+        genotype = intern_str(_remap_genotype(genotype, alt_index))
+        if gene is None:
+            pending.append((rsid, genotype))
+        else:
+            variants.append(Variant(rsid, gene, genotype))
     
-    except ValueError:
-        raise
-    except Exception as e:
-        return []
+    if pending:
+        genes = catalog.lookup_many([rsid for rsid, _ in pending])
+        for rsid, genotype in pending:
+            gene = genes.get(rsid)
+            if gene:
+                variants.append(Variant(rsid, intern_str(gene), genotype, annotation=True))
     
     return variants
@@ -0,0 +1,572 @@
+const MAX_FILE_SIZE = 5 * 1024 * 1024;
+
+const loadingMessages = [
+    'Parsing VCF file...',
+    'Identifying pharmacogenes...',
+    'Determining star alleles...',
+    'Applying CPIC guideline rules...',
+    'Assessing phenotype status...',
+    'Evaluating clinical risk...',
+    'Generating clinical explanation...'
+];
+
+let loadingMessageIndex = 0;
+let loadingMessageInterval = null;
+
+function startLoadingAnimation() {
+    const statusEl = document.getElementById('loaderStatus');
+    if (!statusEl) return;
+
+    loadingMessageIndex = 0;
+    statusEl.textContent = loadingMessages[loadingMessageIndex];
+
+    loadingMessageInterval = setInterval(() => {
+        const el = document.getElementById('loaderStatus');
+        if (!el) {
+            clearInterval(loadingMessageInterval);
+            return;
+        }
+
+        el.classList.add('fade');
+
+        setTimeout(() => {
+            loadingMessageIndex = (loadingMessageIndex + 1) % loadingMessages.length;
+            el.textContent = loadingMessages[loadingMessageIndex];
+            el.classList.remove('fade');
+        }, 400);
+
+    }, 1800);
+}
+
+function stopLoadingAnimation() {
+    if (loadingMessageInterval) {
+        clearInterval(loadingMessageInterval);
+        loadingMessageInterval = null;
+    }
+}
+
+const form = document.getElementById('analysisForm');
+const fileInput = document.getElementById('vcf_file');
+const fileName = document.getElementById('fileName');
+const fileSizeEl = document.getElementById('fileSize');
+const formContainer = document.getElementById('formContainer');
+const loading = document.getElementById('loading');
+const resultContainer = document.getElementById('resultContainer');
+const errorContainer = document.getElementById('errorContainer');
+const errorMessage = document.getElementById('errorMessage');
+const submitBtn = document.getElementById('submitBtn');
+
+let currentJsonData = null;
+
+function toggleSection(header) {
+    const section = header.parentElement;
+    section.classList.toggle('expanded');
+}
+
+function initializeCollapsibleSections() {
+    const sections = ['pgxProfileSection', 'clinicalRecSection', 'explanationSection', 'jsonSection'];
+    sections.forEach(id => {
+        const section = document.getElementById(id);
+        if (section) {
+            section.classList.remove('expanded');
+        }
+    });
+}
+
+function updateRiskSummaryBanner(riskLabel, severity, confidence, gene, phenotype) {
+    const banner = document.getElementById('riskSummaryBanner');
+    const label = document.getElementById('riskSummaryLabel');
+    const sevEl = document.getElementById('bannerSeverity');
+    const confEl = document.getElementById('bannerConfidence');
+    const confBar = document.getElementById('confidenceBar');
+    const contextRow = document.getElementById('riskContextRow');
+
+    banner.className = 'risk-summary-banner banner-' + riskLabel.toLowerCase().replace(' ', '');
+    label.innerHTML = getRiskIcon(riskLabel) + ' ' + riskLabel + ' RISK';
+
+    sevEl.textContent = severity.charAt(0).toUpperCase() + severity.slice(1);
+    sevEl.className = 'severity-' + severity;
+
+    const confValue = (confidence ?? 0).toFixed(2);
+    confEl.textContent = confValue;
+
+    if (gene || phenotype) {
+        contextRow.textContent = `Primary Gene: ${gene || 'N/A'} | Phenotype: ${phenotype || 'Unknown'}`;
+        contextRow.style.display = 'block';
+    } else {
+        contextRow.style.display = 'none';
+    }
+
+    confBar.className = 'confidence-bar bar-' + riskLabel.toLowerCase().replace(' ', '');
+    setTimeout(() => {
+        confBar.style.width = (confidence * 100) + '%';
+    }, 100);
+}
+
+function extractSummary(text) {
+    if (!text) return '';
+    const sentences = text.split(/[.!?]+/);
+    const summary = sentences.slice(0, 2).join('. ').trim();
+    return summary + (summary && !summary.endsWith('.') ? '.' : '');
+}
+
+function getRiskIcon(riskLabel) {
+    const safeIcon = '<svg viewBox="0 0 24 24" fill="currentColor"><path d="M12 2C6.48 2 2 6.48 2 12s4.48 10 10 10 10-4.48 10-10S17.52 2 12 2zm-2 15l-5-5 1.41-1.41L10 14.17l7.59-7.59L19 8l-9 9z"/></svg>';
+    const adjustIcon = '<svg viewBox="0 0 24 24" fill="currentColor"><path d="M1 21h22L12 2 1 21zm12-3h-2v-2h2v2zm0-4h-2v-4h2v4z"/></svg>';
+    const toxicIcon = '<svg viewBox="0 0 24 24" fill="currentColor"><path d="M12 2C6.48 2 2 6.48 2 12s4.48 10 10 10 10-4.48 10-10S17.52 2 12 2zm1 15h-2v-2h2v2zm0-4h-2V7h2v6z"/></svg>';
+    const unknownIcon = '<svg viewBox="0 0 24 24" fill="currentColor"><path d="M12 2C6.48 2 2 6.48 2 12s4.48 10 10 10 10-4.48 10-10S17.52 2 12 2zm1 15h-2v-6h2v6zm0-8h-2V7h2v2z"/></svg>';
+
+    const label = riskLabel.toLowerCase();
+    if (label === 'safe') return safeIcon;
+    if (label === 'adjust dosage') return adjustIcon;
+    if (label === 'toxic' || label === 'ineffective') return toxicIcon;
+    return unknownIcon;
+}
+
+function formatFileSize(bytes) {
+    if (bytes < 1024) return bytes + ' B';
+    if (bytes < 1024 * 1024) return (bytes / 1024).toFixed(1) + ' KB';
+    return (bytes / (1024 * 1024)).toFixed(2) + ' MB';
+}
+
+const fileUpload = document.getElementById('fileUpload');
+const fileValidationSuccess = document.getElementById('fileValidationSuccess');
+
+fileUpload.addEventListener('dragover', function(e) {
+    e.preventDefault();
+    this.classList.add('dragover');
+});
+
+fileUpload.addEventListener('dragleave', function(e) {
+    e.preventDefault();
+    this.classList.remove('dragover');
+});
+
+fileUpload.addEventListener('drop', function(e) {
+    e.preventDefault();
+    this.classList.remove('dragover');
+    if (e.dataTransfer.files.length > 0) {
+        fileInput.files = e.dataTransfer.files;
+        const event = new Event('change');
+        fileInput.dispatchEvent(event);
+    }
+});
+
+fileInput.addEventListener('change', function() {
+    if (this.files.length > 0) {
+        const file = this.files[0];
+        fileName.textContent = file.name;
+
+        const size = file.size;
+        fileSizeEl.textContent = 'Size: ' + formatFileSize(size);
+
+        if (size > MAX_FILE_SIZE) {
+            fileSizeEl.className = 'file-size error';
+            fileSizeEl.textContent += ' - File too large! Maximum is 5MB.';
+            submitBtn.disabled = true;
+            fileUpload.classList.remove('valid');
+            fileValidationSuccess.style.display = 'none';
+        } else if (size > MAX_FILE_SIZE * 0.8) {
+            fileSizeEl.className = 'file-size warning';
+            fileSizeEl.textContent += ' - Approaching size limit';
+            submitBtn.disabled = false;
+            fileUpload.classList.add('valid');
+            fileValidationSuccess.style.display = 'flex';
+        } else {
+            fileSizeEl.className = 'file-size';
+            submitBtn.disabled = false;
+            fileUpload.classList.add('valid');
+            fileValidationSuccess.style.display = 'flex';
+        }
+    } else {
+        fileName.textContent = '';
+        fileSizeEl.textContent = '';
+        submitBtn.disabled = false;
+        fileUpload.classList.remove('valid');
+        fileValidationSuccess.style.display = 'none';
+    }
+});
+
+const drugInput = document.getElementById('drug_input');
+drugInput.addEventListener('input', function() {
+    this.value = this.value.toUpperCase();
+});
+
+form.addEventListener('submit', async function(e) {
+    e.preventDefault();
+
+    const drugInput = document.getElementById('drug_input');
+    const finalDrug = drugInput.value.trim();
+
+    if (!finalDrug) {
+        showError('Please enter at least one drug');
+        return;
+    }
+
+    if (fileInput.files.length > 0 && fileInput.files[0].size > MAX_FILE_SIZE) {
+        showError('File too large. Maximum size is 5MB.');
+        return;
+    }
+
+    const formData = new FormData();
+    formData.append('patient_id', document.getElementById('patient_id').value);
+    formData.append('drug_input', finalDrug);
+    formData.append('vcf_file', fileInput.files[0]);
+
+    formContainer.style.display = 'none';
+    resultContainer.style.display = 'none';
+    errorContainer.style.display = 'none';
+    loading.classList.add('active');
+    startLoadingAnimation();
+    submitBtn.disabled = true;
+
+    try {
+        // Streamed: the deterministic report arrives at once, each drug's
+        // explanation follows as its LLM call finishes.
+        const response = await fetch('/analyze?stream=ndjson', {
+            method: 'POST',
+            headers: { 'Accept': 'application/x-ndjson' },
+            body: formData
+        });
+
+        if (!response.ok) {
+            const data = await response.json().catch(() => ({}));
+            stopLoadingAnimation();
+            loading.classList.remove('active');
+            submitBtn.disabled = false;
+            errorContainer.style.display = 'block';
+            let errorText = data.error || 'An error occurred';
+            if (data.error_code) {
+                errorText += '<div class="error-code">Error code: ' + data.error_code + '</div>';
+            }
+            errorMessage.innerHTML = errorText;
+            formContainer.style.display = 'block';
+            return;
+        }
+
+        await readAnalysisStream(response, handleStreamEvent);
+        if (loading.classList.contains('active')) {
+            throw new Error('the analysis stream ended without a report');
+        }
+        submitBtn.disabled = false;
+
+    } catch (error) {
+        stopLoadingAnimation();
+        loading.classList.remove('active');
+        submitBtn.disabled = false;
+        errorContainer.style.display = 'block';
+        errorMessage.innerHTML = 'Network error: ' + error.message + '<div class="error-code">Error code: NETWORK_ERROR</div>';
+        formContainer.style.display = 'block';
+    }
+});
+
+async function readAnalysisStream(response, onEvent) {
+    if (!response.body || !response.body.getReader) {
+        const text = await response.text();
+        text.split('\n').filter(line => line.trim()).forEach(line => onEvent(JSON.parse(line)));
+        return;
+    }
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { done, value } = await reader.read();
+        buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+        let newline;
+        while ((newline = buffer.indexOf('\n')) >= 0) {
+            const line = buffer.slice(0, newline).trim();
+            buffer = buffer.slice(newline + 1);
+            if (line) {
+                onEvent(JSON.parse(line));
+            }
+        }
+        if (done) {
+            break;
+        }
+    }
+    if (buffer.trim()) {
+        onEvent(JSON.parse(buffer));
+    }
+}
+
+function handleStreamEvent(message) {
+    if (message.event === 'report') {
+        stopLoadingAnimation();
+        loading.classList.remove('active');
+        displayResult(message.data);
+    } else if (message.event === 'explanation' && currentJsonData) {
+        const explanation = { summary: message.data.summary };
+        if (currentJsonData.drug_analyses) {
+            currentJsonData.drug_analyses[message.data.index].llm_generated_explanation = explanation;
+        } else {
+            currentJsonData.llm_generated_explanation = explanation;
+        }
+        displayResult(currentJsonData, true);
+    } else if (message.event === 'complete') {
+        displayResult(message.data.report, true);
+    }
+}
+
+function showError(message) {
+    errorContainer.style.display = 'block';
+    errorMessage.innerHTML = message;
+    formContainer.style.display = 'block';
+}
+
+function displayResult(data, refresh) {
+    resultContainer.style.display = 'block';
+    currentJsonData = data;
+    if (!refresh) {
+        initializeCollapsibleSections();
+    }
+
+    document.getElementById('resPatientId').textContent = data.patient_id || 'N/A';
+    document.getElementById('resDrug').textContent = data.drug || 'N/A';
+    document.getElementById('resTimestamp').textContent = data.timestamp || 'N/A';
+
+    if (data.drug_analyses && data.drug_analyses.length > 0) {
+        displayMultiDrugResults(data);
+    } else {
+        displaySingleDrugResult(data);
+    }
+
+    document.getElementById('resJson').textContent = JSON.stringify(data, null, 2);
+}
+
+function displaySingleDrugResult(data) {
+    document.getElementById('multiDrugSection').style.display = 'none';
+    document.getElementById('pgxProfileSection').style.display = 'block';
+    document.getElementById('clinicalRecSection').style.display = 'block';
+    document.getElementById('explanationSection').style.display = 'block';
+    document.getElementById('jsonSection').style.display = 'block';
+
+    const riskLabel = data.risk_assessment?.risk_label || 'Unknown';
+    const severity = data.risk_assessment?.severity || 'none';
+    const confidence = data.risk_assessment?.confidence_score ?? 0;
+    const gene = data.pharmacogenomic_profile?.primary_gene || '';
+    const phenotype = data.pharmacogenomic_profile?.phenotype || '';
+
+    updateRiskSummaryBanner(riskLabel, severity, confidence, gene, phenotype);
+
+    document.getElementById('resGene').textContent = 
+        data.pharmacogenomic_profile?.primary_gene || '';
+    document.getElementById('resPhenotype').textContent = 
+        data.pharmacogenomic_profile?.phenotype || '';
+
+    const diplotype = data.pharmacogenomic_profile?.diplotype;
+    document.getElementById('resDiplotype').textContent = diplotype || '';
+
+    const variants = data.pharmacogenomic_profile?.detected_variants || [];
+    document.getElementById('resVariants').textContent = 
+        variants.length > 0 ? variants.map(v => v.rsid).join(', ') : '';
+
+    document.getElementById('resAction').textContent = 
+        data.clinical_recommendation?.action || '';
+    document.getElementById('resDose').textContent = 
+        data.clinical_recommendation?.dose_adjustment || '';
+    document.getElementById('resMonitoring').textContent = 
+        data.clinical_recommendation?.monitoring || '';
+
+    const fullExplanation = data.llm_generated_explanation?.summary || '';
+    document.getElementById('resExplanationSummary').textContent = 'Clinical Summary: ' + extractSummary(fullExplanation);
+    document.getElementById('resExplanationFull').textContent = fullExplanation;
+}
+
+function displayMultiDrugResults(data) {
+    const multiSection = document.getElementById('multiDrugSection');
+    const multiContainer = document.getElementById('multiDrugResults');
+    const pgxSection = document.getElementById('pgxProfileSection');
+    const clinicalSection = document.getElementById('clinicalRecSection');
+
+    multiSection.style.display = 'block';
+    pgxSection.style.display = 'none';
+    clinicalSection.style.display = 'none';
+
+    const riskLabel = data.risk_assessment?.risk_label || 'Unknown';
+    const severity = data.risk_assessment?.severity || 'none';
+    const confidence = data.risk_assessment?.confidence_score ?? 0;
+
+    updateRiskSummaryBanner(riskLabel, severity, confidence, '', '');
+
+    const fullExplanation = data.llm_generated_explanation?.summary || '';
+    document.getElementById('resExplanationSummary').textContent = 'Clinical Summary: ' + extractSummary(fullExplanation);
+    document.getElementById('resExplanationFull').textContent = fullExplanation;
+
+    let html = '';
+    data.drug_analyses.forEach((analysis, index) => {
+        const drugRiskLabel = analysis.risk_assessment?.risk_label || 'Unknown';
+        const drugSeverity = analysis.risk_assessment?.severity || 'none';
+        const diplotype = analysis.pharmacogenomic_profile?.diplotype;
+
+        let diplotypeHtml = '';
+        if (diplotype) {
+            diplotypeHtml = `
+                <div class="result-item">
+                    <span class="result-label">Diplotype:</span>
+                    <span class="result-value">${diplotype}</span>
+                </div>
+            `;
+        }
+
+        html += `
+            <div class="drug-card">
+                <h4>${analysis.drug}</h4>
+                <div class="result-item">
+                    <span class="result-label">Gene:</span>
+                    <span class="result-value">${analysis.pharmacogenomic_profile?.primary_gene || ''}</span>
+                </div>
+                <div class="result-item">
+                    <span class="result-label">Phenotype:</span>
+                    <span class="result-value">${analysis.pharmacogenomic_profile?.phenotype || ''}</span>
+                </div>
+                ${diplotypeHtml}
+                <div class="result-item">
+                    <span class="result-label">Risk:</span>
+                    <span class="result-value"><span class="risk-badge risk-${drugRiskLabel.toLowerCase().replace(' ', '')}">${getRiskIcon(drugRiskLabel)} ${drugRiskLabel}</span></span>
+                </div>
+                <div class="result-item">
+                    <span class="result-label">Severity:</span>
+                    <span class="result-value severity-${drugSeverity}">${drugSeverity.charAt(0).toUpperCase() + drugSeverity.slice(1)}</span>
+                </div>
+                <div class="result-item">
+                    <span class="result-label">Confidence:</span>
+                    <span class="result-value">${(analysis.risk_assessment?.confidence_score ?? 0).toFixed(2)}</span>
+                </div>
+                <div class="result-item">
+                    <span class="result-label">Action:</span>
+                    <span class="result-value">${analysis.clinical_recommendation?.action || ''}</span>
+                </div>
+                <div class="result-item" style="margin-top: 10px;">
+                    <span class="result-label">Explanation:</span>
+                    <span class="result-value">${analysis.llm_generated_explanation?.summary || ''}</span>
+                </div>
+            </div>
+        `;
+    });
+
+    multiContainer.innerHTML = html;
+}
+
+function downloadJson() {
+    if (!currentJsonData) return;
+
+    const blob = new Blob([JSON.stringify(currentJsonData, null, 2)], { type: 'application/json' });
+    const url = URL.createObjectURL(blob);
+    const a = document.createElement('a');
+    a.href = url;
+    a.download = 'pharmacogenomics_result.json';
+    document.body.appendChild(a);
+    a.click();
+    document.body.removeChild(a);
+    URL.revokeObjectURL(url);
+
+    showToast('JSON downloaded successfully');
+}
+
+function copyToClipboard() {
+    if (!currentJsonData) return;
+
+    const jsonString = JSON.stringify(currentJsonData, null, 2);
+
+    if (navigator.clipboard && window.isSecureContext) {
+        navigator.clipboard.writeText(jsonString).then(() => {
+            const btn = document.getElementById('copyBtn');
+            btn.textContent = 'Copied!';
+            btn.classList.add('copied');
+            showToast('Copied to clipboard');
+
+            setTimeout(() => {
+                btn.textContent = 'Copy to Clipboard';
+                btn.classList.remove('copied');
+            }, 2000);
+        }).catch(err => {
+            fallbackCopy(jsonString);
+        });
+    } else {
+        fallbackCopy(jsonString);
+    }
+}
+
+function fallbackCopy(text) {
+    const textArea = document.createElement('textarea');
+    textArea.value = text;
+    textArea.style.position = 'fixed';
+    textArea.style.left = '-999999px';
+    textArea.style.top = '-999999px';
+    document.body.appendChild(textArea);
+    textArea.focus();
+    textArea.select();
+
+    try {
+        document.execCommand('copy');
+        const btn = document.getElementById('copyBtn');
+        btn.textContent = 'Copied!';
+        btn.classList.add('copied');
+        showToast('Copied to clipboard');
+
+        setTimeout(() => {
+            btn.textContent = 'Copy to Clipboard';
+            btn.classList.remove('copied');
+        }, 2000);
+    } catch (err) {
+        showToast('Failed to copy');
+    }
+
+    document.body.removeChild(textArea);
+}
+
+function showToast(message) {
+    const toast = document.createElement('div');
+    toast.className = 'toast';
+    toast.textContent = message;
+    document.body.appendChild(toast);
+
+    setTimeout(() => toast.classList.add('show'), 10);
+
+    setTimeout(() => {
+        toast.classList.remove('show');
+        setTimeout(() => document.body.removeChild(toast), 300);
+    }, 3000);
+}
+
+function toggleTheme() {
+    const html = document.documentElement;
+    const currentTheme = html.getAttribute('data-theme');
+    const newTheme = currentTheme === 'dark' ? 'light' : 'dark';
+
+    if (newTheme === 'dark') {
+        html.setAttribute('data-theme', 'dark');
+    } else {
+        html.removeAttribute('data-theme');
+    }
+
+    localStorage.setItem('theme', newTheme);
+    updateThemeToggleUI(newTheme);
+}
+
+function updateThemeToggleUI(theme) {
+    const toggle = document.getElementById('themeToggle');
+    const sunIcon = toggle.querySelector('.sun-icon');
+    const moonIcon = toggle.querySelector('.moon-icon');
+    const label = toggle.querySelector('.theme-label');
+
+    if (theme === 'dark') {
+        sunIcon.style.display = 'none';
+        moonIcon.style.display = 'block';
+        label.textContent = 'Light';
+    } else {
+        sunIcon.style.display = 'block';
+        moonIcon.style.display = 'none';
+        label.textContent = 'Dark';
+    }
+}
+
+function initTheme() {
+    const savedTheme = localStorage.getItem('theme') || 'light';
+    if (savedTheme === 'dark') {
+        document.documentElement.setAttribute('data-theme', 'dark');
+    }
+    updateThemeToggleUI(savedTheme);
+}
+
+initTheme();
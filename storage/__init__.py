@@ -0,0 +1,33 @@
+"""Persistence backends behind the models in models.py.
+
+``mongo`` (the default) keeps every collection in MongoDB; ``sqlite`` keeps
+them in one embedded database file, for single-node installs and CI that run
+without a MongoDB server. Both backends expose the same methods, grouped by
+collection, and return documents in the same shape."""
+from storage.mongo import MongoStorage
+from storage.sqlite import SQLiteStorage
+
+_storage = None
+
+
+def create_storage(config):
+    name = config.get("STORAGE_BACKEND") or "mongo"
+    if name == "mongo":
+        return MongoStorage(config)
+    if name == "sqlite":
+        return SQLiteStorage(config.get("SQLITE_PATH") or "data/pharmaguard.sqlite3",
+                             config.get("IDEMPOTENCY_TTL_S") or 86400)
+    raise ValueError(f"Unknown storage backend: {name}")
+
+
+def configure_storage(config):
+    global _storage
+    _storage = create_storage(config)
+    return _storage
+
+
+def get_storage():
+    if _storage is None:
+        from config import Config
+        configure_storage({key: getattr(Config, key) for key in dir(Config) if key.isupper()})
+    return _storage
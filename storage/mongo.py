@@ -0,0 +1,391 @@
+import os
+import re
+import threading
+from bson import ObjectId
+
+
+class MongoStorage:
+    """The default backend: every collection lives in MongoDB.
+
+    The client is created lazily, per process, on first use: a MongoClient
+    inherited across fork() is not safe to use in the child."""
+
+    def __init__(self, settings):
+        self.settings = {key: value for key, value in settings.items() if key.startswith('MONGO_')}
+        self.client = None
+        self.db = None
+        self.read_db = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._pool_metrics = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self.client = None
+        self.db = None
+        self.read_db = None
+        self._pid = None
+        if self._pool_metrics is not None:
+            self._pool_metrics.reset()
+
+    def _client_options(self):
+        settings = self.settings
+        options = {
+            'maxPoolSize': settings.get('MONGO_MAX_POOL_SIZE'),
+            'minPoolSize': settings.get('MONGO_MIN_POOL_SIZE'),
+            'maxIdleTimeMS': settings.get('MONGO_MAX_IDLE_TIME_MS'),
+            'connectTimeoutMS': settings.get('MONGO_CONNECT_TIMEOUT_MS'),
+            'serverSelectionTimeoutMS': settings.get('MONGO_SERVER_SELECTION_TIMEOUT_MS'),
+            'socketTimeoutMS': settings.get('MONGO_SOCKET_TIMEOUT_MS'),
+            'waitQueueTimeoutMS': settings.get('MONGO_WAIT_QUEUE_TIMEOUT_MS'),
+        }
+        options = {key: value for key, value in options.items() if value is not None}
+        if settings.get('MONGO_COMPRESSORS'):
+            options['compressors'] = settings['MONGO_COMPRESSORS']
+        return options
+
+    def get_db(self):
+        pid = os.getpid()
+        if self.db is not None and self._pid == pid:
+            return self.db
+
+        with self._lock:
+            if self.db is None or self._pid != pid:
+                mongo_uri = self.settings.get('MONGO_URI')
+                if not mongo_uri:
+                    return None
+                # pymongo is imported here rather than at module level to keep it
+                # off the cold-start path for requests that never touch the DB.
+                from pymongo import MongoClient
+                from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+                from utils.mongo_metrics import PoolMetricsListener
+                if self._pool_metrics is None:
+                    self._pool_metrics = PoolMetricsListener()
+                self.client = MongoClient(mongo_uri, event_listeners=[self._pool_metrics], **self._client_options())
+                self.db = self.client.get_database()
+                mode = read_pref_mode_from_name(self.settings.get('MONGO_READ_PREFERENCE') or 'primary')
+                self.read_db = self.client.get_database(read_preference=make_read_preference(mode, None))
+                self._pid = pid
+        return self.db
+
+    def get_read_db(self):
+        self.get_db()
+        return self.read_db
+
+    def metrics(self):
+        metrics = self._pool_metrics.snapshot() if self._pool_metrics is not None else {}
+        metrics['backend'] = 'mongo'
+        metrics['pid'] = os.getpid()
+        metrics['max_pool_size'] = self.settings.get('MONGO_MAX_POOL_SIZE')
+        metrics['connected'] = self.db is not None and self._pid == os.getpid()
+        return metrics
+
+    # users
+
+    def insert_user(self, doc):
+        return self.get_db().users.insert_one(doc).inserted_id
+
+    def find_user_by_email(self, email):
+        return self.get_db().users.find_one({'email': email})
+
+    def find_user_by_id(self, user_id):
+        try:
+            return self.get_db().users.find_one({'_id': ObjectId(user_id)})
+        except Exception:
+            return None
+
+    def update_user(self, user_id, fields):
+        try:
+            self.get_db().users.update_one({'_id': ObjectId(user_id)}, {'$set': fields})
+        except Exception:
+            pass
+
+    # api_tokens
+
+    def insert_api_token(self, doc):
+        self.get_db().api_tokens.insert_one(doc)
+
+    def find_api_token(self, token_id):
+        return self.get_db().api_tokens.find_one({'_id': token_id})
+
+    def list_api_tokens(self, user_id):
+        return list(self.get_db().api_tokens.find({'user_id': user_id}, {'digest': 0}).sort('created_at', -1))
+
+    def revoke_api_token(self, token_id, user_id, revoked_at):
+        result = self.get_db().api_tokens.update_one(
+            {'_id': token_id, 'user_id': user_id, 'revoked_at': None},
+            {'$set': {'revoked_at': revoked_at}}
+        )
+        return result.modified_count > 0
+
+    # scans
+
+    # List views only render summary fields; leave the report body on the server.
+    LIST_PROJECTION = {'result_json': 0}
+
+    EXPORT_PROJECTION = {
+        '_id': 1, 'patient_id': 1, 'drugs': 1, 'overall_risk_label': 1, 'severity': 1,
+        'confidence_score': 1, 'primary_gene': 1, 'phenotype': 1, 'created_at': 1,
+        'result_json': 1, 'explanation_refs': 1, 'archived': 1
+    }
+
+    @staticmethod
+    def _scan_query(user_id, patient_prefix='', risk_label='', drug_prefix=''):
+        # Filters run as anchored, case-sensitive prefix regexes on the
+        # lower-cased copies, which MongoDB can answer from an index.
+        query = {'user_id': user_id}
+        if patient_prefix:
+            query['patient_id_lc'] = {'$regex': '^' + re.escape(patient_prefix)}
+        if risk_label:
+            query['overall_risk_label'] = risk_label
+        if drug_prefix:
+            query['drugs_lc'] = {'$regex': '^' + re.escape(drug_prefix)}
+        return query
+
+    @staticmethod
+    def _outdated_query(rules_version):
+        # Scans saved before versioning have no rules_version at all.
+        return {'$or': [{'rules_version': {'$lt': rules_version}}, {'rules_version': None}]}
+
+    def insert_scan(self, doc):
+        return str(self.get_db().scans.insert_one(doc).inserted_id)
+
+    def insert_scans(self, docs):
+        result = self.get_db().scans.insert_many(docs, ordered=False)
+        return [str(scan_id) for scan_id in result.inserted_ids]
+
+    def find_scans(self, user_id, patient_prefix='', risk_label='', drug_prefix='', limit=None, skip=0):
+        query = self._scan_query(user_id, patient_prefix, risk_label, drug_prefix)
+        cursor = self.get_read_db().scans.find(query, self.LIST_PROJECTION).sort('created_at', -1)
+        if limit:
+            cursor = cursor.skip(skip).limit(limit)
+        return list(cursor)
+
+    def find_scan(self, scan_id, user_id):
+        try:
+            return self.get_db().scans.find_one({'_id': ObjectId(scan_id), 'user_id': user_id})
+        except Exception:
+            return None
+
+    def count_scans(self, user_id):
+        return self.get_read_db().scans.count_documents({'user_id': user_id})
+
+    def suggest_patients(self, user_id, prefix, limit=10):
+        # Walk the (user_id, patient_id_lc) index one distinct value at a time:
+        # each step is a single index seek, however many scans a patient has.
+        scans = self.get_read_db().scans
+        pattern = '^' + re.escape(prefix)
+        suggestions = []
+        last = None
+        while len(suggestions) < limit:
+            condition = {'$regex': pattern}
+            if last is not None:
+                condition['$gt'] = last
+            doc = scans.find_one(
+                {'user_id': user_id, 'patient_id_lc': condition},
+                {'_id': 0, 'patient_id': 1, 'patient_id_lc': 1},
+                sort=[('patient_id_lc', 1)]
+            )
+            if not doc:
+                break
+            last = doc['patient_id_lc']
+            suggestions.append(doc.get('patient_id', last))
+        return suggestions
+
+    def iter_export_scans(self, user_id, patient_prefix='', risk_label='', drug_prefix='',
+                          date_from=None, date_to=None, batch_size=500):
+        query = self._scan_query(user_id, patient_prefix, risk_label, drug_prefix)
+        if date_from or date_to:
+            query['created_at'] = {}
+            if date_from:
+                query['created_at']['$gte'] = date_from
+            if date_to:
+                query['created_at']['$lt'] = date_to
+        return (self.get_read_db().scans
+                .find(query, self.EXPORT_PROJECTION)
+                .sort('created_at', -1)
+                .batch_size(batch_size))
+
+    def find_scans_missing_search_fields(self, limit):
+        return list(self.get_db().scans.find({'patient_id_lc': {'$exists': False}},
+                                             {'patient_id': 1, 'drugs': 1}).limit(limit))
+
+    def find_scans_with_inline_explanations(self, limit):
+        return list(self.get_db().scans.find({'explanation_refs': {'$ne': True}}, {'result_json': 1}).limit(limit))
+
+    def update_scans(self, updates):
+        """Apply (scan_id, fields) pairs in one unordered bulk write."""
+        from pymongo import UpdateOne
+        if updates:
+            self.get_db().scans.bulk_write([
+                UpdateOne({'_id': scan_id}, {'$set': fields}) for scan_id, fields in updates
+            ], ordered=False)
+
+    def find_outdated_scans(self, rules_version, after_id=None, limit=500):
+        query = self._outdated_query(rules_version)
+        if after_id is not None:
+            query['_id'] = {'$gt': after_id}
+        return list(self.get_read_db().scans
+                    .find(query, {'result_json': 1, 'gene_calls': 1, 'archived': 1})
+                    .sort('_id', 1)
+                    .limit(limit))
+
+    def count_outdated_scans(self, rules_version):
+        return self.get_read_db().scans.count_documents(self._outdated_query(rules_version))
+
+    def update_outdated_scans(self, updates, rules_version):
+        # Guarded by the version so a concurrent newer run is never overwritten.
+        from pymongo import UpdateOne
+        if updates:
+            self.get_db().scans.bulk_write([
+                UpdateOne({'_id': scan_id, **self._outdated_query(rules_version)}, {'$set': fields})
+                for scan_id, fields in updates
+            ], ordered=False)
+
+    # scan_archive
+
+    def find_scans_to_archive(self, cutoff, limit):
+        return list(self.get_db().scans.find(
+            {'created_at': {'$lt': cutoff}, 'archived': {'$ne': True}},
+            {'user_id': 1, 'result_json': 1, 'gene_calls': 1, 'explanation_refs': 1}
+        ).limit(limit))
+
+    def archive_scans(self, entries, archived_at):
+        # The body is stored before the hot document is stubbed, so an
+        # interrupted run at worst re-archives a batch. Entries without a body
+        # (data None) only stub the document.
+        from bson import Binary
+        from pymongo import UpdateOne
+        db = self.get_db()
+        blobs = [
+            UpdateOne({'_id': scan_id},
+                      {'$set': {'user_id': user_id, 'data': Binary(data), 'archived_at': archived_at}},
+                      upsert=True)
+            for scan_id, user_id, data in entries if data is not None
+        ]
+        if blobs:
+            db.scan_archive.bulk_write(blobs, ordered=False)
+        db.scans.bulk_write([
+            UpdateOne({'_id': scan_id}, {
+                '$set': {'archived': True, 'archived_at': archived_at},
+                '$unset': {'result_json': '', 'gene_calls': ''}
+            })
+            for scan_id, _, _ in entries
+        ], ordered=False)
+
+    def find_archived(self, scan_ids):
+        ids = []
+        for scan_id in scan_ids:
+            try:
+                ids.append(ObjectId(scan_id))
+            except Exception:
+                continue
+        return {str(doc['_id']): bytes(doc['data'])
+                for doc in self.get_db().scan_archive.find({'_id': {'$in': ids}})}
+
+    # explanations
+
+    def insert_explanations(self, texts, created_at):
+        from pymongo import UpdateOne
+        self.get_db().explanations.bulk_write([
+            UpdateOne({'_id': ref}, {'$setOnInsert': {'text': text, 'created_at': created_at}}, upsert=True)
+            for ref, text in texts.items()
+        ], ordered=False)
+
+    def find_explanations(self, refs):
+        return {doc['_id']: doc['text'] for doc in self.get_db().explanations.find({'_id': {'$in': list(refs)}})}
+
+    # patient_profiles
+
+    def save_profile(self, user_id, patient_id, genes, rules_version, now):
+        self.get_db().patient_profiles.update_one(
+            {'user_id': user_id, 'patient_id': patient_id},
+            {
+                '$set': {
+                    'genes': genes,
+                    'rules_version': rules_version,
+                    'updated_at': now
+                },
+                '$setOnInsert': {'created_at': now}
+            },
+            upsert=True
+        )
+
+    def save_profiles(self, profiles, rules_version, now):
+        from pymongo import UpdateOne
+        if not profiles:
+            return
+        self.get_db().patient_profiles.bulk_write([
+            UpdateOne({'user_id': user_id, 'patient_id': patient_id},
+                      {'$set': {'genes': genes, 'rules_version': rules_version, 'updated_at': now},
+                       '$setOnInsert': {'created_at': now}},
+                      upsert=True)
+            for user_id, patient_id, genes in profiles
+        ], ordered=False)
+
+    def find_profile(self, user_id, patient_id):
+        return self.get_db().patient_profiles.find_one(
+            {'user_id': user_id, 'patient_id': patient_id},
+            {'genes': 1, 'rules_version': 1}
+        )
+
+    # jobs
+
+    def find_job(self, job_id):
+        return self.get_db().jobs.find_one({'_id': job_id})
+
+    def save_job(self, job):
+        self.get_db().jobs.replace_one({'_id': job['_id']}, job, upsert=True)
+
+    def update_job(self, job_id, fields, increments=None):
+        """Set fields (and add increments) on a job; returns the updated job."""
+        from pymongo import ReturnDocument
+        update = {'$set': fields}
+        if increments:
+            update['$inc'] = increments
+        return self.get_db().jobs.find_one_and_update({'_id': job_id}, update,
+                                                      return_document=ReturnDocument.AFTER)
+
+    # idempotency
+
+    def insert_idempotency(self, doc):
+        """False when the key is already taken."""
+        from pymongo.errors import DuplicateKeyError
+        try:
+            self.get_db().idempotency.insert_one(doc)
+            return True
+        except DuplicateKeyError:
+            return False
+
+    def find_idempotency(self, key):
+        return self.get_db().idempotency.find_one({'_id': key})
+
+    def renew_idempotency_lease(self, key, locked_until, new_locked_until):
+        taken = self.get_db().idempotency.update_one(
+            {'_id': key, 'status': 'in_progress', 'locked_until': locked_until},
+            {'$set': {'locked_until': new_locked_until}}
+        )
+        return taken.modified_count > 0
+
+    def complete_idempotency(self, key, response, completed_at):
+        self.get_db().idempotency.update_one({'_id': key}, {'$set': {
+            'status': 'completed',
+            'response': response,
+            'completed_at': completed_at
+        }})
+
+    def release_idempotency(self, key):
+        self.get_db().idempotency.delete_one({'_id': key, 'status': 'in_progress'})
+
+    def ensure_indexes(self, idempotency_ttl_s=86400):
+        db = self.get_db()
+        db.scans.create_index([('user_id', 1), ('created_at', -1)])
+        db.scans.create_index([('user_id', 1), ('patient_id_lc', 1), ('created_at', -1)])
+        db.scans.create_index([('user_id', 1), ('drugs_lc', 1), ('created_at', -1)])
+        db.scans.create_index([('user_id', 1), ('overall_risk_label', 1), ('created_at', -1)])
+        db.scans.create_index([('rules_version', 1), ('_id', 1)])
+        db.scans.create_index([('archived', 1), ('created_at', 1)])
+        db.patient_profiles.create_index([('user_id', 1), ('patient_id', 1)], unique=True)
+        db.api_tokens.create_index([('user_id', 1), ('created_at', -1)])
+        db.idempotency.create_index('created_at', expireAfterSeconds=idempotency_ttl_s)
@@ -0,0 +1,572 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from bson import ObjectId
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    email TEXT NOT NULL UNIQUE,
+    name TEXT,
+    password_hash TEXT,
+    role TEXT,
+    created_at TEXT,
+    last_login TEXT
+);
+CREATE TABLE IF NOT EXISTS api_tokens (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    name TEXT,
+    scopes TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    created_at TEXT,
+    expires_at TEXT,
+    revoked_at TEXT
+);
+CREATE INDEX IF NOT EXISTS api_tokens_user ON api_tokens (user_id, created_at DESC);
+CREATE TABLE IF NOT EXISTS scans (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    patient_id TEXT,
+    drugs TEXT,
+    patient_id_lc TEXT,
+    drugs_lc TEXT,
+    overall_risk_label TEXT,
+    severity TEXT,
+    confidence_score REAL,
+    primary_gene TEXT,
+    phenotype TEXT,
+    rules_version INTEGER,
+    result_json TEXT,
+    explanation_refs INTEGER,
+    gene_calls TEXT,
+    created_at TEXT NOT NULL,
+    rescored_at TEXT,
+    archived INTEGER,
+    archived_at TEXT
+);
+CREATE INDEX IF NOT EXISTS scans_user_created ON scans (user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS scans_user_patient ON scans (user_id, patient_id_lc, created_at DESC);
+CREATE INDEX IF NOT EXISTS scans_user_risk ON scans (user_id, overall_risk_label, created_at DESC);
+CREATE INDEX IF NOT EXISTS scans_rules_version ON scans (rules_version, id);
+CREATE TABLE IF NOT EXISTS scan_archive (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    data BLOB NOT NULL,
+    archived_at TEXT
+);
+CREATE TABLE IF NOT EXISTS explanations (
+    ref TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    created_at TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS patient_profiles (
+    user_id TEXT NOT NULL,
+    patient_id TEXT NOT NULL,
+    genes TEXT,
+    rules_version INTEGER,
+    created_at TEXT,
+    updated_at TEXT,
+    PRIMARY KEY (user_id, patient_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    doc TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS idempotency (
+    key TEXT PRIMARY KEY,
+    user_id TEXT,
+    fingerprint TEXT,
+    status TEXT NOT NULL,
+    response TEXT,
+    created_at TEXT NOT NULL,
+    locked_until TEXT,
+    completed_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idempotency_created ON idempotency (created_at);
+"""
+
+# Columns stored as JSON text, and columns holding datetimes (ISO 8601 text,
+# which sorts chronologically).
+JSON_COLUMNS = {'drugs_lc', 'result_json', 'gene_calls', 'scopes', 'genes', 'response'}
+DATETIME_COLUMNS = {'created_at', 'last_login', 'expires_at', 'revoked_at', 'rescored_at',
+                    'updated_at', 'locked_until', 'completed_at', 'archived_at'}
+BOOLEAN_COLUMNS = {'explanation_refs', 'archived'}
+
+SCAN_COLUMNS = ('user_id', 'patient_id', 'drugs', 'patient_id_lc', 'drugs_lc', 'overall_risk_label',
+                'severity', 'confidence_score', 'primary_gene', 'phenotype', 'rules_version',
+                'result_json', 'explanation_refs', 'gene_calls', 'created_at', 'rescored_at',
+                'archived', 'archived_at')
+SCAN_LIST_COLUMNS = ', '.join(['id'] + [c for c in SCAN_COLUMNS if c not in ('result_json', 'gene_calls')])
+SCAN_EXPORT_COLUMNS = ('id, patient_id, drugs, overall_risk_label, severity, confidence_score, '
+                       'primary_gene, phenotype, created_at, result_json, explanation_refs, archived')
+
+INSERT_SCAN = "INSERT INTO scans (id, %s) VALUES (?, %s)" % (
+    ', '.join(SCAN_COLUMNS), ', '.join('?' * len(SCAN_COLUMNS)))
+OUTDATED = "(rules_version IS NULL OR rules_version < ?)"
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return {'$date': value.isoformat()}
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _json_hook(value):
+    if len(value) == 1 and '$date' in value:
+        return datetime.fromisoformat(value['$date'])
+    return value
+
+
+def dumps(value):
+    return json.dumps(value, separators=(',', ':'), default=_json_default)
+
+
+def loads(text):
+    return json.loads(text, object_hook=_json_hook)
+
+
+def _column_value(column, value):
+    if value is None:
+        return None
+    if column in JSON_COLUMNS:
+        return dumps(value)
+    if column in DATETIME_COLUMNS:
+        return value.isoformat()
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+def _document(row, id_field='id'):
+    # Rows come back in the same shape the MongoDB backend returns documents.
+    doc = {}
+    for column in row.keys():
+        value = row[column]
+        if value is not None:
+            if column in JSON_COLUMNS:
+                value = loads(value)
+            elif column in DATETIME_COLUMNS:
+                value = datetime.fromisoformat(value)
+        doc['_id' if column == id_field else column] = value
+    for column in BOOLEAN_COLUMNS & doc.keys():
+        doc[column] = bool(doc[column])
+    return doc
+
+
+def _prefix_range(prefix):
+    # A key range rather than LIKE, so the (user_id, column) index is used.
+    return prefix, prefix + '\uffff'
+
+
+class SQLiteStorage:
+    """Everything in one embedded database file, for single-node installs and
+    CI without a MongoDB server. WAL mode lets readers run alongside the
+    writer across threads and worker processes; every statement is a constant
+    parameterized string, so sqlite3's statement cache reuses the prepared
+    statement on each call. Ids are ObjectId hex strings, which keep their
+    creation order and the URLs the MongoDB backend produces."""
+
+    CHUNK = 500
+
+    def __init__(self, path, idempotency_ttl_s=86400):
+        self.path = path
+        self.idempotency_ttl_s = idempotency_ttl_s
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        conn = self._connection()
+        # Databases created before scan archiving lack its columns.
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'scans'").fetchone():
+            existing = {row['name'] for row in conn.execute("PRAGMA table_info(scans)")}
+            for column in ('archived INTEGER', 'archived_at TEXT'):
+                if column.split()[0] not in existing:
+                    conn.execute(f"ALTER TABLE scans ADD COLUMN {column}")
+        conn.executescript(SCHEMA)
+
+    def _connection(self):
+        # sqlite3 connections must not cross threads or fork().
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None,
+                                   check_same_thread=False, cached_statements=256)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _write(self, sql, params=()):
+        return self._connection().execute(sql, params)
+
+    def _write_many(self, statements):
+        # One transaction for a batch of (sql, params) pairs.
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params in statements:
+                conn.execute(sql, params)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _one(self, sql, params=()):
+        row = self._connection().execute(sql, params).fetchone()
+        return _document(row) if row else None
+
+    def _all(self, sql, params=()):
+        return [_document(row) for row in self._connection().execute(sql, params)]
+
+    @staticmethod
+    def _assignments(fields):
+        # Column names come from the models, never from request input.
+        unknown = set(fields) - set(SCAN_COLUMNS) - {'id'}
+        if unknown:
+            raise ValueError(f"unknown scan columns: {', '.join(sorted(unknown))}")
+        columns = sorted(fields)
+        return (', '.join(f"{c} = ?" for c in columns),
+                [_column_value(c, fields[c]) for c in columns])
+
+    def metrics(self):
+        conn = self._connection()
+        return {
+            'backend': 'sqlite',
+            'path': self.path,
+            'pid': os.getpid(),
+            'journal_mode': conn.execute("PRAGMA journal_mode").fetchone()[0],
+            'size_bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        }
+
+    # users
+
+    def insert_user(self, doc):
+        user_id = str(ObjectId())
+        self._write(
+            "INSERT INTO users (id, email, name, password_hash, role, created_at, last_login) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (user_id, doc['email'], doc.get('name'), doc.get('password_hash'), doc.get('role'),
+             _column_value('created_at', doc.get('created_at')),
+             _column_value('last_login', doc.get('last_login')))
+        )
+        return user_id
+
+    def find_user_by_email(self, email):
+        return self._one("SELECT * FROM users WHERE email = ?", (email,))
+
+    def find_user_by_id(self, user_id):
+        return self._one("SELECT * FROM users WHERE id = ?", (str(user_id),))
+
+    def update_user(self, user_id, fields):
+        columns = sorted(c for c in fields if c in ('last_login', 'role'))
+        if columns:
+            self._write(f"UPDATE users SET {', '.join(f'{c} = ?' for c in columns)} WHERE id = ?",
+                        (*(_column_value(c, fields[c]) for c in columns), str(user_id)))
+
+    # api_tokens
+
+    def insert_api_token(self, doc):
+        self._write(
+            "INSERT INTO api_tokens (id, user_id, name, scopes, digest, created_at, expires_at, revoked_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (doc['_id'], doc['user_id'], doc.get('name'), dumps(doc.get('scopes', [])), doc['digest'],
+             *(_column_value(c, doc.get(c)) for c in ('created_at', 'expires_at', 'revoked_at')))
+        )
+
+    def find_api_token(self, token_id):
+        return self._one("SELECT * FROM api_tokens WHERE id = ?", (token_id,))
+
+    def list_api_tokens(self, user_id):
+        return self._all("SELECT id, user_id, name, scopes, created_at, expires_at, revoked_at "
+                         "FROM api_tokens WHERE user_id = ? ORDER BY created_at DESC", (user_id,))
+
+    def revoke_api_token(self, token_id, user_id, revoked_at):
+        cursor = self._write("UPDATE api_tokens SET revoked_at = ? "
+                             "WHERE id = ? AND user_id = ? AND revoked_at IS NULL",
+                             (revoked_at.isoformat(), token_id, user_id))
+        return cursor.rowcount > 0
+
+    # scans
+
+    @staticmethod
+    def _scan_filter(user_id, patient_prefix='', risk_label='', drug_prefix=''):
+        where = ["user_id = ?"]
+        params = [user_id]
+        if patient_prefix:
+            where.append("patient_id_lc >= ? AND patient_id_lc < ?")
+            params.extend(_prefix_range(patient_prefix))
+        if risk_label:
+            where.append("overall_risk_label = ?")
+            params.append(risk_label)
+        if drug_prefix:
+            where.append("EXISTS (SELECT 1 FROM json_each(scans.drugs_lc) WHERE value >= ? AND value < ?)")
+            params.extend(_prefix_range(drug_prefix))
+        return " AND ".join(where), params
+
+    @staticmethod
+    def _scan_row(doc):
+        return (str(ObjectId()), *(_column_value(c, doc.get(c)) for c in SCAN_COLUMNS))
+
+    def insert_scan(self, doc):
+        row = self._scan_row(doc)
+        self._write(INSERT_SCAN, row)
+        return row[0]
+
+    def insert_scans(self, docs):
+        rows = [self._scan_row(doc) for doc in docs]
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(INSERT_SCAN, rows)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return [row[0] for row in rows]
+
+    def find_scans(self, user_id, patient_prefix='', risk_label='', drug_prefix='', limit=None, skip=0):
+        where, params = self._scan_filter(user_id, patient_prefix, risk_label, drug_prefix)
+        sql = f"SELECT {SCAN_LIST_COLUMNS} FROM scans WHERE {where} ORDER BY created_at DESC"
+        if limit:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([limit, skip])
+        return self._all(sql, params)
+
+    def find_scan(self, scan_id, user_id):
+        return self._one("SELECT * FROM scans WHERE id = ? AND user_id = ?", (str(scan_id), user_id))
+
+    def count_scans(self, user_id):
+        return self._connection().execute("SELECT COUNT(*) FROM scans WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def suggest_patients(self, user_id, prefix, limit=10):
+        low, high = _prefix_range(prefix)
+        rows = self._connection().execute(
+            "SELECT patient_id_lc, MIN(patient_id) AS patient_id FROM scans "
+            "WHERE user_id = ? AND patient_id_lc >= ? AND patient_id_lc < ? "
+            "GROUP BY patient_id_lc ORDER BY patient_id_lc LIMIT ?",
+            (user_id, low, high, limit)
+        )
+        return [row['patient_id'] or row['patient_id_lc'] for row in rows]
+
+    def iter_export_scans(self, user_id, patient_prefix='', risk_label='', drug_prefix='',
+                          date_from=None, date_to=None, batch_size=500):
+        where, params = self._scan_filter(user_id, patient_prefix, risk_label, drug_prefix)
+        if date_from:
+            where += " AND created_at >= ?"
+            params.append(date_from.isoformat())
+        if date_to:
+            where += " AND created_at < ?"
+            params.append(date_to.isoformat())
+        # A dedicated connection: the export is consumed lazily while the
+        # request thread may run other queries on its own connection.
+        conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.execute(f"SELECT {SCAN_EXPORT_COLUMNS} FROM scans WHERE {where} "
+                                  f"ORDER BY created_at DESC", params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield _document(row)
+        finally:
+            conn.close()
+
+    def find_scans_missing_search_fields(self, limit):
+        # Every row is written with its search fields.
+        return []
+
+    def find_scans_with_inline_explanations(self, limit):
+        return self._all("SELECT id, result_json FROM scans WHERE NOT explanation_refs LIMIT ?", (limit,))
+
+    def update_scans(self, updates):
+        statements = []
+        for scan_id, fields in updates:
+            assignments, params = self._assignments(fields)
+            statements.append((f"UPDATE scans SET {assignments} WHERE id = ?", (*params, scan_id)))
+        if statements:
+            self._write_many(statements)
+
+    def find_outdated_scans(self, rules_version, after_id=None, limit=500):
+        return self._all(
+            f"SELECT id, result_json, gene_calls, archived FROM scans WHERE {OUTDATED} AND id > ? "
+            f"ORDER BY id LIMIT ?",
+            (rules_version, after_id or '', limit)
+        )
+
+    def count_outdated_scans(self, rules_version):
+        return self._connection().execute(f"SELECT COUNT(*) FROM scans WHERE {OUTDATED}",
+                                          (rules_version,)).fetchone()[0]
+
+    def update_outdated_scans(self, updates, rules_version):
+        statements = []
+        for scan_id, fields in updates:
+            assignments, params = self._assignments(fields)
+            statements.append((f"UPDATE scans SET {assignments} WHERE id = ? AND {OUTDATED}",
+                               (*params, scan_id, rules_version)))
+        if statements:
+            self._write_many(statements)
+
+    # scan_archive
+
+    def find_scans_to_archive(self, cutoff, limit):
+        return self._all("SELECT id, user_id, result_json, gene_calls, explanation_refs FROM scans "
+                         "WHERE created_at < ? AND NOT coalesce(archived, 0) LIMIT ?",
+                         (cutoff.isoformat(), limit))
+
+    def archive_scans(self, entries, archived_at):
+        # The body is stored before the hot row is stubbed, in one transaction.
+        # Entries without a body (data None) only stub the row.
+        when = archived_at.isoformat()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO scan_archive (id, user_id, data, archived_at) VALUES (?, ?, ?, ?)",
+                             [(scan_id, user_id, data, when) for scan_id, user_id, data in entries
+                              if data is not None])
+            conn.executemany("UPDATE scans SET result_json = NULL, gene_calls = NULL, archived = 1, archived_at = ? "
+                             "WHERE id = ?", [(when, scan_id) for scan_id, _, _ in entries])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def find_archived(self, scan_ids):
+        scan_ids = [str(scan_id) for scan_id in scan_ids]
+        conn = self._connection()
+        found = {}
+        for i in range(0, len(scan_ids), self.CHUNK):
+            chunk = scan_ids[i:i + self.CHUNK]
+            rows = conn.execute("SELECT id, data FROM scan_archive WHERE id IN (%s)" % ",".join("?" * len(chunk)),
+                                chunk)
+            found.update((row['id'], row['data']) for row in rows)
+        return found
+
+    # explanations
+
+    def insert_explanations(self, texts, created_at):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR IGNORE INTO explanations (ref, text, created_at) VALUES (?, ?, ?)",
+                             [(ref, text, created_at.isoformat()) for ref, text in texts.items()])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def find_explanations(self, refs):
+        refs = list(refs)
+        conn = self._connection()
+        found = {}
+        for i in range(0, len(refs), self.CHUNK):
+            chunk = refs[i:i + self.CHUNK]
+            rows = conn.execute("SELECT ref, text FROM explanations WHERE ref IN (%s)" % ",".join("?" * len(chunk)),
+                                chunk)
+            found.update((row['ref'], row['text']) for row in rows)
+        return found
+
+    # patient_profiles
+
+    _UPSERT_PROFILE = (
+        "INSERT INTO patient_profiles (user_id, patient_id, genes, rules_version, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (user_id, patient_id) DO UPDATE SET "
+        "genes = excluded.genes, rules_version = excluded.rules_version, updated_at = excluded.updated_at"
+    )
+
+    def save_profile(self, user_id, patient_id, genes, rules_version, now):
+        self._write(self._UPSERT_PROFILE,
+                    (user_id, patient_id, dumps(genes), rules_version, now.isoformat(), now.isoformat()))
+
+    def save_profiles(self, profiles, rules_version, now):
+        if not profiles:
+            return
+        self._write_many([
+            (self._UPSERT_PROFILE, (user_id, patient_id, dumps(genes), rules_version, now.isoformat(), now.isoformat()))
+            for user_id, patient_id, genes in profiles
+        ])
+
+    def find_profile(self, user_id, patient_id):
+        row = self._connection().execute(
+            "SELECT genes, rules_version FROM patient_profiles WHERE user_id = ? AND patient_id = ?",
+            (user_id, patient_id)
+        ).fetchone()
+        return _document(row) if row else None
+
+    # jobs
+
+    def find_job(self, job_id):
+        row = self._connection().execute("SELECT doc FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return loads(row['doc']) if row else None
+
+    def save_job(self, job):
+        self._write("INSERT OR REPLACE INTO jobs (id, doc) VALUES (?, ?)", (job['_id'], dumps(job)))
+
+    def update_job(self, job_id, fields, increments=None):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT doc FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+            job = loads(row['doc'])
+            job.update(fields)
+            for key, amount in (increments or {}).items():
+                job[key] = job.get(key, 0) + amount
+            conn.execute("UPDATE jobs SET doc = ? WHERE id = ?", (dumps(job), job_id))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return job
+
+    # idempotency
+
+    def _idempotency_cutoff(self):
+        return (datetime.utcnow() - timedelta(seconds=self.idempotency_ttl_s)).isoformat()
+
+    def insert_idempotency(self, doc):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # No TTL indexes here: expired keys are dropped as new ones arrive.
+            conn.execute("DELETE FROM idempotency WHERE created_at < ?", (self._idempotency_cutoff(),))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO idempotency (key, user_id, fingerprint, status, created_at, locked_until) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (doc['_id'], doc.get('user_id'), doc.get('fingerprint'), doc['status'],
+                 doc['created_at'].isoformat(), _column_value('locked_until', doc.get('locked_until')))
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount > 0
+
+    def find_idempotency(self, key):
+        row = self._connection().execute("SELECT * FROM idempotency WHERE key = ? AND created_at >= ?",
+                                         (key, self._idempotency_cutoff())).fetchone()
+        return _document(row, 'key') if row else None
+
+    def renew_idempotency_lease(self, key, locked_until, new_locked_until):
+        cursor = self._write("UPDATE idempotency SET locked_until = ? "
+                             "WHERE key = ? AND status = 'in_progress' AND locked_until = ?",
+                             (new_locked_until.isoformat(), key, locked_until.isoformat()))
+        return cursor.rowcount > 0
+
+    def complete_idempotency(self, key, response, completed_at):
+        self._write("UPDATE idempotency SET status = 'completed', response = ?, completed_at = ? WHERE key = ?",
+                    (dumps(response), completed_at.isoformat(), key))
+
+    def release_idempotency(self, key):
+        self._write("DELETE FROM idempotency WHERE key = ? AND status = 'in_progress'", (key,))
+
+    def ensure_indexes(self, idempotency_ttl_s=86400):
+        # The schema (indexes included) is created when the storage opens.
+        self.idempotency_ttl_s = idempotency_ttl_s
+        self._connection().execute("PRAGMA optimize")
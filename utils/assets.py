@@ -0,0 +1,68 @@
+import json
+import mimetypes
+import os
+
+from flask import current_app, request, send_from_directory, url_for
+
+
+DIST_DIR = "dist"
+MANIFEST_NAME = "manifest.json"
+# Long-lived caching is safe because every build gives changed content a new name.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Preferred order when the client accepts several encodings.
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_manifests = {}
+
+
+def load_manifest(static_folder):
+    path = os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    cached = _manifests.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    _manifests[path] = (mtime, manifest)
+    return manifest
+
+
+def asset_url(filename):
+    """URL of the fingerprinted build of a static file, or the plain static URL
+    when ``scripts/build_assets.py`` has not been run."""
+    hashed = load_manifest(current_app.static_folder).get(filename)
+    if hashed:
+        return url_for("serve_asset", filename=hashed)
+    return url_for("static", filename=filename)
+
+
+def accepted_encodings():
+    accepted = set()
+    for part in request.headers.get("Accept-Encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def send_asset(filename):
+    directory = os.path.join(current_app.static_folder, DIST_DIR)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    accepted = accepted_encodings()
+    encoding = None
+    for coding, suffix in ENCODINGS:
+        if coding in accepted and os.path.isfile(os.path.join(directory, filename + suffix)):
+            encoding = coding
+            filename += suffix
+            break
+
+    response = send_from_directory(directory, filename, mimetype=mimetype, conditional=True, max_age=None)
+    response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    response.vary.add("Accept-Encoding")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
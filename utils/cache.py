@@ -0,0 +1,418 @@
+"""Cache shared by the models and services.
+
+``get_cache(namespace)`` returns a namespaced view over one process-wide
+backend chosen with ``CACHE_BACKEND``:
+
+* ``memory`` - an LRU dict in this process (the default);
+* ``sqlite`` - a WAL-mode SQLite file shared by every worker on the host;
+* ``redis``  - any Redis-protocol server (Redis, Valkey, or the local
+  stand-in ``scripts/fake_kv.py``), shared across hosts.
+
+Values are stored as JSON on every backend, so a cached value reads back the
+same whichever backend is configured.
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+KEY_PREFIX = "pg:"
+
+
+def encode(value):
+    return json.dumps(value, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def decode(data):
+    return json.loads(data)
+
+
+def _expiry(ttl):
+    return time.time() + ttl if ttl else None
+
+
+class MemoryBackend:
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.time()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is None:
+                    continue
+                expires_at, data = entry
+                if expires_at is not None and expires_at <= now:
+                    del self._data[key]
+                    continue
+                self._data.move_to_end(key)
+                found[key] = data
+        return found
+
+    def set_many(self, items, ttl=None):
+        expires_at = _expiry(ttl)
+        with self._lock:
+            for key, data in items.items():
+                self._data[key] = (expires_at, data)
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """Shared by every process on the host through one WAL-mode database, so
+    readers never block the writer and N workers keep one warm cache."""
+
+    PURGE_EVERY = 1000
+    # SQLite's default limit on bound parameters is 999 on older builds.
+    CHUNK = 500
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS cache ("
+                         "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL) WITHOUT ROWID")
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)")
+
+    def _connection(self):
+        # sqlite3 connections must not cross threads or fork().
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=2.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get_many(self, keys):
+        keys = list(keys)
+        conn = self._connection()
+        now = time.time()
+        found = {}
+        for i in range(0, len(keys), self.CHUNK):
+            chunk = keys[i:i + self.CHUNK]
+            rows = conn.execute(
+                "SELECT key, value FROM cache WHERE key IN (%s) AND (expires_at IS NULL OR expires_at > ?)"
+                % ",".join("?" * len(chunk)),
+                (*chunk, now)
+            )
+            found.update(rows)
+        return found
+
+    def set_many(self, items, ttl=None):
+        expires_at = _expiry(ttl)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                             [(key, data, expires_at) for key, data in items.items()])
+            self._writes += len(items)
+            if self._writes >= self.PURGE_EVERY:
+                self._writes = 0
+                conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, keys):
+        self._connection().executemany("DELETE FROM cache WHERE key = ?", [(k,) for k in keys])
+
+    def delete_prefix(self, prefix):
+        # A key range rather than LIKE so the primary key index is used.
+        self._connection().execute("DELETE FROM cache WHERE key >= ? AND key < ?",
+                                   (prefix, prefix + "\uffff"))
+
+
+class RespClient:
+    """Minimal Redis protocol (RESP2) client: one connection per thread and
+    process, commands pipelined in a single round trip."""
+
+    def __init__(self, host="127.0.0.1", port=6379, db=0, password=None, timeout=1.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock = sock
+        self._local.reader = sock.makefile("rb")
+        self._local.pid = os.getpid()
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            self._roundtrip(setup)
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self._local.sock = None
+
+    @staticmethod
+    def _pack(args):
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(out)
+
+    def _read_reply(self):
+        line = self._local.reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by cache server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RuntimeError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._local.reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise RuntimeError(f"Unexpected cache server reply: {line!r}")
+
+    def _roundtrip(self, commands):
+        self._local.sock.sendall(b"".join(self._pack(c) for c in commands))
+        # Read every reply before raising so the connection stays in step.
+        replies = []
+        error = None
+        for _ in commands:
+            try:
+                replies.append(self._read_reply())
+            except RuntimeError as e:
+                error = error or e
+                replies.append(None)
+        if error:
+            raise error
+        return replies
+
+    def pipeline(self, commands):
+        if getattr(self._local, "sock", None) is None or self._local.pid != os.getpid():
+            self._connect()
+        try:
+            return self._roundtrip(commands)
+        except (OSError, ConnectionError):
+            # One retry on a fresh connection: the server may have dropped an
+            # idle one.
+            self._close()
+            self._connect()
+            return self._roundtrip(commands)
+
+    def execute(self, *args):
+        return self.pipeline([args])[0]
+
+
+class RedisBackend:
+    SCAN_COUNT = 1000
+
+    def __init__(self, url, timeout=1.0):
+        parsed = urlparse(url)
+        db = parsed.path.lstrip("/")
+        self.client = RespClient(parsed.hostname or "127.0.0.1", parsed.port or 6379,
+                                 int(db) if db else 0, parsed.password, timeout)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self.client.execute("MGET", *keys)
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, items, ttl=None):
+        commands = []
+        for key, data in items.items():
+            if ttl:
+                commands.append(("SET", key, data, "PX", int(ttl * 1000)))
+            else:
+                commands.append(("SET", key, data))
+        if commands:
+            self.client.pipeline(commands)
+
+    def delete(self, keys):
+        keys = list(keys)
+        if keys:
+            self.client.execute("DEL", *keys)
+
+    def delete_prefix(self, prefix):
+        pattern = "".join("\\" + c if c in "*?[]\\" else c for c in prefix) + "*"
+        cursor = b"0"
+        while True:
+            cursor, keys = self.client.execute("SCAN", cursor, "MATCH", pattern, "COUNT", self.SCAN_COUNT)
+            if keys:
+                self.client.execute("DEL", *keys)
+            if cursor in (b"0", "0", 0):
+                return
+
+
+class Cache:
+    """A namespace within the shared backend. Backend errors are counted and
+    treated as misses so a cache outage never fails a request."""
+
+    def __init__(self, namespace, ttl=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.prefix = f"{KEY_PREFIX}{namespace}:"
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.errors = 0
+
+    def _key(self, key):
+        return self.prefix + str(key)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        full_keys = {self._key(k): k for k in keys}
+        try:
+            found = get_backend().get_many(list(full_keys))
+        except Exception as e:
+            self.errors += 1
+            self.misses += len(keys)
+            print(f"Cache read failed ({self.namespace}): {e}")
+            return {}
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return {full_keys[k]: decode(data) for k, data in found.items()}
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def set_many(self, mapping, ttl=None):
+        if not mapping:
+            return
+        try:
+            get_backend().set_many({self._key(k): encode(v) for k, v in mapping.items()},
+                                   ttl if ttl is not None else self.ttl)
+            self.sets += len(mapping)
+        except Exception as e:
+            self.errors += 1
+            print(f"Cache write failed ({self.namespace}): {e}")
+
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl)
+
+    def delete(self, *keys):
+        try:
+            get_backend().delete([self._key(k) for k in keys])
+        except Exception as e:
+            self.errors += 1
+            print(f"Cache delete failed ({self.namespace}): {e}")
+
+    def clear(self):
+        """Invalidate every key in this namespace, in all processes sharing the backend."""
+        try:
+            get_backend().delete_prefix(self.prefix)
+        except Exception as e:
+            self.errors += 1
+            print(f"Cache clear failed ({self.namespace}): {e}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "sets": self.sets,
+            "errors": self.errors,
+            "ttl": self.ttl
+        }
+
+
+_backend = None
+_backend_name = "memory"
+_caches = {}
+_lock = threading.Lock()
+
+
+def create_backend(name, max_entries=4096, path=None, url=None):
+    if name == "memory":
+        return MemoryBackend(max_entries)
+    if name == "sqlite":
+        return SQLiteBackend(path or "data/cache.sqlite3")
+    if name == "redis":
+        return RedisBackend(url or "redis://127.0.0.1:6379/0")
+    raise ValueError(f"Unknown cache backend: {name}")
+
+
+def configure_cache(config):
+    global _backend, _backend_name
+    name = config.get("CACHE_BACKEND") or "memory"
+    backend = create_backend(name, config.get("CACHE_MAX_ENTRIES") or 4096,
+                             config.get("CACHE_PATH"), config.get("CACHE_URL"))
+    with _lock:
+        _backend, _backend_name = backend, name
+    return backend
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                _backend = MemoryBackend()
+    return _backend
+
+
+def get_cache(namespace, ttl=None):
+    with _lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            cache = _caches[namespace] = Cache(namespace, ttl)
+        elif ttl is not None:
+            cache.ttl = ttl
+        return cache
+
+
+def get_cache_metrics():
+    metrics = {"backend": _backend_name, "pid": os.getpid()}
+    metrics["namespaces"] = {name: cache.stats() for name, cache in _caches.items()}
+    return metrics
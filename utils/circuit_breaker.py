@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import deque
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Rolling-window breaker: opens when too many of the last ``window`` calls
+    failed or exceeded ``latency_budget_ms``; after ``cooldown_s`` a single
+    probe call is let through to decide whether to close again.
+
+    ``allow()`` returns a ticket (falsy when the call is rejected) that the
+    caller hands back to ``record()``. Tickets are tied to the breaker's state
+    at the time of the call, so a slow call that started before the breaker
+    opened or half-opened is ignored instead of deciding for the probe."""
+
+    def __init__(self, window=20, min_calls=5, failure_ratio=0.5,
+                 latency_budget_ms=4000, slow_ratio=0.5, cooldown_s=30.0):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.latency_budget_ms = latency_budget_ms
+        self.slow_ratio = slow_ratio
+        self.cooldown_s = cooldown_s
+        self._lock = threading.Lock()
+        self._calls = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        # Bumped on every state change; tickets from an older generation are
+        # stale.
+        self._generation = 0
+        self.times_opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown_s:
+            self._state = HALF_OPEN
+            self._generation += 1
+            self._probe_in_flight = False
+        return self._state
+
+    def allow(self):
+        """A ticket for ``record()``, or None when the call must not be made."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return (self._generation, False)
+            if state == HALF_OPEN and self._probe_in_flight \
+                    and time.monotonic() - self._probe_started >= self.cooldown_s:
+                # The probe never reported back; its ticket is void.
+                self._generation += 1
+                self._probe_in_flight = False
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self._probe_started = time.monotonic()
+                return (self._generation, True)
+            return None
+
+    def record(self, ticket, success, latency_ms):
+        healthy = success and latency_ms <= self.latency_budget_ms
+        with self._lock:
+            self._current_state()
+            generation, probe = ticket
+            if generation != self._generation:
+                return
+            if self._state == HALF_OPEN:
+                if probe:
+                    self._probe_in_flight = False
+                    if healthy:
+                        self._state = CLOSED
+                        self._generation += 1
+                        self._calls.clear()
+                    else:
+                        self._open()
+                return
+
+            self._calls.append((success, latency_ms))
+            if self._state == CLOSED and len(self._calls) >= self.min_calls:
+                failures = sum(1 for ok, _ in self._calls if not ok)
+                slow = sum(1 for ok, ms in self._calls if ok and ms > self.latency_budget_ms)
+                total = len(self._calls)
+                if failures / total >= self.failure_ratio or slow / total >= self.slow_ratio:
+                    self._open()
+
+    def _open(self):
+        self._state = OPEN
+        self._generation += 1
+        self._opened_at = time.monotonic()
+        self.times_opened += 1
+
+    def snapshot(self):
+        with self._lock:
+            state = self._current_state()
+            latencies = sorted(ms for _, ms in self._calls)
+            failures = sum(1 for ok, _ in self._calls if not ok)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+        return {
+            "state": state,
+            "times_opened": self.times_opened,
+            "window_calls": len(latencies),
+            "window_failures": failures,
+            "window_p95_ms": round(p95, 1),
+            "latency_budget_ms": self.latency_budget_ms
+        }
@@ -0,0 +1,89 @@
+import threading
+import time
+from pymongo import monitoring
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Counts connection checkouts and the time spent waiting for one, so the
+    pool can be sized against the number of workers and threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.wait_time_total_ms = 0.0
+            self.wait_time_max_ms = 0.0
+            self.in_use = 0
+            self.open_connections = 0
+            self.pool_clears = 0
+
+    def _record_wait(self, event):
+        duration = getattr(event, "duration", None)
+        if duration is None:
+            started = getattr(self._local, "started", None)
+            duration = time.perf_counter() - started if started else 0.0
+        return duration * 1000.0
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait_ms = self._record_wait(event)
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.wait_time_total_ms += wait_ms
+            self.wait_time_max_ms = max(self.wait_time_max_ms, wait_ms)
+
+    def connection_check_out_failed(self, event):
+        wait_ms = self._record_wait(event)
+        with self._lock:
+            self.checkout_failures += 1
+            self.wait_time_total_ms += wait_ms
+            self.wait_time_max_ms = max(self.wait_time_max_ms, wait_ms)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections = max(0, self.open_connections - 1)
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def snapshot(self):
+        with self._lock:
+            attempts = self.checkouts + self.checkout_failures
+            return {
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "in_use": self.in_use,
+                "open_connections": self.open_connections,
+                "pool_clears": self.pool_clears,
+                "wait_time_avg_ms": round(self.wait_time_total_ms / attempts, 3) if attempts else 0.0,
+                "wait_time_max_ms": round(self.wait_time_max_ms, 3)
+            }
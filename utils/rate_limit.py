@@ -0,0 +1,116 @@
+import math
+import threading
+import time
+
+
+class InProcessBucketBackend:
+    """Token-bucket state held in this process. Other backends only need to
+    provide ``take(key, rate, burst, cost)`` with the same return value and
+    ``refund(key, rate, burst, cost)``."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1):
+        # Returns (allowed, retry_after_seconds).
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                allowed, retry_after = True, 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                allowed, retry_after = False, (cost - tokens) / rate
+            if len(self._buckets) > self.max_keys:
+                self._prune(now, rate, burst)
+        return allowed, retry_after
+
+    def refund(self, key, rate, burst, cost=1):
+        # Give back tokens taken by a request that was rejected by another bucket.
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            self._buckets[key] = (min(burst, tokens + (now - updated) * rate + cost), now)
+
+    def _prune(self, now, rate, burst):
+        # Buckets that have refilled completely carry no state worth keeping.
+        full_after = burst / rate if rate else 0
+        for key, (_, updated) in list(self._buckets.items()):
+            if now - updated >= full_after:
+                del self._buckets[key]
+
+
+RATE_LIMIT_BACKENDS = {
+    "memory": InProcessBucketBackend,
+}
+
+
+def get_rate_limit_backend(name):
+    try:
+        return RATE_LIMIT_BACKENDS[name or "memory"]()
+    except KeyError:
+        raise ValueError(f"Unknown rate limit backend: {name}")
+
+
+class RateLimiter:
+    def __init__(self, per_minute, burst, backend=None):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.backend = backend or InProcessBucketBackend()
+
+    def hit(self, *keys):
+        """Take one token from every key's bucket, or from none of them;
+        returns (allowed, retry_after) where retry_after is whole seconds,
+        suitable for a Retry-After header."""
+        taken = []
+        for key in keys:
+            allowed, retry_after = self.backend.take(key, self.rate, self.burst)
+            if not allowed:
+                for earlier in taken:
+                    self.backend.refund(earlier, self.rate, self.burst)
+                return False, max(1, math.ceil(retry_after))
+            taken.append(key)
+        return True, 0
+
+
+class AdmissionController:
+    """Global cap on concurrent analyses. Interactive requests may use every
+    slot and wait briefly for one; bulk requests are limited to the slots not
+    reserved for interactive traffic and are rejected at once when full."""
+
+    def __init__(self, max_in_flight, interactive_reserved=0, queue_timeout_s=0.0):
+        self.max_in_flight = max_in_flight
+        self.bulk_limit = max(1, max_in_flight - interactive_reserved)
+        self.queue_timeout_s = queue_timeout_s
+        self.in_flight = 0
+        self.rejected = {"interactive": 0, "bulk": 0}
+        self._cond = threading.Condition()
+
+    def acquire(self, interactive=False):
+        limit = self.max_in_flight if interactive else self.bulk_limit
+        with self._cond:
+            if interactive and self.in_flight >= limit and self.queue_timeout_s > 0:
+                self._cond.wait_for(lambda: self.in_flight < limit, timeout=self.queue_timeout_s)
+            if self.in_flight >= limit:
+                self.rejected["interactive" if interactive else "bulk"] += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "bulk_limit": self.bulk_limit,
+                "rejected": dict(self.rejected)
+            }